@@ -4,14 +4,16 @@
 {
     "name": "Dynamic Financial Reports",
     "summary": "This module creates dynamic Balance Sheet, Proft and Loss",
-    "version": "14.0.1.0.0",
+    "version": "14.0.2.0.0",
     "category": "Accounting",
     "license": "AGPL-3",
     "author": "Cybrosys Techno Solutions, Ecosoft",
     "depends": ["account", "account_operating_unit"],
     "data": [
         "security/ir.model.access.csv",
+        "security/report_job_security.xml",
         "data/account_financial_report_data.xml",
+        "data/ir_cron_data.xml",
         "report/financial_report_template.xml",
         "views/account_financial_report_views.xml",
         "views/templates.xml",
@@ -0,0 +1,5 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from . import daily_balance
+from . import report_benchmark
+from . import report_index
@@ -0,0 +1,49 @@
+# Copyright 2021 Ecosoft Co., Ltd. (http://ecosoft.co.th)
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+import argparse
+import os
+import sys
+
+import odoo
+from odoo.cli import Command
+
+
+class DailyBalance(Command):
+    """Rebuild or check the daily balances of the dynamic financial reports"""
+
+    def run(self, cmdargs):
+        parser = argparse.ArgumentParser(
+            prog="%s dailybalance" % sys.argv[0].split(os.path.sep)[-1],
+            description=self.__doc__,
+        )
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="recompute all the daily balances from the journal items",
+        )
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="list the days whose daily balances differ from the journal items",
+        )
+        args, odoo_args = parser.parse_known_args(cmdargs)
+        odoo.tools.config.parse_config(odoo_args)
+        dbname = odoo.tools.config["db_name"]
+        if not dbname or not (args.rebuild or args.check):
+            parser.print_help()
+            sys.exit(1)
+
+        registry = odoo.registry(dbname)
+        with odoo.api.Environment.manage(), registry.cursor() as cr:
+            env = odoo.api.Environment(cr, odoo.SUPERUSER_ID, {})
+            DailyBalance = env["dynamic.report.daily.balance"]
+            if args.rebuild:
+                DailyBalance.rebuild()
+            if args.check:
+                mismatches = DailyBalance.check_consistency()
+                for account_id, date in mismatches:
+                    print("account %s on %s" % (account_id, date))
+                if mismatches:
+                    sys.exit(2)
+                print("Daily balances are consistent with the journal items")
@@ -0,0 +1,100 @@
+# Copyright 2021 Ecosoft Co., Ltd. (http://ecosoft.co.th)
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+import argparse
+import json
+import os
+import sys
+
+import odoo
+from odoo.cli import Command
+
+from ..models.report_benchmark import SCENARIOS
+
+
+class ReportBenchmark(Command):
+    """Time the dynamic financial reports on generated data, at one or more
+    numbers of journal items. Only run it on a throwaway database."""
+
+    def run(self, cmdargs):
+        parser = argparse.ArgumentParser(
+            prog="%s reportbenchmark" % sys.argv[0].split(os.path.sep)[-1],
+            description=self.__doc__,
+        )
+        parser.add_argument(
+            "--scales",
+            default="100000",
+            help="comma separated numbers of journal items to time the reports "
+            "at, the data is generated up to each in turn (default: 100000)",
+        )
+        parser.add_argument(
+            "--scenarios",
+            default=",".join(SCENARIOS),
+            help="comma separated scenarios to time (default: %s)"
+            % ",".join(SCENARIOS),
+        )
+        parser.add_argument("--repeat", type=int, default=3)
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--accounts", type=int, default=200)
+        parser.add_argument("--journals", type=int, default=4)
+        parser.add_argument("--operating-units", type=int, default=4)
+        parser.add_argument("--analytics", type=int, default=50)
+        parser.add_argument("--analytic-tags", type=int, default=20)
+        parser.add_argument("--account-tags", type=int, default=10)
+        parser.add_argument("--report-depth", type=int, default=5)
+        parser.add_argument("--report-branching", type=int, default=3)
+        parser.add_argument(
+            "--check-queries",
+            action="store_true",
+            help="fail when a scenario issues more queries at a larger scale, "
+            "i.e. runs queries per account, report node or journal item",
+        )
+        parser.add_argument(
+            "--output",
+            help="file the results are written to as JSON (default: stdout)",
+        )
+        args, odoo_args = parser.parse_known_args(cmdargs)
+        odoo.tools.config.parse_config(odoo_args)
+        dbname = odoo.tools.config["db_name"]
+        scenarios = args.scenarios.split(",")
+        if not dbname or set(scenarios) - set(SCENARIOS):
+            parser.print_help()
+            sys.exit(1)
+        sizes = {
+            "accounts": args.accounts,
+            "journals": args.journals,
+            "operating_units": args.operating_units,
+            "analytics": args.analytics,
+            "analytic_tags": args.analytic_tags,
+            "account_tags": args.account_tags,
+            "report_depth": args.report_depth,
+            "report_branching": args.report_branching,
+        }
+
+        registry = odoo.registry(dbname)
+        with odoo.api.Environment.manage(), registry.cursor() as cr:
+            env = odoo.api.Environment(cr, odoo.SUPERUSER_ID, {})
+            Benchmark = env["dynamic.report.benchmark"]
+            output = {
+                "environment": Benchmark.get_environment(),
+                "options": dict(sizes, seed=args.seed, repeat=args.repeat),
+                "results": [],
+            }
+            for scale in sorted(int(scale) for scale in args.scales.split(",")):
+                Benchmark.generate(scale, seed=args.seed, **sizes)
+                for res in Benchmark.run(scenarios, repeat=args.repeat):
+                    output["results"].append(dict(res, scale=scale))
+            violations = Benchmark.check_query_counts(output["results"])
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(output, f, indent=2)
+        else:
+            json.dump(output, sys.stdout, indent=2)
+        if args.check_queries:
+            for res in violations:
+                sys.stderr.write(
+                    "%s issues %s queries at %s journal items\n"
+                    % (res["scenario"], res["queries"], res["scale"])
+                )
+            if violations:
+                sys.exit(2)
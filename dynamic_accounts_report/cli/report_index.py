@@ -0,0 +1,61 @@
+# Copyright 2021 Ecosoft Co., Ltd. (http://ecosoft.co.th)
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+import argparse
+import os
+import sys
+
+import odoo
+from odoo.cli import Command
+
+
+class ReportIndex(Command):
+    """Create the journal item indexes of the dynamic financial reports or
+    show how much they are used"""
+
+    def run(self, cmdargs):
+        parser = argparse.ArgumentParser(
+            prog="%s reportindex" % sys.argv[0].split(os.path.sep)[-1],
+            description=self.__doc__,
+        )
+        parser.add_argument(
+            "--create",
+            action="store_true",
+            help="create the missing indexes concurrently, rebuilding the invalid ones",
+        )
+        parser.add_argument(
+            "--usage",
+            action="store_true",
+            help="list the scans of the journal item indexes, the report ones "
+            "marked with a star",
+        )
+        args, odoo_args = parser.parse_known_args(cmdargs)
+        odoo.tools.config.parse_config(odoo_args)
+        dbname = odoo.tools.config["db_name"]
+        if not dbname or not (args.create or args.usage):
+            parser.print_help()
+            sys.exit(1)
+
+        registry = odoo.registry(dbname)
+        with odoo.api.Environment.manage(), registry.cursor() as cr:
+            env = odoo.api.Environment(cr, odoo.SUPERUSER_ID, {})
+            ReportIndex = env["dynamic.report.index"]
+            if args.create:
+                for name in ReportIndex.create_indexes():
+                    print("created %s" % name)
+            if args.usage:
+                print(
+                    "%-52s %12s %14s %14s %10s"
+                    % ("index", "scans", "tuples read", "tuples fetched", "size")
+                )
+                for row in ReportIndex.get_index_usage():
+                    print(
+                        "%-52s %12s %14s %14s %10s"
+                        % (
+                            ("* " if row["report"] else "  ") + row["name"],
+                            row["scans"],
+                            row["tuples_read"],
+                            row["tuples_fetched"],
+                            row["size"],
+                        )
+                    )
@@ -44,6 +44,20 @@ class TBXLSXReportController(http.Controller):
                 report_obj.get_dynamic_xlsx_report(
                     options, response, report_data, dfr_data
                 )
+            elif output_format == "csv":
+                response = request.make_response(
+                    None,
+                    headers=[
+                        ("Content-Type", "text/csv; charset=utf-8"),
+                        (
+                            "Content-Disposition",
+                            content_disposition(report_name + ".csv"),
+                        ),
+                    ],
+                )
+                report_obj.get_dynamic_csv_report(
+                    options, response, report_data, dfr_data
+                )
             response.set_cookie("fileToken", token)
             return response
         except Exception as e:
@@ -1,3 +1,15 @@
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
+from . import account_account
 from . import account_financial_report
+from . import account_move
+from . import checkpoint
+from . import daily_balance
+from . import report_benchmark
+from . import report_cache
+from . import report_filter
+from . import report_index
+from . import report_job
+from . import report_query
+from . import report_xlsx
+from . import res_company
@@ -0,0 +1,30 @@
+# Copyright 2021 Ecosoft Co., Ltd. (http://ecosoft.co.th)
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo import api, models
+
+# Fields of the accounts the compiled financial report plans depend on
+ACCOUNT_PLAN_FIELDS = {"user_type_id", "company_id"}
+
+
+class AccountAccount(models.Model):
+    _inherit = "account.account"
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        accounts = super().create(vals_list)
+        self.env["dynamic.report.cache"]._invalidate(accounts.company_id)
+        self.env["account.financial.report"]._invalidate_report_plans()
+        return accounts
+
+    def write(self, vals):
+        self.env["dynamic.report.cache"]._invalidate(self.company_id)
+        res = super().write(vals)
+        if ACCOUNT_PLAN_FIELDS & set(vals):
+            self.env["account.financial.report"]._invalidate_report_plans()
+        return res
+
+    def unlink(self):
+        self.env["dynamic.report.cache"]._invalidate(self.company_id)
+        self.env["account.financial.report"]._invalidate_report_plans()
+        return super().unlink()
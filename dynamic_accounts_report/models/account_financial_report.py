@@ -1,7 +1,45 @@
 # Copyright 2021 Ecosoft Co., Ltd. (http://ecosoft.co.th)
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
-from odoo import api, fields, models
+from collections import namedtuple
+
+from odoo import api, fields, models, tools
+
+# A node of a compiled report plan, see _get_report_plan()
+ReportNode = namedtuple(
+    "ReportNode",
+    [
+        "id",
+        "parent_id",
+        "type",
+        "sign",
+        "level",
+        "display_detail",
+        "account_report_id",
+        "children_ids",
+        "account_ids",
+    ],
+)
+# ``order`` holds the ids of the nodes to print, ``nodes`` every node their
+# amounts depend on
+ReportPlan = namedtuple("ReportPlan", ["order", "nodes"])
+
+# Fields of the reports their compiled plans depend on
+REPORT_PLAN_FIELDS = {
+    "parent_id",
+    "children_ids",
+    "sequence",
+    "level",
+    "type",
+    "account_ids",
+    "account_report_id",
+    "account_type_ids",
+    "sign",
+    "display_detail",
+    "style_overwrite",
+}
+# Version of the compiled report plans, raised by _invalidate_report_plans()
+REPORT_PLAN_VERSION_PARAM = "dynamic_accounts_report.report_plan_version"
 
 
 class AccountFinancialReport(models.Model):
@@ -119,10 +157,121 @@ class AccountFinancialReport(models.Model):
 
     def _get_children_by_order(self):
         """returns a recordset of all the children computed recursively,
-        and sorted by sequence. Ready for the printing"""
-        res = self
-        children = self.search([("parent_id", "in", self.ids)], order="sequence ASC")
-        if children:
-            for child in children:
-                res += child._get_children_by_order()
+        and sorted by sequence. Ready for the printing. The children are
+        searched once per level of the tree, not once per report."""
+        children = {}
+        level = self.search([("parent_id", "in", self.ids)], order="sequence ASC")
+        top_ids = level.ids
+        while level:
+            for child in level:
+                children.setdefault(child.parent_id.id, []).append(child.id)
+            level = self.search([("parent_id", "in", level.ids)], order="sequence ASC")
+        ids = list(self.ids)
+        todo = top_ids[::-1]
+        while todo:
+            report_id = todo.pop()
+            ids.append(report_id)
+            todo += children.get(report_id, [])[::-1]
+        return self.browse(ids)
+
+    def _get_report_plan(self):
+        """returns the compiled plan of this report for the current
+        companies, see _compile_report_plan()"""
+        self.ensure_one()
+        company_ids = tuple(sorted(self.env.companies.ids))
+        version = (
+            self.env["ir.config_parameter"]
+            .sudo()
+            .get_param(REPORT_PLAN_VERSION_PARAM, "0")
+        )
+        return self._compile_report_plan(self.id, company_ids, version)
+
+    @api.model
+    @tools.ormcache("report_id", "company_ids", "version")
+    def _compile_report_plan(self, report_id, company_ids, version):
+        """returns the report ``report_id`` as a ReportPlan: its nodes in
+        printing order, and every node its amounts depend on with its
+        children and the ids of the accounts of ``company_ids`` making up its
+        balance. The plan is cached until its ``version`` is raised, see
+        _invalidate_report_plans()."""
+        Account = self.env["account.account"].sudo()
+        company_domain = [("company_id", "in", list(company_ids))]
+        report = self.sudo().browse(report_id)
+        ordered = report._get_children_by_order()
+        report_ids = []
+        todo = list(ordered)
+        while todo:
+            node = todo.pop()
+            if node.id in report_ids:
+                continue
+            report_ids.append(node.id)
+            if node.type == "account_report" and node.account_report_id:
+                todo.append(node.account_report_id)
+            elif node.type == "sum":
+                todo += list(node.children_ids)
+        reports = report.browse(report_ids)
+        # the accounts of all the nodes are searched at once, in the order
+        # of account.account
+        accounts = Account.search(
+            company_domain
+            + [
+                "|",
+                ("id", "in", reports.mapped("account_ids").ids),
+                ("user_type_id", "in", reports.mapped("account_type_ids").ids),
+            ]
+        )
+        account_types = [(a.id, a.user_type_id.id) for a in accounts]
+        nodes = {}
+        for node in reports:
+            if node.type == "accounts":
+                node_account_ids = set(node.account_ids.ids)
+                account_ids = [a for a, _t in account_types if a in node_account_ids]
+            elif node.type == "account_type":
+                type_ids = set(node.account_type_ids.ids)
+                account_ids = [a for a, t in account_types if t in type_ids]
+            else:
+                account_ids = []
+            nodes[node.id] = ReportNode(
+                id=node.id,
+                parent_id=node.parent_id.id,
+                type=node.type,
+                sign=int(node.sign),
+                level=bool(node.style_overwrite)
+                and node.style_overwrite
+                or node.level,
+                display_detail=node.display_detail,
+                account_report_id=node.account_report_id.id,
+                children_ids=tuple(node.children_ids.ids),
+                account_ids=tuple(account_ids),
+            )
+        return ReportPlan(order=tuple(ordered.ids), nodes=nodes)
+
+    @api.model
+    def _invalidate_report_plans(self):
+        """Renew the compiled plans of the reports in every worker, by
+        raising the version they are cached with. Setting the parameter
+        clears the caches of the registry, and signals it to the other
+        workers once committed."""
+        Param = self.env["ir.config_parameter"].sudo()
+        version = int(Param.get_param(REPORT_PLAN_VERSION_PARAM, "0"))
+        Param.set_param(REPORT_PLAN_VERSION_PARAM, str(version + 1))
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        self.env["dynamic.report.cache"]._invalidate()
+        reports = super().create(vals_list)
+        self._invalidate_report_plans()
+        return reports
+
+    def write(self, vals):
+        self.env["dynamic.report.cache"]._invalidate()
+        res = super().write(vals)
+        if REPORT_PLAN_FIELDS & set(vals):
+            self._invalidate_report_plans()
+        return res
+
+    def unlink(self):
+        self.env["dynamic.report.cache"]._invalidate()
+        res = super().unlink()
+        self._invalidate_report_plans()
         return res
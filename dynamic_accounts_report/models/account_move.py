@@ -0,0 +1,100 @@
+# Copyright 2021 Ecosoft Co., Ltd. (http://ecosoft.co.th)
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo import api, models
+
+# Columns of the journal items summed into, or keying, the daily balances.
+# Most of them are related or computed stored fields, NULL when the items
+# are inserted and only written by _write() at flush, so the daily balances
+# are updated from there. An item counts once all its keys are set, see
+# dynamic.report.daily.balance _aggregate_query().
+LINE_DAILY_BALANCE_FIELDS = {
+    "account_id",
+    "date",
+    "journal_id",
+    "operating_unit_id",
+    "analytic_account_id",
+    "company_id",
+    "parent_state",
+    "debit",
+    "credit",
+    "balance",
+}
+# Fields shown by the reports, whose change invalidates their cached results
+MOVE_REPORT_FIELDS = {
+    "state",
+    "date",
+    "journal_id",
+    "company_id",
+    "line_ids",
+    "invoice_line_ids",
+    "name",
+    "ref",
+    "partner_id",
+}
+LINE_REPORT_FIELDS = LINE_DAILY_BALANCE_FIELDS | {
+    "move_id",
+    "name",
+    "ref",
+    "partner_id",
+    "analytic_tag_ids",
+}
+
+
+def _invalidate_report_cache(records, vals=None):
+    companies = records.company_id
+    if vals and vals.get("company_id"):
+        companies |= companies.browse(vals["company_id"])
+    records.env["dynamic.report.cache"]._invalidate(companies)
+
+
+class AccountMove(models.Model):
+    _inherit = "account.move"
+
+    def write(self, vals):
+        if MOVE_REPORT_FIELDS & set(vals):
+            _invalidate_report_cache(self, vals)
+        return super().write(vals)
+
+
+class AccountMoveLine(models.Model):
+    _inherit = "account.move.line"
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        lines = super().create(vals_list)
+        _invalidate_report_cache(lines)
+        return lines
+
+    @api.model
+    def _create(self, data_list):
+        lines = super()._create(data_list)
+        DailyBalance = self.env["dynamic.report.daily.balance"]
+        if DailyBalance._is_enabled():
+            # only the items inserted with all their keys, which no later
+            # _write() may count
+            DailyBalance._apply_move_lines(lines)
+        return lines
+
+    def write(self, vals):
+        if LINE_REPORT_FIELDS & set(vals):
+            _invalidate_report_cache(self, vals)
+        return super().write(vals)
+
+    def _write(self, vals):
+        DailyBalance = self.env["dynamic.report.daily.balance"]
+        if LINE_DAILY_BALANCE_FIELDS.isdisjoint(vals) or not DailyBalance._is_enabled():
+            return super()._write(vals)
+        DailyBalance._apply_move_lines(self, -1)
+        res = super()._write(vals)
+        DailyBalance._apply_move_lines(self)
+        return res
+
+    def unlink(self):
+        _invalidate_report_cache(self)
+        DailyBalance = self.env["dynamic.report.daily.balance"]
+        if DailyBalance._is_enabled():
+            # the pending updates of the lines reach the daily balances first
+            self.flush()
+            DailyBalance._apply_move_lines(self, -1)
+        return super().unlink()
@@ -0,0 +1,204 @@
+# Copyright 2021 Ecosoft Co., Ltd. (http://ecosoft.co.th)
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+import hashlib
+import logging
+
+from dateutil.relativedelta import relativedelta
+from psycopg2 import IntegrityError
+
+from odoo import api, fields, models
+
+_logger = logging.getLogger(__name__)
+
+
+class DynamicReportCheckpoint(models.Model):
+    """Balances of the posted journal items of a company before a locked
+    date, the initial balances of the General Ledger start from.
+
+    The balances only sum the journal items the record rules of the user
+    computing them allow, so a checkpoint is shared by the users the same
+    rules apply to, see _get_rule_filter()."""
+
+    _name = "dynamic.report.checkpoint"
+    _description = "Opening Balance Checkpoint"
+    _order = "company_id, date desc"
+
+    company_id = fields.Many2one(
+        comodel_name="res.company",
+        required=True,
+        readonly=True,
+        ondelete="cascade",
+    )
+    date = fields.Date(
+        required=True,
+        readonly=True,
+        help="The checkpoint holds the balances of the posted journal items "
+        "dated before this date.",
+    )
+    rule_key = fields.Char(
+        required=True,
+        readonly=True,
+        default="",
+        help="Digest of the record rules the journal items were filtered with.",
+    )
+    line_ids = fields.One2many(
+        comodel_name="dynamic.report.checkpoint.line",
+        inverse_name="checkpoint_id",
+        string="Balances",
+        readonly=True,
+    )
+
+    _sql_constraints = [
+        (
+            "company_date_uniq",
+            "unique(company_id, date, rule_key)",
+            "Only one checkpoint per company, date and record rules is allowed.",
+        ),
+    ]
+
+    @api.model
+    def _get_checkpoint_date(self, company, date):
+        """returns the latest period start on or before ``date`` whose
+        preceding journal items are all locked, or False"""
+        lock_date = company.fiscalyear_lock_date
+        if not lock_date:
+            return False
+        return min(date, lock_date + relativedelta(days=1)).replace(day=1)
+
+    @api.model
+    def _get_rule_filter(self, company):
+        """returns the digest of the record rules restricting the journal
+        items of ``company`` the current user reads, with the FROM and WHERE
+        clauses and the parameters applying them on account_move_line"""
+        domain = (
+            self.env["ir.rule"]
+            .with_context(allowed_company_ids=[company.id])
+            ._compute_domain("account.move.line", "read")
+        )
+        query = self.env["account.move.line"].sudo()._where_calc(domain or [])
+        from_clause, where_clause, params = query.get_sql()
+        where_clause = where_clause or "TRUE"
+        key = hashlib.sha1(
+            repr((from_clause, where_clause, params)).encode()
+        ).hexdigest()
+        return key, from_clause, where_clause, params
+
+    @api.model
+    def _get_checkpoint(self, company, date):
+        """returns the checkpoint of ``company`` to use for the balances
+        before ``date`` of the journal items the current user reads,
+        computing it from the previous checkpoint when it does not exist
+        yet"""
+        checkpoint_date = self._get_checkpoint_date(company, date)
+        if not checkpoint_date:
+            return self.browse()
+        rule_filter = self._get_rule_filter(company)
+        domain = [
+            ("company_id", "=", company.id),
+            ("rule_key", "=", rule_filter[0]),
+            ("date", "<=", checkpoint_date),
+        ]
+        checkpoint = self.search(domain, limit=1)
+        if checkpoint.date == checkpoint_date:
+            return checkpoint
+        try:
+            with self.env.cr.savepoint():
+                return self._create_checkpoint(
+                    company, checkpoint_date, checkpoint, rule_filter
+                )
+        except IntegrityError:
+            # created meanwhile by a concurrent transaction
+            _logger.info(
+                "Checkpoint of %s at %s is being computed",
+                company.name,
+                checkpoint_date,
+            )
+            return checkpoint
+
+    @api.model
+    def _create_checkpoint(self, company, date, previous, rule_filter):
+        """Create the checkpoint of ``company`` at ``date``, as the
+        ``previous`` checkpoint plus the posted journal items since then
+        matching the record rules of ``rule_filter``, see
+        _get_rule_filter()"""
+        key, from_clause, where_clause, rule_params = rule_filter
+        self.env["account.move.line"].flush()
+        checkpoint = self.create(
+            {"company_id": company.id, "date": date, "rule_key": key}
+        )
+        self.env.cr.execute(
+            """INSERT INTO dynamic_report_checkpoint_line
+                (checkpoint_id, account_id, debit, credit, balance)
+            SELECT %s, account_id,
+                SUM(debit), SUM(credit), SUM(balance)
+            FROM (
+                SELECT account_id, debit, credit, balance
+                FROM dynamic_report_checkpoint_line
+                WHERE checkpoint_id = %s
+                UNION ALL
+                SELECT "account_move_line".account_id,
+                    "account_move_line".debit,
+                    "account_move_line".credit,
+                    "account_move_line".balance
+                FROM {}
+                WHERE ({})
+                    AND "account_move_line".company_id = %s
+                    AND "account_move_line".account_id IS NOT NULL
+                    AND "account_move_line".parent_state = 'posted'
+                    AND "account_move_line".date >= %s
+                    AND "account_move_line".date < %s
+            ) AS balances
+            GROUP BY account_id""".format(
+                from_clause, where_clause
+            ),
+            [checkpoint.id, previous.id or 0]
+            + list(rule_params)
+            + [company.id, previous.date or date.min, date],
+        )
+        return checkpoint
+
+    @api.model
+    def _unlink_unlocked(self, companies):
+        """Remove the checkpoints covering journal items no longer locked"""
+        for company in companies:
+            domain = [("company_id", "=", company.id)]
+            lock_date = company.fiscalyear_lock_date
+            if lock_date:
+                domain.append(("date", ">", lock_date + relativedelta(days=1)))
+            self.sudo().search(domain).unlink()
+
+
+class DynamicReportCheckpointLine(models.Model):
+    _name = "dynamic.report.checkpoint.line"
+    _description = "Opening Balance Checkpoint Line"
+    _log_access = False
+
+    checkpoint_id = fields.Many2one(
+        comodel_name="dynamic.report.checkpoint",
+        required=True,
+        readonly=True,
+        index=True,
+        ondelete="cascade",
+    )
+    company_currency_id = fields.Many2one(
+        related="checkpoint_id.company_id.currency_id",
+    )
+    account_id = fields.Many2one(
+        comodel_name="account.account",
+        required=True,
+        readonly=True,
+        ondelete="cascade",
+    )
+    debit = fields.Monetary(
+        currency_field="company_currency_id",
+        readonly=True,
+    )
+    credit = fields.Monetary(
+        currency_field="company_currency_id",
+        readonly=True,
+    )
+    balance = fields.Monetary(
+        currency_field="company_currency_id",
+        readonly=True,
+    )
@@ -0,0 +1,307 @@
+# Copyright 2021 Ecosoft Co., Ltd. (http://ecosoft.co.th)
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+import logging
+
+from odoo import api, fields, models, tools
+
+_logger = logging.getLogger(__name__)
+
+# Unique key of a daily balance, also used as upsert conflict target
+DAILY_BALANCE_KEY = [
+    "account_id",
+    "date",
+    "journal_id",
+    "COALESCE(operating_unit_id, 0)",
+    "COALESCE(analytic_account_id, 0)",
+    "move_state",
+]
+
+# Filters of account.move.line _query_get() the daily balances cannot serve
+UNSUPPORTED_CONTEXT = [
+    "aged_balance",
+    "reconcile_date",
+    "account_tag_ids",
+    "account_ids",
+    "analytic_tag_ids",
+    "partner_ids",
+    "partner_categories",
+]
+
+
+class DynamicReportDailyBalance(models.Model):
+    _name = "dynamic.report.daily.balance"
+    _description = "Daily Account Balance"
+    _log_access = False
+    _order = "date, account_id"
+
+    company_id = fields.Many2one(
+        comodel_name="res.company",
+        required=True,
+        readonly=True,
+    )
+    company_currency_id = fields.Many2one(
+        related="company_id.currency_id",
+    )
+    account_id = fields.Many2one(
+        comodel_name="account.account",
+        required=True,
+        readonly=True,
+        ondelete="cascade",
+    )
+    date = fields.Date(
+        required=True,
+        readonly=True,
+    )
+    journal_id = fields.Many2one(
+        comodel_name="account.journal",
+        required=True,
+        readonly=True,
+        ondelete="cascade",
+    )
+    operating_unit_id = fields.Many2one(
+        comodel_name="operating.unit",
+        readonly=True,
+        ondelete="cascade",
+    )
+    analytic_account_id = fields.Many2one(
+        comodel_name="account.analytic.account",
+        readonly=True,
+        ondelete="cascade",
+    )
+    move_state = fields.Selection(
+        selection=[
+            ("draft", "Draft"),
+            ("posted", "Posted"),
+            ("cancel", "Cancelled"),
+        ],
+        required=True,
+        readonly=True,
+    )
+    debit = fields.Monetary(
+        currency_field="company_currency_id",
+        readonly=True,
+    )
+    credit = fields.Monetary(
+        currency_field="company_currency_id",
+        readonly=True,
+    )
+    balance = fields.Monetary(
+        currency_field="company_currency_id",
+        readonly=True,
+    )
+    line_count = fields.Integer(
+        readonly=True,
+    )
+
+    def init(self):
+        tools.create_unique_index(
+            self._cr,
+            "dynamic_report_daily_balance_key_uniq",
+            self._table,
+            DAILY_BALANCE_KEY,
+        )
+
+    def _aggregate_query(self, where="TRUE"):
+        """returns the query summing the journal items matching ``where``
+        per daily balance key.
+
+        Only the items whose key columns are set count: the related and
+        computed keys of new items are NULL until they are flushed, the
+        items are then counted from _write()."""
+        return """SELECT l.company_id, l.account_id, l.date, l.journal_id,
+                l.operating_unit_id, l.analytic_account_id,
+                l.parent_state AS move_state,
+                COALESCE(SUM(l.debit), 0) AS debit,
+                COALESCE(SUM(l.credit), 0) AS credit,
+                COALESCE(SUM(l.balance), 0) AS balance,
+                COUNT(*) AS line_count
+            FROM account_move_line l
+            WHERE l.account_id IS NOT NULL AND l.date IS NOT NULL
+                AND l.journal_id IS NOT NULL AND l.company_id IS NOT NULL
+                AND l.parent_state IS NOT NULL AND {}
+            GROUP BY l.company_id, l.account_id, l.date, l.journal_id,
+                l.operating_unit_id, l.analytic_account_id, l.parent_state
+        """.format(
+            where
+        )
+
+    @api.model
+    def _apply_move_lines(self, lines, sign=1):
+        """Add (``sign`` = 1) or remove (``sign`` = -1) the amounts of the
+        journal items ``lines``, as stored in the database, to the daily
+        balances. Called while the journal items are flushed, so it must not
+        flush them itself.
+
+        The rows are upserted in the order of their key, so that concurrent
+        postings on the same accounts lock them in the same order."""
+        if not lines.ids:
+            return
+        self.env.cr.execute(
+            """INSERT INTO dynamic_report_daily_balance AS d
+                (company_id, account_id, date, journal_id, operating_unit_id,
+                 analytic_account_id, move_state, debit, credit, balance,
+                 line_count)
+            SELECT company_id, account_id, date, journal_id,
+                operating_unit_id, analytic_account_id, move_state,
+                %(sign)s * debit, %(sign)s * credit, %(sign)s * balance,
+                %(sign)s * line_count
+            FROM ({query}) AS agg
+            ORDER BY {key}
+            ON CONFLICT ({key}) DO UPDATE SET
+                debit = d.debit + EXCLUDED.debit,
+                credit = d.credit + EXCLUDED.credit,
+                balance = d.balance + EXCLUDED.balance,
+                line_count = d.line_count + EXCLUDED.line_count
+            RETURNING d.id, d.line_count""".format(
+                query=self._aggregate_query("l.id = ANY(%(ids)s)"),
+                key=", ".join(DAILY_BALANCE_KEY),
+            ),
+            {"sign": sign, "ids": lines.ids},
+        )
+        empty_ids = [row[0] for row in self.env.cr.fetchall() if not row[1]]
+        if empty_ids:
+            self.env.cr.execute(
+                "DELETE FROM dynamic_report_daily_balance WHERE id = ANY(%s)",
+                (sorted(empty_ids),),
+            )
+        self.invalidate_cache()
+
+    @api.model
+    def rebuild(self):
+        """Recompute all the daily balances from the journal items"""
+        self.env["account.move.line"].flush()
+        self.env.cr.execute("TRUNCATE dynamic_report_daily_balance")
+        self.env.cr.execute(
+            """INSERT INTO dynamic_report_daily_balance
+                (company_id, account_id, date, journal_id, operating_unit_id,
+                 analytic_account_id, move_state, debit, credit, balance,
+                 line_count) """
+            + self._aggregate_query()
+        )
+        _logger.info("Rebuilt %s daily balances", self.env.cr.rowcount)
+        self.invalidate_cache()
+        self.env["ir.config_parameter"].sudo().set_param(
+            "dynamic_accounts_report.use_daily_balance", True
+        )
+
+    @api.model
+    def check_consistency(self, limit=100):
+        """returns the ``(account_id, date)`` of up to ``limit`` days whose
+        daily balances differ from the journal items"""
+        self.env["account.move.line"].flush()
+        self.env.cr.execute(
+            """SELECT DISTINCT COALESCE(f.account_id, d.account_id),
+                    COALESCE(f.date, d.date)
+                FROM ({}) AS f
+                FULL OUTER JOIN dynamic_report_daily_balance d
+                    ON d.account_id = f.account_id
+                    AND d.date = f.date
+                    AND d.journal_id = f.journal_id
+                    AND d.operating_unit_id IS NOT DISTINCT FROM f.operating_unit_id
+                    AND d.analytic_account_id IS NOT DISTINCT FROM
+                        f.analytic_account_id
+                    AND d.move_state = f.move_state
+                WHERE f.account_id IS NULL OR d.id IS NULL
+                    OR d.debit <> f.debit OR d.credit <> f.credit
+                    OR d.balance <> f.balance OR d.line_count <> f.line_count
+                ORDER BY 2, 1
+                LIMIT %s""".format(
+                self._aggregate_query()
+            ),
+            (limit,),
+        )
+        return self.env.cr.fetchall()
+
+    @api.model
+    def _is_enabled(self):
+        """The daily balances are maintained and read by the reports once
+        they have been built, see rebuild()"""
+        return bool(
+            self.env["ir.config_parameter"]
+            .sudo()
+            .get_param("dynamic_accounts_report.use_daily_balance")
+        )
+
+    @api.model
+    def _get_account_totals(
+        self,
+        account_ids,
+        date_from=False,
+        date_to=False,
+        target_move="posted",
+        journal_ids=None,
+        operating_unit_ids=None,
+        analytic_ids=None,
+        company_ids=None,
+        initial_balance_types=False,
+    ):
+        """returns the debit, credit, balance and number of journal items
+        of each of ``account_ids`` within the given filters, as a dict keyed
+        by account id. With ``initial_balance_types``, ``date_from`` does not
+        apply to the accounts whose type includes the initial balance."""
+        wheres = ["d.account_id = ANY(%s)", "d.company_id = ANY(%s)"]
+        params = [list(account_ids), list(company_ids or self.env.companies.ids)]
+        if target_move == "posted":
+            wheres.append("d.move_state = 'posted'")
+        else:
+            wheres.append("d.move_state IN ('draft', 'posted')")
+        if date_from and initial_balance_types:
+            wheres.append("(d.date >= %s OR t.include_initial_balance)")
+            params.append(date_from)
+        elif date_from:
+            wheres.append("d.date >= %s")
+            params.append(date_from)
+        if date_to:
+            wheres.append("d.date <= %s")
+            params.append(date_to)
+        if journal_ids:
+            wheres.append("d.journal_id = ANY(%s)")
+            params.append(list(journal_ids))
+        if operating_unit_ids:
+            wheres.append("d.operating_unit_id = ANY(%s)")
+            params.append(list(operating_unit_ids))
+        if analytic_ids:
+            wheres.append("d.analytic_account_id = ANY(%s)")
+            params.append(list(analytic_ids))
+        self.env["account.move.line"].flush()
+        self.env.cr.execute(
+            """SELECT d.account_id AS id,
+                    COALESCE(SUM(d.debit), 0) AS debit,
+                    COALESCE(SUM(d.credit), 0) AS credit,
+                    COALESCE(SUM(d.balance), 0) AS balance,
+                    COALESCE(SUM(d.line_count), 0) AS count
+                FROM dynamic_report_daily_balance d
+                JOIN account_account a ON (a.id = d.account_id)
+                JOIN account_account_type t ON (t.id = a.user_type_id)
+                WHERE """
+            + " AND ".join(wheres)
+            + " GROUP BY d.account_id",
+            params,
+        )
+        return {row["id"]: row for row in self.env.cr.dictfetchall()}
+
+    @api.model
+    def _get_account_totals_from_context(self, account_ids):
+        """returns the balances of ``account_ids`` for the filters of the
+        context, as account.move.line _query_get() would select them, or
+        None when the daily balances cannot serve these filters"""
+        context = self.env.context
+        if not self._is_enabled() or any(context.get(k) for k in UNSUPPORTED_CONTEXT):
+            return None
+        if context.get("date_from") and context.get("initial_bal"):
+            return None
+        company = context.get("company_id")
+        if isinstance(company, models.BaseModel):
+            company = company.id
+        state = (context.get("state") or "all").lower()
+        return self._get_account_totals(
+            account_ids,
+            date_from=context.get("date_from"),
+            date_to=context.get("date_to"),
+            target_move=state,
+            journal_ids=context.get("journal_ids"),
+            analytic_ids=context.get("analytic_account_ids"),
+            company_ids=company and [company],
+            initial_balance_types=not context.get("strict_range"),
+        )
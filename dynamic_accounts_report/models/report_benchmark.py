@@ -0,0 +1,460 @@
+# Copyright 2021 Ecosoft Co., Ltd. (http://ecosoft.co.th)
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+import json
+import logging
+import random
+import statistics
+import time
+from datetime import date
+
+from odoo import _, api, models, release
+from odoo.exceptions import UserError
+
+from .report_job import JobResponse
+
+_logger = logging.getLogger(__name__)
+
+# Prefix of the codes and names of the generated records, and sequence
+# prefix of the generated journal entries, numbered from 1
+BENCH_PREFIX = "BENCH"
+BENCH_MOVE_PREFIX = "BENCH/"
+# Journal entries inserted per statement, each batch being committed
+BENCH_BATCH_SIZE = 50000
+# Account types of the generated chart of accounts, none to reconcile
+BENCH_ACCOUNT_TYPES = [
+    "account.data_account_type_current_assets",
+    "account.data_account_type_fixed_assets",
+    "account.data_account_type_current_liabilities",
+    "account.data_account_type_non_current_liabilities",
+    "account.data_account_type_equity",
+    "account.data_account_type_revenue",
+    "account.data_account_type_expenses",
+]
+# The journal entries span three years, the reports show the last one
+BENCH_DATE_START = date(2018, 1, 1)
+BENCH_DAYS = 3 * 365
+BENCH_REPORT_DATES = (date(2020, 1, 1), date(2020, 12, 31))
+BENCH_REPORT_NAME = "Benchmark Report"
+
+SCENARIOS = [
+    "bs_open",
+    "gl_open",
+    "gl_drilldown",
+    "gl_accounts",
+    "xlsx_export",
+    "pdf_data",
+]
+
+
+class DynamicReportBenchmark(models.AbstractModel):
+    """Synthetic data and timings of the dynamic reports.
+
+    The data only depends on the seed and the sizes given, so timings taken
+    on different versions of the module with the same options compare.
+    Journal entries are inserted in SQL, two journal items each, and are
+    added to the existing ones when a larger scale is asked for."""
+
+    _name = "dynamic.report.benchmark"
+    _description = "Dynamic Report Benchmark"
+
+    @api.model
+    def _get_or_create(self, model_name, domain, vals):
+        record = self.env[model_name].search(domain, limit=1)
+        return record or self.env[model_name].create(vals)
+
+    @api.model
+    def _setup(
+        self,
+        seed=1,
+        accounts=200,
+        journals=4,
+        operating_units=4,
+        analytics=50,
+        analytic_tags=20,
+        account_tags=10,
+        report_depth=5,
+        report_branching=3,
+    ):
+        """Create the chart of accounts, journals, operating units,
+        analytic accounts and tags and the financial report of the
+        benchmark, unless they exist, returns them as a dict"""
+        company = self.env.company
+        rng = random.Random(seed)
+        res = {"company": company}
+        res["account_tags"] = self.env["account.account.tag"]
+        for i in range(account_tags):
+            res["account_tags"] |= self._get_or_create(
+                "account.account.tag",
+                [("name", "=", "%s Tag %s" % (BENCH_PREFIX, i))],
+                {"name": "%s Tag %s" % (BENCH_PREFIX, i), "applicability": "accounts"},
+            )
+        types = [self.env.ref(xmlid) for xmlid in BENCH_ACCOUNT_TYPES]
+        res["accounts"] = self.env["account.account"]
+        for i in range(accounts):
+            code = "%s%04d" % (BENCH_PREFIX, i)
+            tags = rng.sample(res["account_tags"].ids, min(2, account_tags))
+            res["accounts"] |= self._get_or_create(
+                "account.account",
+                [("code", "=", code), ("company_id", "=", company.id)],
+                {
+                    "code": code,
+                    "name": "%s Account %s" % (BENCH_PREFIX, i),
+                    "user_type_id": types[rng.randrange(len(types))].id,
+                    "tag_ids": [(6, 0, tags)],
+                    "company_id": company.id,
+                },
+            )
+        res["journals"] = self.env["account.journal"]
+        for i in range(journals):
+            code = "BN%02d" % i
+            res["journals"] |= self._get_or_create(
+                "account.journal",
+                [("code", "=", code), ("company_id", "=", company.id)],
+                {
+                    "code": code,
+                    "name": "%s Journal %s" % (BENCH_PREFIX, i),
+                    "type": "general",
+                    "company_id": company.id,
+                },
+            )
+        res["operating_units"] = self.env["operating.unit"]
+        for i in range(operating_units):
+            code = "BN%02d" % i
+            res["operating_units"] |= self._get_or_create(
+                "operating.unit",
+                [("code", "=", code), ("company_id", "=", company.id)],
+                {
+                    "code": code,
+                    "name": "%s Unit %s" % (BENCH_PREFIX, i),
+                    "partner_id": company.partner_id.id,
+                    "company_id": company.id,
+                },
+            )
+        res["analytics"] = self.env["account.analytic.account"]
+        for i in range(analytics):
+            code = "%s%03d" % (BENCH_PREFIX, i)
+            res["analytics"] |= self._get_or_create(
+                "account.analytic.account",
+                [("code", "=", code), ("company_id", "=", company.id)],
+                {
+                    "code": code,
+                    "name": "%s Analytic %s" % (BENCH_PREFIX, i),
+                    "company_id": company.id,
+                },
+            )
+        res["analytic_tags"] = self.env["account.analytic.tag"]
+        for i in range(analytic_tags):
+            name = "%s Analytic Tag %s" % (BENCH_PREFIX, i)
+            res["analytic_tags"] |= self._get_or_create(
+                "account.analytic.tag",
+                [("name", "=", name)],
+                {"name": name, "company_id": company.id},
+            )
+        res["report"] = self._setup_report(
+            res["accounts"], report_depth, report_branching
+        )
+        return res
+
+    @api.model
+    def _setup_report(self, accounts, depth, branching):
+        """returns the financial report of the benchmark, a tree of ``depth``
+        levels of ``branching`` children whose leaves share the accounts"""
+        FinancialReport = self.env["account.financial.report"]
+        report = FinancialReport.search(
+            [("name", "=", BENCH_REPORT_NAME), ("parent_id", "=", False)], limit=1
+        )
+        if report:
+            return report
+        report = FinancialReport.create({"name": BENCH_REPORT_NAME, "type": "sum"})
+        # view_report() looks the report up by name, the nodes are named
+        # after their position in the tree only
+        nodes = report
+        for level in range(1, depth):
+            children = FinancialReport
+            for parent_index, parent in enumerate(nodes):
+                for i in range(branching):
+                    children |= FinancialReport.create(
+                        {
+                            "name": "%s Node %s.%s.%s"
+                            % (BENCH_PREFIX, level, parent_index, i),
+                            "parent_id": parent.id,
+                            "sequence": i,
+                            "type": "sum",
+                            "display_detail": "detail_with_hierarchy",
+                        }
+                    )
+            nodes = children
+        for i, leaf in enumerate(nodes):
+            leaf.write(
+                {
+                    "type": "accounts",
+                    "account_ids": [(6, 0, accounts[i :: len(nodes)].ids)],
+                }
+            )
+        return report
+
+    @api.model
+    def _get_generated_moves(self):
+        """returns the number of journal entries generated so far"""
+        self.env.cr.execute(
+            """SELECT COALESCE(MAX(sequence_number), 0) FROM account_move
+                WHERE company_id = %s AND sequence_prefix = %s""",
+            (self.env.company.id, BENCH_MOVE_PREFIX),
+        )
+        return self.env.cr.fetchone()[0]
+
+    @api.model
+    def generate(self, lines, seed=1, **sizes):
+        """Generate the benchmark data until the company has ``lines``
+        journal items, committing after each batch.
+
+        Only runs on a company without other journal entries, which must
+        not be a production database."""
+        cr = self.env.cr
+        cr.execute(
+            """SELECT 1 FROM account_move
+                WHERE company_id = %s AND sequence_prefix IS DISTINCT FROM %s
+                LIMIT 1""",
+            (self.env.company.id, BENCH_MOVE_PREFIX),
+        )
+        if cr.fetchone():
+            raise UserError(
+                _(
+                    "The benchmark data is only generated for a company "
+                    "without other journal entries."
+                )
+            )
+        setup = self._setup(seed=seed, **sizes)
+        cr.commit()
+        params = {
+            "seed": seed,
+            "company": setup["company"].id,
+            "currency": setup["company"].currency_id.id,
+            "uid": self.env.uid,
+            "prefix": BENCH_MOVE_PREFIX,
+            "date_start": BENCH_DATE_START,
+            "days": BENCH_DAYS,
+            "journals": setup["journals"].ids,
+            "accounts": setup["accounts"].ids,
+            "operating_units": setup["operating_units"].ids,
+            "analytics": setup["analytics"].ids,
+            "analytic_tags": setup["analytic_tags"].ids,
+        }
+        moves = lines // 2
+        start = self._get_generated_moves() + 1
+        while start <= moves:
+            end = min(start + BENCH_BATCH_SIZE - 1, moves)
+            self._insert_moves(dict(params, start=start, end=end))
+            cr.commit()
+            _logger.info("Generated %s of %s journal entries", end, moves)
+            start = end + 1
+        self.env["account.move.line"].invalidate_cache()
+        cr.execute("ANALYZE account_move")
+        cr.execute("ANALYZE account_move_line")
+        DailyBalance = self.env["dynamic.report.daily.balance"]
+        if DailyBalance._is_enabled():
+            DailyBalance.rebuild()
+        self.env["dynamic.report.cache"]._invalidate(setup["company"])
+        cr.commit()
+        return setup
+
+    @api.model
+    def _insert_moves(self, params):
+        """Insert the journal entries ``start`` to ``end`` with their journal
+        items. Every value is derived from the number of the entry and the
+        seed: a debit and a credit item of the same amount, one entry out of
+        twenty left in draft, one item out of four with an analytic tag."""
+        cr = self.env.cr
+        cr.execute(
+            """INSERT INTO account_move (name, date, state, move_type,
+                    journal_id, company_id, currency_id, sequence_prefix,
+                    sequence_number, auto_post, to_check,
+                    create_uid, create_date, write_uid, write_date)
+                SELECT %(prefix)s || i,
+                    %(date_start)s::date + (i * 31 + %(seed)s) %% %(days)s,
+                    CASE WHEN (i * 13 + %(seed)s) %% 20 = 0
+                        THEN 'draft' ELSE 'posted' END,
+                    'entry',
+                    (%(journals)s::int[])[
+                        1 + (i + %(seed)s) %% cardinality(%(journals)s::int[])
+                    ],
+                    %(company)s, %(currency)s, %(prefix)s, i, FALSE, FALSE,
+                    %(uid)s, now() at time zone 'UTC',
+                    %(uid)s, now() at time zone 'UTC'
+                FROM generate_series(%(start)s, %(end)s) AS i""",
+            params,
+        )
+        cr.execute(
+            """INSERT INTO account_move_line (move_id, move_name, date,
+                    parent_state, journal_id, company_id, company_currency_id,
+                    currency_id, account_id, account_internal_type,
+                    account_root_id, operating_unit_id,
+                    analytic_account_id, name, quantity, debit, credit,
+                    balance, amount_currency, amount_residual,
+                    amount_residual_currency, reconciled, blocked,
+                    exclude_from_invoice_tab,
+                    create_uid, create_date, write_uid, write_date)
+                SELECT m.id, m.name, m.date, m.state, m.journal_id,
+                    m.company_id, m.currency_id, m.currency_id,
+                    acc.id, t.type, acc.root_id,
+                    (%(operating_units)s::int[])[
+                        1 + (m.sequence_number + %(seed)s)
+                            %% cardinality(%(operating_units)s::int[])
+                    ],
+                    CASE WHEN (m.sequence_number + s.side) %% 3 = 0 THEN
+                        (%(analytics)s::int[])[
+                            1 + (m.sequence_number * 31 + %(seed)s)
+                                %% cardinality(%(analytics)s::int[])
+                        ]
+                    END,
+                    m.name, 1.0,
+                    CASE WHEN s.side = 0 THEN a.amount ELSE 0 END,
+                    CASE WHEN s.side = 1 THEN a.amount ELSE 0 END,
+                    CASE WHEN s.side = 0 THEN a.amount ELSE -a.amount END,
+                    CASE WHEN s.side = 0 THEN a.amount ELSE -a.amount END,
+                    0, 0, FALSE, FALSE, TRUE,
+                    %(uid)s, now() at time zone 'UTC',
+                    %(uid)s, now() at time zone 'UTC'
+                FROM account_move m
+                CROSS JOIN (VALUES (0), (1)) AS s(side)
+                CROSS JOIN LATERAL (
+                    SELECT ((m.sequence_number * 104729 + %(seed)s) %% 1000000
+                            / 100.0 + 1)::numeric AS amount,
+                        (%(accounts)s::int[])[
+                            1 + (m.sequence_number * 7919 + s.side * 104729
+                                + %(seed)s) %% cardinality(%(accounts)s::int[])
+                        ] AS account_id
+                ) AS a
+                JOIN account_account acc ON (acc.id = a.account_id)
+                JOIN account_account_type t ON (t.id = acc.user_type_id)
+                WHERE m.company_id = %(company)s
+                    AND m.sequence_prefix = %(prefix)s
+                    AND m.sequence_number BETWEEN %(start)s AND %(end)s""",
+            params,
+        )
+        cr.execute(
+            """INSERT INTO account_analytic_tag_account_move_line_rel
+                    (account_move_line_id, account_analytic_tag_id)
+                SELECT l.id, (%(analytic_tags)s::int[])[
+                        1 + (m.sequence_number + %(seed)s)
+                            %% cardinality(%(analytic_tags)s::int[])
+                    ]
+                FROM account_move_line l
+                JOIN account_move m ON (l.move_id = m.id)
+                WHERE m.company_id = %(company)s
+                    AND m.sequence_prefix = %(prefix)s
+                    AND m.sequence_number BETWEEN %(start)s AND %(end)s
+                    AND m.sequence_number %% 2 = 0 AND l.debit > 0""",
+            params,
+        )
+
+    @api.model
+    def _bench_bs_open(self, bs, gl):
+        bs.view_report([bs.id], BENCH_REPORT_NAME, compact=True)
+
+    @api.model
+    def _bench_gl_open(self, bs, gl):
+        gl.view_report([gl.id], "General Ledger", compact=True)
+
+    @api.model
+    def _bench_gl_drilldown(self, bs, gl):
+        self.env.cr.execute(
+            """SELECT account_id FROM account_move_line
+                WHERE company_id = %s AND parent_state = 'posted'
+                GROUP BY account_id ORDER BY COUNT(*) DESC, account_id LIMIT 1""",
+            (self.env.company.id,),
+        )
+        account_id = self.env.cr.fetchone()[0]
+        gl.view_account_lines([gl.id], account_id, compact=True)
+
+    @api.model
+    def _bench_gl_accounts(self, bs, gl):
+        data = gl._get_report_data(gl)
+        gl._get_accounts(data["accounts"], True, data["display_account"], data)
+
+    @api.model
+    def _bench_xlsx_export(self, bs, gl):
+        response = JobResponse()
+        gl.get_dynamic_xlsx_report(
+            json.dumps([gl.id]), response, "General Ledger", ""
+        )
+        response.response.close()
+
+    @api.model
+    def _bench_pdf_data(self, bs, gl):
+        bs._get_print_data([bs.id], BENCH_REPORT_NAME)
+
+    @api.model
+    def run(self, scenarios=None, repeat=3):
+        """returns the timings of ``repeat`` runs of each of ``scenarios``
+        on the benchmark data, with the report result cache disabled. The
+        transaction is rolled back afterwards."""
+        cr = self.env.cr
+        self.env["ir.config_parameter"].sudo().set_param(
+            "dynamic_accounts_report.cache_max_size", 0
+        )
+        date_from, date_to = BENCH_REPORT_DATES
+        bs = self.env["dynamic.balance.sheet.report"].create(
+            {"date_from": date_from, "date_to": date_to}
+        )
+        gl = self.env["account.general.ledger"].create(
+            {"date_from": date_from, "date_to": date_to}
+        )
+        results = []
+        try:
+            for name in scenarios or SCENARIOS:
+                bench = getattr(self, "_bench_%s" % name)
+                timings = []
+                for _i in range(repeat):
+                    self.invalidate_cache()
+                    queries = cr.sql_log_count
+                    start = time.perf_counter()
+                    bench(bs, gl)
+                    timings.append(time.perf_counter() - start)
+                    queries = cr.sql_log_count - queries
+                results.append(
+                    {
+                        "scenario": name,
+                        "timings": timings,
+                        "min": min(timings),
+                        "median": statistics.median(timings),
+                        "max": max(timings),
+                        "queries": queries,
+                    }
+                )
+                _logger.info("%s: %.3fs", name, min(timings))
+        finally:
+            cr.rollback()
+        return results
+
+    @api.model
+    def check_query_counts(self, results):
+        """returns the ``results`` of run() at several scales issuing more
+        queries than the same scenario at the smallest scale, which means
+        the report runs queries per account, report node or journal item
+        somewhere. The counts are taken from the last run of each scenario,
+        once the caches are warm."""
+        base = {}
+        for res in sorted(results, key=lambda res: res["scale"]):
+            base.setdefault(res["scenario"], res["queries"])
+        return [res for res in results if res["queries"] > base[res["scenario"]]]
+
+    @api.model
+    def get_environment(self):
+        """returns the versions and settings the timings depend on"""
+        self.env.cr.execute("SHOW server_version")
+        server_version = self.env.cr.fetchone()[0]
+        module = self.env["ir.module.module"].search(
+            [("name", "=", "dynamic_accounts_report")]
+        )
+        get_param = self.env["ir.config_parameter"].sudo().get_param
+        return {
+            "odoo": release.version,
+            "module": module.latest_version,
+            "postgresql": server_version,
+            "daily_balance": self.env["dynamic.report.daily.balance"]._is_enabled(),
+            "prepared_statements": bool(
+                get_param("dynamic_accounts_report.prepared_statements")
+            ),
+        }
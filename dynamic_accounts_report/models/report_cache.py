@@ -0,0 +1,288 @@
+# Copyright 2021 Ecosoft Co., Ltd. (http://ecosoft.co.th)
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+import hashlib
+import json
+import logging
+
+import psycopg2
+
+from odoo import api, fields, models
+from odoo.tools import date_utils
+
+_logger = logging.getLogger(__name__)
+
+
+class DynamicReportCache(models.Model):
+    """Results of view_report shared by all the workers.
+
+    A result is stored with the snapshot of the transaction that computed
+    it. Transactions changing report data log their transaction id in
+    dynamic_report_cache_invalidation, and a result stays valid as long as
+    every logged transaction is visible in its snapshot. A result computed
+    while a change was being committed is therefore never reused.
+
+    The hits and misses of each report are counted in
+    dynamic_report_cache_stats, see get_stats()."""
+
+    _name = "dynamic.report.cache"
+    _description = "Dynamic Report Result Cache"
+    _log_access = False
+
+    key = fields.Char(
+        required=True,
+        readonly=True,
+    )
+    res_model = fields.Char(
+        string="Report Model",
+        required=True,
+        readonly=True,
+    )
+    company_id = fields.Many2one(
+        comodel_name="res.company",
+        readonly=True,
+        ondelete="cascade",
+    )
+    result = fields.Text(
+        readonly=True,
+    )
+    snapshot = fields.Char(
+        readonly=True,
+    )
+    create_date = fields.Datetime(
+        readonly=True,
+    )
+
+    _sql_constraints = [
+        ("key_uniq", "unique(key)", "A report result is cached only once."),
+    ]
+
+    def init(self):
+        cr = self._cr
+        cr.execute(
+            """CREATE TABLE IF NOT EXISTS dynamic_report_cache_invalidation (
+                txid bigint NOT NULL,
+                company_id integer,
+                create_date timestamp without time zone
+                    DEFAULT (now() at time zone 'UTC'),
+                UNIQUE (txid, company_id)
+            )"""
+        )
+        cr.execute(
+            """CREATE INDEX IF NOT EXISTS dynamic_report_cache_invalidation_company_idx
+                ON dynamic_report_cache_invalidation (company_id)"""
+        )
+        cr.execute(
+            """CREATE TABLE IF NOT EXISTS dynamic_report_cache_stats (
+                res_model varchar PRIMARY KEY,
+                hits bigint NOT NULL DEFAULT 0,
+                misses bigint NOT NULL DEFAULT 0
+            )"""
+        )
+
+    @api.model
+    def _get_param(self, name, default):
+        return int(
+            self.env["ir.config_parameter"]
+            .sudo()
+            .get_param("dynamic_accounts_report.%s" % name, default)
+        )
+
+    @api.model
+    def _get_key(self, res_model, values):
+        payload = json.dumps(
+            [res_model, values], sort_keys=True, default=date_utils.json_default
+        )
+        return hashlib.sha1(payload.encode()).hexdigest()
+
+    @api.model
+    def _get_wizard_values(self, wizard):
+        """returns the filters of the report ``wizard`` and the user as the
+        values identifying its result, whatever the wizard record holding
+        them"""
+        values = {
+            "uid": self.env.uid,
+            "company_id": self.env.company.id,
+            "company_ids": sorted(self.env.companies.ids),
+            "lang": self.env.lang,
+        }
+        for name, field in wizard._fields.items():
+            if name in models.MAGIC_COLUMNS or not field.store:
+                continue
+            if field.type in ("many2many", "one2many"):
+                values[name] = sorted(wizard[name].ids)
+            elif field.type == "many2one":
+                values[name] = wizard[name].id
+            else:
+                values[name] = wizard[name]
+        return values
+
+    @api.model
+    def _get_result(self, res_model, values, compute):
+        """returns the result of ``compute()``, the report ``res_model``
+        for the normalized filters ``values``, from the cache when a worker
+        already computed it since the last change of the report data.
+
+        The result is returned as the client receives it, i.e. as decoded
+        from its JSON representation. The cache is disabled when its maximum
+        size, the cache_max_size parameter in MB, is 0."""
+        max_size = self._get_param("cache_max_size", 100) * 1024 * 1024
+        if not max_size:
+            return compute()
+        cr = self.env.cr
+        key = self._get_key(res_model, values)
+        cr.execute(
+            """SELECT c.result FROM dynamic_report_cache c
+                WHERE c.key = %s
+                    AND c.create_date > (now() at time zone 'UTC') - %s * interval '1 hour'
+                    AND NOT EXISTS (
+                        SELECT 1 FROM dynamic_report_cache_invalidation i
+                        WHERE (
+                            i.company_id = c.company_id
+                            OR i.company_id IS NULL
+                            OR c.company_id IS NULL
+                        )
+                            AND NOT txid_visible_in_snapshot(
+                                i.txid, c.snapshot::txid_snapshot
+                            )
+                    )""",
+            (key, self._get_param("cache_max_age", 12)),
+        )
+        row = cr.fetchone()
+        ReportQuery = self.env["dynamic.report.query"]
+        if row:
+            self._count(res_model, "hits")
+            with ReportQuery._report_stage("serialization"):
+                return json.loads(row[0])
+        result = compute()
+        with ReportQuery._report_stage("serialization"):
+            payload = json.dumps(result, default=date_utils.json_default)
+        if len(payload) <= max_size:
+            self._store(key, res_model, payload, max_size)
+        self._count(res_model, "misses")
+        with ReportQuery._report_stage("serialization"):
+            return json.loads(payload)
+
+    @api.model
+    def _count(self, res_model, counter):
+        """Add a hit or a miss of the report ``res_model`` to the counters,
+        ``counter`` being ``hits`` or ``misses``. The counter of the report
+        stays locked until the transaction ends, so it is only counted once
+        the result is known."""
+        self.env.cr.execute(
+            """INSERT INTO dynamic_report_cache_stats AS s (res_model, {0})
+                VALUES (%s, 1)
+                ON CONFLICT (res_model) DO UPDATE SET {0} = s.{0} + 1""".format(
+                counter
+            ),
+            (res_model,),
+        )
+
+    @api.model
+    def _store(self, key, res_model, payload, max_size=None):
+        """Store a result, then evict the oldest results beyond ``max_size``
+        bytes, by default the maximum size of the cache. Storing is best
+        effort: when concurrent workers store the same result, the loser
+        simply skips it."""
+        if max_size is None:
+            max_size = self._get_param("cache_max_size", 100) * 1024 * 1024
+        # results spanning several companies are invalidated by any change
+        companies = self.env.companies
+        company_id = companies.id if len(companies) == 1 else None
+        try:
+            with self.env.cr.savepoint():
+                self.env.cr.execute(
+                    """INSERT INTO dynamic_report_cache
+                        (key, res_model, company_id, result, snapshot, create_date)
+                    VALUES (%s, %s, %s, %s, txid_current_snapshot()::text,
+                        now() at time zone 'UTC')
+                    ON CONFLICT (key) DO UPDATE SET
+                        result = EXCLUDED.result,
+                        snapshot = EXCLUDED.snapshot,
+                        create_date = EXCLUDED.create_date""",
+                    (key, res_model, company_id, payload),
+                )
+                self._evict(max_size)
+        except psycopg2.Error as e:
+            _logger.debug("Report result not cached: %s", e)
+
+    @api.model
+    def _invalidate(self, companies=None):
+        """Invalidate the results of ``companies``, or of all companies, once
+        the current transaction commits"""
+        company_ids = companies.ids if companies is not None else [None]
+        if not company_ids:
+            return
+        self.env.cr.execute(
+            """INSERT INTO dynamic_report_cache_invalidation (txid, company_id)
+                SELECT txid_current(), company_id
+                FROM unnest(%s::integer[]) AS company_id
+                ON CONFLICT DO NOTHING""",
+            (company_ids,),
+        )
+
+    @api.model
+    def _evict(self, max_size):
+        """Drop the oldest results beyond ``max_size`` bytes"""
+        self.env.cr.execute(
+            """DELETE FROM dynamic_report_cache WHERE id IN (
+                SELECT id FROM (
+                    SELECT id, SUM(octet_length(result)) OVER (
+                        ORDER BY create_date DESC, id DESC
+                    ) AS total_size
+                    FROM dynamic_report_cache
+                ) AS c
+                WHERE c.total_size > %s
+            )""",
+            (max_size,),
+        )
+
+    @api.model
+    def _gc_cache(self):
+        """Drop the invalidated and expired results, then the oldest ones
+        beyond the maximum size of the cache, and the logged changes that
+        no longer matter to any result"""
+        max_age = self._get_param("cache_max_age", 12)
+        self.env.cr.execute(
+            """DELETE FROM dynamic_report_cache c
+                WHERE c.create_date <= (now() at time zone 'UTC') - %s * interval '1 hour'
+                    OR EXISTS (
+                        SELECT 1 FROM dynamic_report_cache_invalidation i
+                        WHERE (
+                            i.company_id = c.company_id
+                            OR i.company_id IS NULL
+                            OR c.company_id IS NULL
+                        )
+                            AND NOT txid_visible_in_snapshot(
+                                i.txid, c.snapshot::txid_snapshot
+                            )
+                    )""",
+            (max_age,),
+        )
+        self._evict(self._get_param("cache_max_size", 100) * 1024 * 1024)
+        # results are only computed from snapshots younger than max_age, so
+        # changes older than twice that are visible to any of them
+        self.env.cr.execute(
+            """DELETE FROM dynamic_report_cache_invalidation
+                WHERE create_date <= (now() at time zone 'UTC') - %s * interval '2 hour'""",
+            (max_age,),
+        )
+        self.invalidate_cache()
+
+    @api.model
+    def get_stats(self):
+        """returns the hit and miss counters of the cache, by report model
+        and in total, and the current size of the cache"""
+        cr = self.env.cr
+        cr.execute("SELECT res_model, hits, misses FROM dynamic_report_cache_stats")
+        stats = {"hits": 0, "misses": 0, "reports": {}}
+        for res_model, hits, misses in cr.fetchall():
+            stats["reports"][res_model] = {"hits": hits, "misses": misses}
+            stats["hits"] += hits
+            stats["misses"] += misses
+        cr.execute(
+            "SELECT COUNT(*), COALESCE(SUM(octet_length(result)), 0) "
+            "FROM dynamic_report_cache"
+        )
+        stats["entries"], stats["size"] = cr.fetchone()
+        return stats
@@ -0,0 +1,77 @@
+# Copyright 2021 Ecosoft Co., Ltd. (http://ecosoft.co.th)
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo import api, models
+
+# Models of the filters of the report wizards, and how their options are
+# restricted to the current company
+FILTER_MODELS = {
+    "journals": ("account.journal", "company"),
+    "accounts": ("account.account", "company"),
+    "account_tags": ("account.account.tag", None),
+    "analytics": ("account.analytic.account", "company"),
+    "analytic_tags": ("account.analytic.tag", "shared"),
+    "operating_units": ("operating.unit", "company"),
+}
+
+# Fields the labels of the selected filter values are read from
+LABEL_FIELDS = {"name", "code"}
+
+
+class DynamicReportFilter(models.AbstractModel):
+    """Options of the filters of the report wizards.
+
+    The options are searched on demand by the filter widgets instead of
+    being sent with every report, and the labels of the selected values are
+    read when the filters are shown."""
+
+    _name = "dynamic.report.filter"
+    _description = "Dynamic Report Filter Options"
+
+    def _get_filter_domain(self, filter_name):
+        model_name, company_rule = FILTER_MODELS[filter_name]
+        company = self.env.company
+        domain = []
+        if company_rule == "company":
+            domain = [("company_id", "=", company.id)]
+        elif company_rule == "shared":
+            domain = ["|", ("company_id", "=", company.id), ("company_id", "=", False)]
+        if filter_name == "accounts" and self and self.account_tag_ids:
+            domain.append(("tag_ids", "in", self.account_tag_ids.ids))
+        return domain
+
+    def search_filter_options(self, filter_name, term="", offset=0, limit=40):
+        """returns a page of at most ``limit`` options of the filter
+        ``filter_name`` matching ``term``, as select2 pages them"""
+        model_name = FILTER_MODELS[filter_name][0]
+        Model = self.env[model_name]
+        if filter_name == "analytic_tags":
+            Model = Model.sudo()
+        domain = self._get_filter_domain(filter_name)
+        if term:
+            name_domain = [("name", "ilike", term)]
+            if "code" in Model._fields:
+                name_domain = ["|", ("code", "ilike", term)] + name_domain
+            domain += name_domain
+        records = Model.search(domain, offset=offset, limit=limit + 1)
+        return {
+            "results": [
+                {"id": record_id, "text": name}
+                for record_id, name in records[:limit].name_get()
+            ],
+            "more": len(records) > limit,
+        }
+
+    @api.model
+    def get_filter_labels(self, filter_name, ids, field="name"):
+        """returns the labels of the selected values ``ids`` of the filter
+        ``filter_name``, as the filter widgets show them: their display
+        names, or their ``field``. The access rights and rules of the user
+        apply."""
+        model_name = FILTER_MODELS[filter_name][0]
+        records = self.env[model_name].browse(ids).exists()
+        if field not in LABEL_FIELDS or field == "name":
+            labels = records.name_get()
+        else:
+            labels = [(record.id, record[field]) for record in records]
+        return [{"id": record_id, "text": label} for record_id, label in labels]
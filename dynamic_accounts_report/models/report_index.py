@@ -0,0 +1,117 @@
+# Copyright 2021 Ecosoft Co., Ltd. (http://ecosoft.co.th)
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+import logging
+
+from odoo import api, models
+
+_logger = logging.getLogger(__name__)
+
+# Indexes of account_move_line serving the report queries, by name. An index
+# is renamed when its definition changes, so the former one is dropped.
+REPORT_INDEXES = {
+    # account totals, journal items streamed and paged by date of an account
+    "dynamic_report_aml_account_date_posted_idx": (
+        "(account_id, date, id) WHERE parent_state = 'posted'"
+    ),
+    "dynamic_report_aml_journal_date_posted_idx": (
+        "(journal_id, account_id, date) WHERE parent_state = 'posted'"
+    ),
+    "dynamic_report_aml_operating_unit_date_posted_idx": (
+        "(operating_unit_id, account_id, date) "
+        "WHERE parent_state = 'posted' AND operating_unit_id IS NOT NULL"
+    ),
+    # date ranges of the initial balances and comparison periods, journal
+    # items being mostly inserted in date order
+    "dynamic_report_aml_date_brin_idx": "USING brin (date)",
+}
+REPORT_INDEX_PREFIX = "dynamic_report_aml_"
+
+
+class DynamicReportIndex(models.AbstractModel):
+    """Indexes of the journal items tailored to the report queries.
+
+    The missing indexes are built when the module is installed or upgraded,
+    which locks the journal items against writes meanwhile. On a large
+    database, the reportindex command builds them concurrently beforehand,
+    while the journal items can still be written."""
+
+    _name = "dynamic.report.index"
+    _description = "Dynamic Report Indexes"
+
+    @api.model
+    def _get_existing_indexes(self):
+        """returns whether each index of the module on account_move_line is
+        valid, by name. A concurrent build that failed leaves an invalid
+        index behind."""
+        self.env.cr.execute(
+            """SELECT c.relname, i.indisvalid
+                FROM pg_index i
+                JOIN pg_class c ON (c.oid = i.indexrelid)
+                JOIN pg_class t ON (t.oid = i.indrelid)
+                WHERE t.relname = 'account_move_line' AND c.relname LIKE %s""",
+            (REPORT_INDEX_PREFIX.replace("_", "\\_") + "%",),
+        )
+        return dict(self.env.cr.fetchall())
+
+    def init(self):
+        self._sync_indexes()
+
+    @api.model
+    def _sync_indexes(self, concurrently=False):
+        """Create the missing indexes of REPORT_INDEXES, after dropping the
+        invalid and former ones, returns the names of the created indexes"""
+        cr = self.env.cr
+        option = "CONCURRENTLY " if concurrently else ""
+        created = []
+        existing = self._get_existing_indexes()
+        for name, valid in list(existing.items()):
+            if valid and name in REPORT_INDEXES:
+                continue
+            _logger.info("Dropping index %s", name)
+            cr.execute('DROP INDEX %sIF EXISTS "%s"' % (option, name))
+            del existing[name]
+        for name, definition in REPORT_INDEXES.items():
+            if name in existing:
+                continue
+            _logger.info("Creating index %s", name)
+            cr.execute(
+                'CREATE INDEX %sIF NOT EXISTS "%s" ON account_move_line %s'
+                % (option, name, definition)
+            )
+            created.append(name)
+        return created
+
+    @api.model
+    def create_indexes(self):
+        """Create the missing indexes concurrently, see _sync_indexes().
+
+        The current transaction is committed, the statements run outside
+        of any transaction as PostgreSQL requires."""
+        cr = self.env.cr
+        cr.commit()
+        cr.autocommit(True)
+        try:
+            return self._sync_indexes(concurrently=True)
+        finally:
+            cr.autocommit(False)
+
+    @api.model
+    def get_index_usage(self):
+        """returns the scans, tuples read and size of the indexes of
+        account_move_line since the statistics were reset, the most used
+        first, flagging those of the module"""
+        self.env.cr.execute(
+            """SELECT s.indexrelname AS name,
+                    s.idx_scan AS scans,
+                    s.idx_tup_read AS tuples_read,
+                    s.idx_tup_fetch AS tuples_fetched,
+                    pg_size_pretty(pg_relation_size(s.indexrelid)) AS size
+                FROM pg_stat_user_indexes s
+                WHERE s.relname = 'account_move_line'
+                ORDER BY s.idx_scan DESC, s.indexrelname"""
+        )
+        usage = self.env.cr.dictfetchall()
+        for row in usage:
+            row["report"] = row["name"] in REPORT_INDEXES
+        return usage
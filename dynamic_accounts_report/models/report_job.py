@@ -0,0 +1,461 @@
+# Copyright 2021 Ecosoft Co., Ltd. (http://ecosoft.co.th)
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+import io
+import json
+import logging
+
+import psycopg2
+from dateutil.relativedelta import relativedelta
+
+from odoo import _, api, fields, models
+from odoo.exceptions import UserError
+from odoo.tools import config, date_utils
+
+_logger = logging.getLogger(__name__)
+
+# First key of the advisory locks held by the running jobs, one per slot of
+# the concurrency limit, the second key being the company
+JOB_LOCK_KEY = 0x44524A00
+
+JOB_FILES = {
+    "xlsx": (
+        ".xlsx",
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    ),
+    "csv": (".csv", "text/csv"),
+    "pdf": (".pdf", "application/pdf"),
+}
+
+# Methods the jobs of each report wizard may run
+JOB_METHODS = {
+    "dynamic.balance.sheet.report": ("view_report", "xlsx", "pdf"),
+    "account.general.ledger": ("view_report", "xlsx", "csv"),
+}
+
+
+class JobCancelled(Exception):
+    """Raised in a running job once it is cancelled"""
+
+
+class JobResponse:
+    """Stands for the HTTP response the exports write their file to"""
+
+    def __init__(self):
+        self.headers = {}
+        self.response = None
+
+
+class DynamicReportJob(models.Model):
+    """Reports computed in the background by the report job cron.
+
+    A job runs the report wizard as the user who queued it, records its
+    progress at each stage of the report in its own transactions so the
+    client can poll it, and stores the exported file as an attachment.
+    Each company runs at most dynamic_accounts_report.job_limit jobs at
+    once. The users only read their jobs, the runner updates them.
+
+    The jobs run in the cron workers, whose time limit is
+    limit_time_real_cron. It defaults to the limit_time_real of the HTTP
+    workers, so it must be raised, or set to 0, for the jobs to outlast
+    the requests they replace."""
+
+    _name = "dynamic.report.job"
+    _description = "Dynamic Report Job"
+    _order = "id desc"
+
+    name = fields.Char(
+        required=True,
+        readonly=True,
+    )
+    res_model = fields.Selection(
+        selection=[
+            ("dynamic.balance.sheet.report", "Financial Report"),
+            ("account.general.ledger", "General Ledger"),
+        ],
+        string="Report Model",
+        required=True,
+        readonly=True,
+    )
+    wizard_id = fields.Integer(
+        required=True,
+        readonly=True,
+    )
+    method = fields.Selection(
+        selection=[
+            ("view_report", "View"),
+            ("xlsx", "XLSX"),
+            ("csv", "CSV"),
+            ("pdf", "PDF"),
+        ],
+        required=True,
+        readonly=True,
+    )
+    collapsed_ids = fields.Char(
+        readonly=True,
+        help="JSON list of the ids of the collapsed report lines",
+    )
+    user_id = fields.Many2one(
+        comodel_name="res.users",
+        required=True,
+        readonly=True,
+        default=lambda self: self.env.user,
+        ondelete="cascade",
+    )
+    company_id = fields.Many2one(
+        comodel_name="res.company",
+        required=True,
+        readonly=True,
+        default=lambda self: self.env.company,
+        ondelete="cascade",
+    )
+    company_ids = fields.Many2many(
+        comodel_name="res.company",
+        string="Allowed Companies",
+        readonly=True,
+        default=lambda self: self.env.companies,
+    )
+    state = fields.Selection(
+        selection=[
+            ("queued", "Queued"),
+            ("running", "Running"),
+            ("done", "Done"),
+            ("failed", "Failed"),
+            ("cancel", "Cancelled"),
+        ],
+        required=True,
+        readonly=True,
+        default="queued",
+        index=True,
+    )
+    progress = fields.Integer(
+        readonly=True,
+    )
+    stage = fields.Char(
+        readonly=True,
+    )
+    date_start = fields.Datetime(
+        readonly=True,
+    )
+    date_end = fields.Datetime(
+        readonly=True,
+    )
+    attachment_id = fields.Many2one(
+        comodel_name="ir.attachment",
+        readonly=True,
+        ondelete="set null",
+    )
+    result = fields.Text(
+        readonly=True,
+        help="JSON result of view_report",
+    )
+    error = fields.Text(
+        readonly=True,
+    )
+
+    @api.model
+    def _get_param(self, name, default):
+        return int(
+            self.env["ir.config_parameter"]
+            .sudo()
+            .get_param("dynamic_accounts_report.%s" % name, default)
+        )
+
+    @api.model
+    def create_job(self, res_model, wizard_id, method, title, collapsed_ids=None):
+        """Queue ``method`` of the report wizard ``wizard_id`` and wake the
+        job cron up, returns the id of the job"""
+        if res_model not in JOB_METHODS:
+            raise UserError(_("%s can not run in the background.") % res_model)
+        if method not in JOB_METHODS[res_model]:
+            raise UserError(_("This report can not be exported to %s.") % method)
+        wizard = self.env[res_model].browse(wizard_id).exists()
+        if not wizard:
+            raise UserError(_("The report filters have expired."))
+        wizard.check_access_rule("read")
+        job = self.sudo().create(
+            {
+                "name": title,
+                "res_model": res_model,
+                "wizard_id": wizard.id,
+                "method": method,
+                "collapsed_ids": json.dumps(collapsed_ids or []),
+            }
+        )
+        cron = self.env.ref("dynamic_accounts_report.ir_cron_dynamic_report_job")
+        cron.sudo()._trigger()
+        return job.id
+
+    def get_status(self):
+        """returns the state of the jobs for the client polling them, with the
+        url of the file of the finished exports"""
+        return [
+            {
+                "id": job.id,
+                "state": job.state,
+                "progress": job.progress,
+                "stage": job.stage,
+                "error": job.error,
+                "url": job.attachment_id
+                and "/web/content/%s?download=true" % job.attachment_id.id,
+                "result": job.result and json.loads(job.result),
+            }
+            for job in self
+        ]
+
+    def action_cancel(self):
+        """Cancel the jobs, a running job stops at its next stage"""
+        self.check_access_rule("read")
+        jobs = self.sudo().filtered(lambda job: job.state in ("queued", "running"))
+        jobs.write({"state": "cancel", "date_end": fields.Datetime.now()})
+        return True
+
+    def unlink(self):
+        attachments = self.sudo().mapped("attachment_id")
+        res = super().unlink()
+        attachments.unlink()
+        return res
+
+    def _set_progress(self, progress, stage):
+        """Record the progress of the job in its own transaction, so the
+        client sees it while the job runs, and stop the job once cancelled"""
+        with self.pool.cursor() as cr:
+            cr.execute(
+                """UPDATE dynamic_report_job SET progress = %s, stage = %s
+                    WHERE id = %s AND state = 'running'
+                    RETURNING id""",
+                (progress, stage, self.id),
+            )
+            running = cr.fetchone()
+        if not running:
+            raise JobCancelled()
+
+    @api.model
+    def _run_jobs(self):
+        """Run the queued jobs while the concurrency limit of their company
+        allows it, committing after each of them. Called by the job cron,
+        more jobs run at once by duplicating it."""
+        Job = self.sudo()
+        Job._fail_stale_jobs()
+        while True:
+            job, slot = Job._claim_job()
+            if not job:
+                break
+            if config.get("limit_time_real_cron", -1) < 0 and config["limit_time_real"]:
+                _logger.warning(
+                    "limit_time_real_cron is not set, report job %s is killed "
+                    "after limit_time_real (%ss) like the HTTP requests",
+                    job.id,
+                    config["limit_time_real"],
+                )
+            try:
+                job._run()
+            finally:
+                self.env.cr.execute(
+                    "SELECT pg_advisory_unlock(%s, %s)",
+                    (JOB_LOCK_KEY + slot, job.company_id.id),
+                )
+
+    @api.model
+    def _claim_job(self):
+        """Mark the oldest queued job whose company has a free slot as
+        running, returns it with its slot.
+
+        A slot is a session advisory lock, held as long as the job runs and
+        released with the connection if the worker dies."""
+        cr = self.env.cr
+        limit = max(self._get_param("job_limit", 2), 1)
+        try:
+            cr.execute(
+                """SELECT id, company_id FROM dynamic_report_job
+                    WHERE state = 'queued'
+                    ORDER BY id
+                    FOR UPDATE SKIP LOCKED"""
+            )
+            for job_id, company_id in cr.fetchall():
+                for slot in range(limit):
+                    cr.execute(
+                        "SELECT pg_try_advisory_lock(%s, %s)",
+                        (JOB_LOCK_KEY + slot, company_id),
+                    )
+                    if cr.fetchone()[0]:
+                        break
+                else:
+                    continue
+                job = self.browse(job_id)
+                job.write(
+                    {
+                        "state": "running",
+                        "progress": 0,
+                        "date_start": fields.Datetime.now(),
+                    }
+                )
+                cr.commit()
+                return job, slot
+        except psycopg2.extensions.TransactionRollbackError:
+            # claimed or cancelled meanwhile by a concurrent transaction
+            cr.rollback()
+            self.invalidate_cache()
+            return self._claim_job()
+        cr.commit()
+        return self.browse(), None
+
+    @api.model
+    def _fail_stale_jobs(self):
+        """Fail the jobs running for longer than the job timeout, left over
+        by a killed worker, and drop the jobs of the previous days"""
+        now = fields.Datetime.now()
+        timeout = self._get_param("job_timeout", 6)
+        self.search(
+            [
+                ("state", "=", "running"),
+                ("date_start", "<", now - relativedelta(hours=timeout)),
+            ]
+        ).write({"state": "failed", "error": _("Timed out"), "date_end": now})
+        self.search([("create_date", "<", now - relativedelta(days=1))]).unlink()
+        self.env.cr.commit()
+
+    def _get_job_env(self):
+        """returns the environment of the user who queued the job"""
+        return (
+            self.with_user(self.user_id)
+            .with_context(
+                lang=self.user_id.lang,
+                tz=self.user_id.tz,
+                allowed_company_ids=self.company_ids.ids,
+            )
+            .with_company(self.company_id)
+            .env
+        )
+
+    def _get_stage_progress(self):
+        """returns the progress of the job and its label as each stage of
+        the report starts, by stage, see dynamic.report.query
+        _report_stage()"""
+        return {
+            "cache": (10, _("Computing the report")),
+            "accounts": (20, _("Computing the account balances")),
+            "export": (25, _("Writing the file")),
+            "period_balances": (30, _("Computing the comparison periods")),
+            "account_lines": (35, _("Computing the report lines")),
+            "report_balance": (40, _("Computing the report lines")),
+            "report_lines": (55, _("Computing the report lines")),
+            "journal_items": (60, _("Loading the journal items")),
+            "rollup": (70, _("Summing up the report")),
+            "serialization": (85, _("Preparing the result")),
+            "payload": (85, _("Preparing the result")),
+            "saving": (95, _("Saving the file")),
+        }
+
+    def _run(self):
+        """Run the claimed job and store its result"""
+        self.ensure_one()
+        cr = self.env.cr
+        attachment = self.env["ir.attachment"]
+        stage_progress = self._get_stage_progress()
+        progress = 0
+        label = _("Loading the filters")
+
+        def on_stage(stage):
+            nonlocal progress, label
+            if stage in stage_progress:
+                if stage_progress[stage][0] > progress:
+                    progress, label = stage_progress[stage]
+                # also stops the job once cancelled
+                self._set_progress(progress, label)
+
+        ReportQuery = self.env["dynamic.report.query"]
+        try:
+            self._set_progress(progress, label)
+            wizard = self._get_job_env()[self.res_model].browse(self.wizard_id)
+            if not wizard.exists():
+                raise UserError(
+                    _("The report filters have expired, please run it again.")
+                )
+            values = {"progress": 100, "stage": False}
+            with ReportQuery._report_timings("report_job", listener=on_stage):
+                if self.method == "view_report":
+                    values["result"] = json.dumps(
+                        wizard.view_report([wizard.id], self.name),
+                        default=date_utils.json_default,
+                    )
+                else:
+                    with ReportQuery._report_stage("export"):
+                        output = self._render_file(wizard)
+                    with output, ReportQuery._report_stage("saving"):
+                        attachment = self._save_file(output)
+                    values["attachment_id"] = attachment.id
+            # the progress was committed since the job started, the job is
+            # only updated from a new snapshot
+            cr.commit()
+            self.invalidate_cache()
+            if self.state != "running":
+                raise JobCancelled()
+            values.update(state="done", date_end=fields.Datetime.now())
+            self.write(values)
+            cr.commit()
+        except JobCancelled:
+            cr.rollback()
+            self.invalidate_cache()
+            attachment.exists().unlink()
+            cr.commit()
+        except Exception as e:
+            cr.rollback()
+            _logger.exception("Report job %s failed", self.id)
+            self.invalidate_cache()
+            if self.state == "running":
+                self.write(
+                    {
+                        "state": "failed",
+                        "error": str(e),
+                        "date_end": fields.Datetime.now(),
+                    }
+                )
+            cr.commit()
+
+    def _render_file(self, wizard):
+        """returns the file exported by ``wizard``, open for reading in
+        binary mode"""
+        if self.method == "pdf":
+            report = self.env.ref(
+                "dynamic_accounts_report.action_print_balance_sheet"
+            ).with_env(wizard.env)
+            content, _format = report.with_context(
+                bs_report=True, landscape=True
+            )._render_qweb_pdf(
+                data={
+                    "wizard_id": wizard.id,
+                    "collapsed_ids": json.loads(self.collapsed_ids or "[]"),
+                    "report_name": self.name,
+                }
+            )
+            return io.BytesIO(content)
+        response = JobResponse()
+        if self.method == "csv":
+            wizard.get_dynamic_csv_report(
+                json.dumps([wizard.id]), response, self.name, ""
+            )
+        else:
+            wizard.get_dynamic_xlsx_report(
+                json.dumps([wizard.id]), response, self.name, self.collapsed_ids
+            )
+        # the exports send their temporary file through a FileWrapper
+        return response.response.file
+
+    def _save_file(self, output):
+        """returns an attachment of the job holding the content of the file
+        ``output``"""
+        suffix, mimetype = JOB_FILES[self.method]
+        return (
+            self.env["ir.attachment"]
+            .sudo()
+            .create(
+                {
+                    "name": "%s%s" % (self.name, suffix),
+                    "mimetype": mimetype,
+                    "res_model": self._name,
+                    "res_id": self.id,
+                    "raw": output.read(),
+                }
+            )
+        )
@@ -0,0 +1,19 @@
+# Copyright 2021 Ecosoft Co., Ltd. (http://ecosoft.co.th)
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+
+def compact_rows(rows, exclude=()):
+    """returns ``rows``, a list of dicts, in the compact format of the report
+    responses: the list of the column names and a list of values per row,
+    without the ``exclude`` keys. Missing keys are sent as null."""
+    columns = []
+    seen = set(exclude)
+    for row in rows:
+        for key in row:
+            if key not in seen:
+                seen.add(key)
+                columns.append(key)
+    return {
+        "columns": columns,
+        "rows": [[row.get(column) for column in columns] for row in rows],
+    }
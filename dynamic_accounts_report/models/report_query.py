@@ -0,0 +1,329 @@
+# Copyright 2021 Ecosoft Co., Ltd. (http://ecosoft.co.th)
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+import contextlib
+import hashlib
+import itertools
+import logging
+import re
+import threading
+import time
+import weakref
+
+from odoo import api, models
+
+_logger = logging.getLogger(__name__)
+
+# Names of the statements prepared on each database connection
+_prepared_statements = weakref.WeakKeyDictionary()
+# Suffixes of the server-side cursors, unique per worker
+_cursor_counter = itertools.count()
+
+# Stages of the report the current thread is timing, see _report_timings()
+_timings = threading.local()
+
+# Tables the report queries join to the move lines ``l``, only when one of
+# their columns or filters refers to the alias
+MOVE_LINE_JOINS = {
+    "m": "JOIN account_move m ON (l.move_id = m.id)",
+    "j": "JOIN account_journal j ON (l.journal_id = j.id)",
+    "c": "LEFT JOIN res_currency c ON (l.currency_id = c.id)",
+    "p": "LEFT JOIN res_partner p ON (l.partner_id = p.id)",
+}
+
+
+class ReportTimings:
+    """Stages of a report, with the wall time, the number of queries and
+    the time and rows of the report queries of each. The stages in
+    progress include the report queries run meanwhile."""
+
+    def __init__(self, listener=None):
+        self.stages = []
+        self.open_stages = []
+        # called with the name of each stage as it starts
+        self.listener = listener
+
+    def add_query(self, duration, rows):
+        for stage in self.open_stages:
+            stage["sql_time"] += duration
+            stage["rows"] += rows
+
+
+def _record_query(duration, rows):
+    timings = getattr(_timings, "current", None)
+    if timings is not None:
+        timings.add_query(duration, max(rows, 0))
+
+
+class DynamicReportQuery(models.AbstractModel):
+    """Builds and runs the journal item queries of the dynamic reports.
+
+    Filters are always bound as parameters, ids as arrays with ``= ANY``, so
+    the text of a query only depends on which filters are set and the
+    database can reuse its plans."""
+
+    _name = "dynamic.report.query"
+    _description = "Dynamic Report Query Builder"
+
+    def _get_move_line_where(self, data, account_ids=None):
+        """Return the WHERE clause and its parameters selecting the move lines
+        of ``account_ids`` matching the wizard filters in ``data``.
+        Move lines are aliased ``l``, the state of their journal entries is
+        read from ``l.parent_state``, also in the filters of _query_get(), so
+        they need not be joined.
+
+        Without ``account_ids``, the accounts are selected by the query
+        itself: those of the current company, among the accounts selected
+        on the wizard if any, with one of the selected account tags."""
+        tables, where_clause, where_params = self.env[
+            "account.move.line"
+        ]._query_get()
+        if account_ids is not None:
+            wheres = ["l.account_id = ANY(%s)"]
+            params = [list(account_ids)]
+        else:
+            wheres = ["l.company_id = %s"]
+            params = [self.env.company.id]
+            if data.get("account_ids"):
+                wheres.append("l.account_id = ANY(%s)")
+                params.append(data["account_ids"].ids)
+            if data.get("account_tags"):
+                wheres.append(
+                    """EXISTS (SELECT 1 FROM account_account_account_tag acctag
+                        WHERE acctag.account_account_id = l.account_id
+                        AND acctag.account_account_tag_id = ANY(%s))"""
+                )
+                params.append(data["account_tags"].ids)
+        if where_clause.strip():
+            # _query_get() filters on the state of the journal entries, which
+            # their lines store too
+            where_clause = where_clause.replace(
+                '"account_move_line__move_id"."state"',
+                '"account_move_line"."parent_state"',
+            )
+            wheres.append(
+                where_clause.strip()
+                .replace("account_move_line__move_id", "m")
+                .replace("account_move_line", "l")
+            )
+            params += where_params
+        if data["target_move"] == "posted":
+            wheres.append("l.parent_state = 'posted'")
+        else:
+            wheres.append("l.parent_state IN ('draft', 'posted')")
+        if data["journals"]:
+            wheres.append("l.journal_id = ANY(%s)")
+            params.append(data["journals"].ids)
+        if data["analytics"]:
+            wheres.append("l.analytic_account_id = ANY(%s)")
+            params.append(data["analytics"].ids)
+        if data["analytic_tags"]:
+            wheres.append(
+                """EXISTS (SELECT 1 FROM account_analytic_tag_account_move_line_rel anltag
+                    WHERE anltag.account_move_line_id = l.id
+                    AND anltag.account_analytic_tag_id = ANY(%s))"""
+            )
+            params.append(data["analytic_tags"].ids)
+        if data["operating_units"]:
+            wheres.append("l.operating_unit_id = ANY(%s)")
+            params.append(data["operating_units"].ids)
+        return " AND ".join(wheres), params
+
+    @api.model
+    def _get_move_line_from(self, *clauses):
+        """returns the FROM clause of a query on the move lines ``l``, with
+        the joins of MOVE_LINE_JOINS whose alias one of the SELECT, WHERE or
+        ORDER BY ``clauses`` refers to"""
+        text = " ".join(clauses)
+        joins = [
+            join
+            for alias, join in MOVE_LINE_JOINS.items()
+            if re.search(r'\b%s"?\.' % alias, text)
+        ]
+        return " ".join(["account_move_line l"] + joins)
+
+    def _filter_display_totals(self, totals, display_account):
+        """returns the account ``totals`` listed in the ``display_account``
+        mode, for the totals not filtered by the query itself"""
+        currency = self.env.company.currency_id
+        if display_account == "movement":
+            return {key: row for key, row in totals.items() if row["count"]}
+        if display_account == "not_zero":
+            return {
+                key: row
+                for key, row in totals.items()
+                if not currency.is_zero(row["balance"])
+            }
+        return totals
+
+    def _get_display_accounts(self, accounts, display_account, totals):
+        """returns the accounts to list among ``accounts``, in their order:
+        all of them, or only those with ``totals``, which the query already
+        restricted to the accounts with journal items or with a balance"""
+        if display_account == "all":
+            return accounts
+        return accounts.filtered(lambda account: account.id in totals)
+
+    @api.model
+    def _get_zero_balance_having(self, display_account):
+        """returns the HAVING clause and its parameters leaving out the
+        accounts with a zero balance in the "not_zero" display mode"""
+        if display_account != "not_zero":
+            return "", []
+        return " HAVING ABS(SUM(l.balance)) >= %s", [
+            self.env.company.currency_id.rounding / 2
+        ]
+
+    @contextlib.contextmanager
+    def _report_timings(self, name, listener=None):
+        """Time the report ``name`` computed in the block and its stages,
+        see _report_stage(). Yield the list of the stages, which is logged
+        once the block exits at the level of the
+        dynamic_accounts_report.timing_log_level parameter, DEBUG by
+        default. A report computed within another one is one of its
+        stages.
+
+        ``listener`` is called with the name of each stage as it starts,
+        e.g. to report the progress of a background job."""
+        if getattr(_timings, "current", None) is not None:
+            with self._report_stage(name):
+                yield _timings.current.stages
+            return
+        timings = _timings.current = ReportTimings(listener)
+        try:
+            with self._report_stage(name):
+                yield timings.stages
+        finally:
+            _timings.current = None
+        level = logging.getLevelName(
+            (
+                self.env["ir.config_parameter"]
+                .sudo()
+                .get_param("dynamic_accounts_report.timing_log_level", "DEBUG")
+            ).upper()
+        )
+        if isinstance(level, int) and _logger.isEnabledFor(level):
+            _logger.log(
+                level,
+                "%s timings: %s",
+                name,
+                ", ".join(
+                    "%s %.3fs (%s queries, %.3fs SQL, %s rows)"
+                    % (
+                        stage["stage"],
+                        stage["wall"],
+                        stage["queries"],
+                        stage["sql_time"],
+                        stage["rows"],
+                    )
+                    for stage in timings.stages
+                ),
+            )
+
+    @contextlib.contextmanager
+    def _report_stage(self, name):
+        """Record the block as the stage ``name`` of the report being timed
+        if any: its wall time, its number of queries, and the time and rows
+        fetched of its report queries"""
+        timings = getattr(_timings, "current", None)
+        if timings is None:
+            yield
+            return
+        stage = {
+            "stage": name,
+            "depth": len(timings.open_stages),
+            "wall": 0.0,
+            "queries": 0,
+            "sql_time": 0.0,
+            "rows": 0,
+        }
+        timings.stages.append(stage)
+        timings.open_stages.append(stage)
+        if timings.listener:
+            try:
+                timings.listener(name)
+            except Exception:
+                timings.open_stages.pop()
+                raise
+        cr = self.env.cr
+        queries = cr.sql_log_count
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stage["wall"] = time.perf_counter() - start
+            stage["queries"] = cr.sql_log_count - queries
+            timings.open_stages.pop()
+
+    @api.model
+    def _debug_timings(self):
+        """returns whether view_report() returns its debug_timings, which
+        it does in debug mode only"""
+        return self.user_has_groups("base.group_no_one")
+
+    @api.model
+    def _use_prepared_statements(self):
+        return bool(
+            self.env["ir.config_parameter"]
+            .sudo()
+            .get_param("dynamic_accounts_report.prepared_statements")
+        )
+
+    @api.model
+    def _execute_report_query(self, sql, params):
+        """Execute the report query ``sql`` with ``params``.
+
+        With the dynamic_accounts_report.prepared_statements parameter set,
+        the query is prepared once per database connection and executed
+        from then on, so the database neither parses nor plans it again."""
+        start = time.perf_counter()
+        try:
+            return self._execute_report_statement(sql, params)
+        finally:
+            _record_query(time.perf_counter() - start, self.env.cr.rowcount)
+
+    @api.model
+    def _execute_report_statement(self, sql, params):
+        cr = self.env.cr
+        if not self._use_prepared_statements():
+            return cr.execute(sql, params)
+        name = "dynamic_report_%s" % hashlib.sha1(sql.encode()).hexdigest()[:16]
+        prepared = _prepared_statements.setdefault(cr._cnx, set())
+        if name not in prepared:
+            counter = itertools.count(1)
+            statement = re.sub(
+                r"%([s%])",
+                lambda m: "%" if m.group(1) == "%" else "$%d" % next(counter),
+                sql,
+            )
+            cr.execute("PREPARE {} AS {}".format(name, statement))
+            prepared.add(name)
+        if not params:
+            return cr.execute("EXECUTE {}".format(name))
+        return cr.execute(
+            "EXECUTE {} ({})".format(name, ", ".join(["%s"] * len(params))), params
+        )
+
+    @api.model
+    def _stream_report_query(self, sql, params, batch_size=2000):
+        """Yield the rows of the report query ``sql`` as dicts.
+
+        The rows are fetched ``batch_size`` at a time from a server-side
+        cursor in the current transaction, so only one batch is held in
+        memory whatever the size of the result."""
+        cursor = self.env.cr._cnx.cursor("dynamic_report_%s" % next(_cursor_counter))
+        try:
+            start = time.perf_counter()
+            cursor.execute(sql, params)
+            _record_query(time.perf_counter() - start, 0)
+            while True:
+                start = time.perf_counter()
+                rows = cursor.fetchmany(batch_size)
+                _record_query(time.perf_counter() - start, len(rows))
+                if not rows:
+                    break
+                names = [column[0] for column in cursor.description]
+                for row in rows:
+                    yield dict(zip(names, row))
+        finally:
+            cursor.close()
@@ -0,0 +1,60 @@
+# Copyright 2021 Ecosoft Co., Ltd. (http://ecosoft.co.th)
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+import contextlib
+import csv
+import os
+import tempfile
+
+from werkzeug.wsgi import FileWrapper
+
+from odoo import models
+
+try:
+    from odoo.tools.misc import xlsxwriter
+except ImportError:
+    import xlsxwriter
+
+# Size of the chunks of the exported files sent to the client
+XLSX_CHUNK_SIZE = 64 * 1024
+
+
+class DynamicReportXlsx(models.AbstractModel):
+    _name = "dynamic.report.xlsx"
+    _description = "Dynamic Report XLSX and CSV Export"
+
+    @contextlib.contextmanager
+    def _open_export_file(self, response, suffix):
+        """Yield the path of a temporary file, which is sent as the body of
+        ``response`` in chunks once the block exits, without ever being
+        loaded in memory"""
+        fd, path = tempfile.mkstemp(prefix="dynamic_report_", suffix=suffix)
+        os.close(fd)
+        try:
+            yield path
+            # the file is removed once sent, as the open handle keeps it
+            output = open(path, "rb")
+        finally:
+            os.unlink(path)
+        response.headers["Content-Length"] = os.fstat(output.fileno()).st_size
+        response.response = FileWrapper(output, XLSX_CHUNK_SIZE)
+
+    @contextlib.contextmanager
+    def _open_workbook(self, response):
+        """Yield an xlsxwriter workbook in constant memory mode, which is
+        sent as the body of ``response`` once the block exits.
+
+        Rows are flushed to a temporary file as soon as a later row is
+        written, so they must be written in order."""
+        with self._open_export_file(response, ".xlsx") as path:
+            workbook = xlsxwriter.Workbook(path, {"constant_memory": True})
+            yield workbook
+            workbook.close()
+
+    @contextlib.contextmanager
+    def _open_csv_writer(self, response):
+        """Yield a csv writer whose rows are sent as the body of
+        ``response`` once the block exits"""
+        with self._open_export_file(response, ".csv") as path:
+            with open(path, "w", newline="", encoding="utf-8") as output:
+                yield csv.writer(output)
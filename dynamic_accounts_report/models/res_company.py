@@ -0,0 +1,14 @@
+# Copyright 2021 Ecosoft Co., Ltd. (http://ecosoft.co.th)
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo import models
+
+
+class ResCompany(models.Model):
+    _inherit = "res.company"
+
+    def write(self, vals):
+        res = super().write(vals)
+        if "fiscalyear_lock_date" in vals:
+            self.env["dynamic.report.checkpoint"]._unlink_unlocked(self)
+        return res
@@ -10,14 +10,23 @@ class InsReportBalanceSheet(models.AbstractModel):
     @api.model
     def _get_report_values(self, docids, data=None):
         if self.env.context.get("bs_report"):
-            if data.get("report_data"):
+            report_data = data.get("report_data")
+            if data.get("wizard_id"):
+                # computed from the wizard, or taken from the cached result
+                report_data = self.env["dynamic.balance.sheet.report"]._get_print_data(
+                    [data["wizard_id"]],
+                    data.get("report_name"),
+                    data.get("collapsed_ids"),
+                )
+            if report_data:
                 data.update(
                     {
-                        "Filters": data.get("report_data")["filters"],
-                        "account_data": data.get("report_data")["report_lines"],
-                        "report_lines": data.get("report_data")["bs_lines"],
+                        "Filters": report_data["filters"],
+                        "account_data": report_data["report_lines"],
+                        "report_lines": report_data["bs_lines"],
+                        "periods": report_data.get("periods", []),
                         "report_name": data.get("report_name"),
-                        "title": data.get("report_data")["name"],
+                        "title": report_data["name"],
                         "company": self.env.company,
                     }
                 )
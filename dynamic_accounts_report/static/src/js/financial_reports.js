@@ -3,9 +3,11 @@ odoo.define("dynamic_accounts_report.financial_reports", function (require) {
     var AbstractAction = require("web.AbstractAction");
     var core = require("web.core");
     var rpc = require("web.rpc");
+    var ReportJobMixin = require("dynamic_accounts_report.report_job");
+    var decodeRows = require("dynamic_accounts_report.report_payload").decodeRows;
     var QWeb = core.qweb;
 
-    var ProfitAndLoss = AbstractAction.extend({
+    var ProfitAndLoss = AbstractAction.extend(ReportJobMixin, {
         template: "dfr_template_new",
         events: {
             "click #apply_filter": "apply_filter",
@@ -14,6 +16,7 @@ odoo.define("dynamic_accounts_report.financial_reports", function (require) {
             "click .show-gl": "show_gl",
             "click .show-account": "show_account",
             "click .hide-account": "hide_account",
+            "click .report-job-cancel": "cancel_report_job",
         },
 
         init: function (parent, action) {
@@ -36,15 +39,34 @@ odoo.define("dynamic_accounts_report.financial_reports", function (require) {
             });
         },
 
+        fetch_report: function () {
+            var report;
+            if (this.is_background()) {
+                report = this.run_report_job(
+                    "dynamic.balance.sheet.report",
+                    "view_report"
+                ).then(function (status) {
+                    return status.result;
+                });
+            } else {
+                report = this._rpc({
+                    model: "dynamic.balance.sheet.report",
+                    method: "view_report",
+                    args: [[this.wizard_id], this._title],
+                    kwargs: {compact: true},
+                });
+            }
+            return report.then(function (datas) {
+                datas.report_lines = decodeRows(datas.report_lines);
+                datas.bs_lines = decodeRows(datas.bs_lines);
+                return datas;
+            });
+        },
+
         load_data: function (initial_render = true) {
             var self = this;
-            var action_title = self._title;
             try {
-                self._rpc({
-                    model: "dynamic.balance.sheet.report",
-                    method: "view_report",
-                    args: [[self.wizard_id], action_title],
-                }).then(function (datas) {
+                self.fetch_report().then(function (datas) {
                     if (initial_render) {
                         self.$(".filter_view_dfr").html(
                             QWeb.render("DfrFilterView", {
@@ -52,30 +74,34 @@ odoo.define("dynamic_accounts_report.financial_reports", function (require) {
                                 title: datas.name,
                             })
                         );
-                        self.$el.find(".journals").select2({
-                            placeholder: "Journals...",
-                        });
-                        self.$el.find(".account").select2({
-                            placeholder: "Accounts...",
-                        });
-                        self.$el.find(".account-tag").select2({
-                            placeholder: "Account Tag...",
-                        });
-                        self.$el.find(".analytics").select2({
-                            placeholder: "Analytic Accounts...",
-                        });
-                        self.$el.find(".analytic-tag").select2({
-                            placeholder: "Analytic Tag...",
-                        });
+                        self.init_filter_widget(".journals", "journals", "Journals...");
+                        self.init_filter_widget(".account", "accounts", "Accounts...");
+                        self.init_filter_widget(
+                            ".account-tag",
+                            "account_tags",
+                            "Account Tag..."
+                        );
+                        self.init_filter_widget(
+                            ".analytics",
+                            "analytics",
+                            "Analytic Accounts..."
+                        );
+                        self.init_filter_widget(
+                            ".analytic-tag",
+                            "analytic_tags",
+                            "Analytic Tag..."
+                        );
                         self.$el.find(".target_move").select2({
                             placeholder: "Target Move...",
                         });
                         self.$el.find(".debit_credit").select2({
                             placeholder: "Debit/Credit...",
                         });
-                        self.$el.find(".operating-units").select2({
-                            placeholder: "Operating Units...",
-                        });
+                        self.init_filter_widget(
+                            ".operating-units",
+                            "operating_units",
+                            "Operating Units..."
+                        );
                     }
                     self.$(".table_view_dfr").html(
                         QWeb.render("dfr_table", {
@@ -86,6 +112,7 @@ odoo.define("dynamic_accounts_report.financial_reports", function (require) {
                             debit_total: datas.debit_total,
                             debit_balance: datas.debit_balance,
                             bs_lines: datas.bs_lines,
+                            periods: datas.periods,
                         })
                     );
                 });
@@ -94,6 +121,57 @@ odoo.define("dynamic_accounts_report.financial_reports", function (require) {
             }
         },
 
+        /**
+         * The options of the filter are searched on the server as the user
+         * types, a page at a time, instead of being sent with the report.
+         */
+        init_filter_widget: function (selector, filter_name, placeholder) {
+            var self = this;
+            var page_size = 40;
+            this.$el.find(selector).select2({
+                placeholder: placeholder,
+                multiple: true,
+                query: function (query) {
+                    self._rpc({
+                        model: "dynamic.balance.sheet.report",
+                        method: "search_filter_options",
+                        args: [
+                            [self.wizard_id],
+                            filter_name,
+                            query.term,
+                            (query.page - 1) * page_size,
+                            page_size,
+                        ],
+                    }).then(function (options) {
+                        query.callback(options);
+                    });
+                },
+                initSelection: function (element, callback) {
+                    var ids = _.map(element.val().split(","), function (id) {
+                        return parseInt(id, 10);
+                    });
+                    self._rpc({
+                        model: "dynamic.balance.sheet.report",
+                        method: "get_filter_labels",
+                        args: [filter_name, ids],
+                    }).then(callback);
+                },
+            });
+        },
+
+        /**
+         * Return the ids selected in the filter, and show their labels.
+         */
+        read_filter_widget: function (selector, res_id) {
+            var selected = this.$(selector).select2("data") || [];
+            var res = document.getElementById(res_id);
+            res.value = _.uniq(_.pluck(selected, "text"));
+            res.innerHTML = selected.length ? res.value : "";
+            return _.map(selected, function (option) {
+                return parseInt(option.id, 10);
+            });
+        },
+
         show_gl: function (e) {
             var self = this;
             var account_id = $(e.target).attr("data-account-id");
@@ -124,205 +202,99 @@ odoo.define("dynamic_accounts_report.financial_reports", function (require) {
                 .addClass("fa-caret-right show-account");
         },
 
-        remove_bs_lines: function (data) {
+        get_collapsed_ids: function () {
             var r_ids = [];
             $(".show-account").each(function () {
                 r_ids.push($(this).data("r-id"));
             });
-            data.bs_lines = data.bs_lines.filter((line) => {
-                return !r_ids.includes(line.p_id);
-            });
-            return data;
+            return r_ids;
         },
 
         print_pdf: function (e) {
             e.preventDefault();
             var self = this;
             var action_title = self._title;
-            self._rpc({
-                model: "dynamic.balance.sheet.report",
-                method: "view_report",
-                args: [[self.wizard_id], action_title],
-            }).then(function (data) {
-                var action = {
-                    type: "ir.actions.report",
-                    report_type: "qweb-pdf",
-                    report_name: "dynamic_accounts_report.balance_sheet",
-                    report_file: "dynamic_accounts_report.balance_sheet",
-                    data: {
-                        report_data: self.remove_bs_lines(data),
-                        report_name: action_title,
-                    },
-                    context: {
-                        active_model: "dynamic.balance.sheet.report",
-                        landscape: 1,
-                        bs_report: true,
-                    },
-                    display_name: action_title,
-                };
-                return self.do_action(action);
-            });
+            if (self.is_background()) {
+                return self.download_report_job(
+                    "dynamic.balance.sheet.report",
+                    "pdf",
+                    self.get_collapsed_ids()
+                );
+            }
+            // The server prints the report of the wizard, reusing its result
+            var action = {
+                type: "ir.actions.report",
+                report_type: "qweb-pdf",
+                report_name: "dynamic_accounts_report.balance_sheet",
+                report_file: "dynamic_accounts_report.balance_sheet",
+                data: {
+                    wizard_id: self.wizard_id,
+                    collapsed_ids: self.get_collapsed_ids(),
+                    report_name: action_title,
+                },
+                context: {
+                    active_model: "dynamic.balance.sheet.report",
+                    landscape: 1,
+                    bs_report: true,
+                },
+                display_name: action_title,
+            };
+            return self.do_action(action);
         },
 
         print_xlsx: function () {
             var self = this;
             var action_title = self._title;
-            self._rpc({
-                model: "dynamic.balance.sheet.report",
-                method: "view_report",
-                args: [[self.wizard_id], action_title],
-            }).then(function (data) {
-                var action = {
-                    type: "ir_actions_dynamic_xlsx_download",
-                    data: {
-                        model: "dynamic.balance.sheet.report",
-                        options: JSON.stringify(data.filters),
-                        output_format: "xlsx",
-                        report_data: action_title,
-                        report_name: action_title,
-                        dfr_data: JSON.stringify(self.remove_bs_lines(data).bs_lines),
-                    },
-                };
-                return self.do_action(action);
-            });
+            if (self.is_background()) {
+                return self.download_report_job(
+                    "dynamic.balance.sheet.report",
+                    "xlsx",
+                    self.get_collapsed_ids()
+                );
+            }
+            var action = {
+                type: "ir_actions_dynamic_xlsx_download",
+                data: {
+                    model: "dynamic.balance.sheet.report",
+                    options: JSON.stringify([self.wizard_id]),
+                    output_format: "xlsx",
+                    report_data: action_title,
+                    report_name: action_title,
+                    dfr_data: JSON.stringify(self.get_collapsed_ids()),
+                },
+            };
+            return self.do_action(action);
         },
 
         apply_filter: function (event) {
             event.preventDefault();
             var self = this;
-            var i = 0;
             self.initial_render = false;
             var filter_data_selected = {};
-            // Accounts
-            var account_ids = [];
-            var account_text = [];
-            var account_res = document.getElementById("acc_res");
-            var account_list = $(".account").select2("data");
-            for (i = 0; i < account_list.length; i++) {
-                if (account_list[i].element[0].selected === true) {
-                    account_ids.push(parseInt(account_list[i].id, 10));
-                    if (account_text.includes(account_list[i].text) === false) {
-                        account_text.push(account_list[i].text);
-                    }
-                    account_res.value = account_text;
-                    account_res.innerHTML = account_res.value;
-                }
-            }
-            if (account_list.length === 0) {
-                account_res.value = "";
-                account_res.innerHTML = "";
-            }
-            filter_data_selected.account_ids = account_ids;
-
-            // Journals
-            var journal_ids = [];
-            var journal_text = [];
-            var journal_res = document.getElementById("journal_res");
-            var journal_list = $(".journals").select2("data");
-            for (i = 0; i < journal_list.length; i++) {
-                if (journal_list[i].element[0].selected === true) {
-                    journal_ids.push(parseInt(journal_list[i].id, 10));
-                    if (journal_text.includes(journal_list[i].text) === false) {
-                        journal_text.push(journal_list[i].text);
-                    }
-                    journal_res.value = journal_text;
-                    journal_res.innerHTML = journal_res.value;
-                }
-            }
-            if (journal_list.length === 0) {
-                journal_res.value = "";
-                journal_res.innerHTML = "";
-            }
-            filter_data_selected.journal_ids = journal_ids;
-
-            // Account Tags
-            var account_tag_ids = [];
-            var account_tag_text = [];
-            var account_tag_res = document.getElementById("acc_tag_res");
-            var account_tag_list = $(".account-tag").select2("data");
-            for (i = 0; i < account_tag_list.length; i++) {
-                if (account_tag_list[i].element[0].selected === true) {
-                    account_tag_ids.push(parseInt(account_tag_list[i].id, 10));
-                    if (account_tag_text.includes(account_tag_list[i].text) === false) {
-                        account_tag_text.push(account_tag_list[i].text);
-                    }
-                    account_tag_res.value = account_tag_text;
-                    account_tag_res.innerHTML = account_tag_res.value;
-                }
-            }
-            if (account_tag_list.length === 0) {
-                account_tag_res.value = "";
-                account_tag_res.innerHTML = "";
-            }
-            filter_data_selected.account_tag_ids = account_tag_ids;
-
-            // Analytic Accounts
-            var analytic_ids = [];
-            var analytic_text = [];
-            var analytic_res = document.getElementById("analytic_res");
-            var analytic_list = $(".analytics").select2("data");
-            for (i = 0; i < analytic_list.length; i++) {
-                if (analytic_list[i].element[0].selected === true) {
-                    analytic_ids.push(parseInt(analytic_list[i].id, 10));
-                    if (analytic_text.includes(analytic_list[i].text) === false) {
-                        analytic_text.push(analytic_list[i].text);
-                    }
-                    analytic_res.value = analytic_text;
-                    analytic_res.innerHTML = analytic_res.value;
-                }
-            }
-            if (analytic_list.length === 0) {
-                analytic_res.value = "";
-                analytic_res.innerHTML = "";
-            }
-            filter_data_selected.analytic_ids = analytic_ids;
-
-            // Analytic Tags
-            var analytic_tag_ids = [];
-            var analytic_tag_text = [];
-            var analytic_tag_res = document.getElementById("analic_tag_res");
-            var analytic_tag_list = $(".analytic-tag").select2("data");
-            for (i = 0; i < analytic_tag_list.length; i++) {
-                if (analytic_tag_list[i].element[0].selected === true) {
-                    analytic_tag_ids.push(parseInt(analytic_tag_list[i].id, 10));
-                    if (
-                        analytic_tag_text.includes(analytic_tag_list[i].text) === false
-                    ) {
-                        analytic_tag_text.push(analytic_tag_list[i].text);
-                    }
-                    analytic_tag_res.value = analytic_tag_text;
-                    analytic_tag_res.innerHTML = analytic_tag_res.value;
-                }
-            }
-            if (analytic_tag_list.length === 0) {
-                analytic_tag_res.value = "";
-                analytic_tag_res.innerHTML = "";
-            }
-            filter_data_selected.analytic_tag_ids = analytic_tag_ids;
-
-            // Operating Units
-            var operating_unit_ids = [];
-            var operating_unit_text = [];
-            var operating_unit_res = document.getElementById("operating_unit_res");
-            var operating_unit_list = $(".operating-units").select2("data");
-            for (i = 0; i < operating_unit_list.length; i++) {
-                if (operating_unit_list[i].element[0].selected === true) {
-                    operating_unit_ids.push(parseInt(operating_unit_list[i].id, 10));
-                    if (
-                        operating_unit_text.includes(operating_unit_list[i].text) ===
-                        false
-                    ) {
-                        operating_unit_text.push(operating_unit_list[i].text);
-                    }
-                    operating_unit_res.value = operating_unit_text;
-                    operating_unit_res.innerHTML = operating_unit_res.value;
-                }
-            }
-            if (operating_unit_list.length === 0) {
-                operating_unit_res.value = "";
-                operating_unit_res.innerHTML = "";
-            }
-            filter_data_selected.operating_unit_ids = operating_unit_ids;
+            filter_data_selected.account_ids = self.read_filter_widget(
+                "input.account",
+                "acc_res"
+            );
+            filter_data_selected.journal_ids = self.read_filter_widget(
+                "input.journals",
+                "journal_res"
+            );
+            filter_data_selected.account_tag_ids = self.read_filter_widget(
+                "input.account-tag",
+                "acc_tag_res"
+            );
+            filter_data_selected.analytic_ids = self.read_filter_widget(
+                "input.analytics",
+                "analytic_res"
+            );
+            filter_data_selected.analytic_tag_ids = self.read_filter_widget(
+                "input.analytic-tag",
+                "analic_tag_res"
+            );
+            filter_data_selected.operating_unit_ids = self.read_filter_widget(
+                "input.operating-units",
+                "operating_unit_res"
+            );
 
             // Date Range
             var dateString = "";
@@ -335,6 +307,13 @@ odoo.define("dynamic_accounts_report.financial_reports", function (require) {
                 filter_data_selected.date_to = dateString;
             }
 
+            // Comparison
+            if ($("#comparison").length) {
+                filter_data_selected.comparison = $("#comparison").val();
+                filter_data_selected.comparison_periods =
+                    parseInt($("#comparison_periods").val(), 10) || 1;
+            }
+
             // Target Move
             if ($(".target_move").length) {
                 var post_res = document.getElementById("post_res");
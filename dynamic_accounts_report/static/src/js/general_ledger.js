@@ -3,13 +3,19 @@ odoo.define("dynamic_accounts_report.general_ledger", function (require) {
     var AbstractAction = require("web.AbstractAction");
     var core = require("web.core");
     var rpc = require("web.rpc");
+    var ReportJobMixin = require("dynamic_accounts_report.report_job");
+    var decodeRows = require("dynamic_accounts_report.report_payload").decodeRows;
     var QWeb = core.qweb;
 
-    var GeneralLedger = AbstractAction.extend({
+    var GeneralLedger = AbstractAction.extend(ReportJobMixin, {
         template: "GeneralTemp",
         events: {
             "click .gl-line": "show_drop_down",
             "click .view-account-move": "view_acc_move",
+            "click .gl-load-more": "load_more_lines",
+            "click #xlsx": "print_xlsx",
+            "click #csv": "print_csv",
+            "click .report-job-cancel": "cancel_report_job",
         },
 
         init: function (parent, action) {
@@ -32,15 +38,33 @@ odoo.define("dynamic_accounts_report.general_ledger", function (require) {
             });
         },
 
+        fetch_report: function () {
+            var report;
+            if (this.is_background()) {
+                report = this.run_report_job(
+                    "account.general.ledger",
+                    "view_report"
+                ).then(function (status) {
+                    return status.result;
+                });
+            } else {
+                report = this._rpc({
+                    model: "account.general.ledger",
+                    method: "view_report",
+                    args: [[this.wizard_id], this._title],
+                    kwargs: {compact: true},
+                });
+            }
+            return report.then(function (datas) {
+                datas.report_lines = decodeRows(datas.report_lines);
+                return datas;
+            });
+        },
+
         load_data: function () {
             var self = this;
-            var action_title = self._title;
             try {
-                self._rpc({
-                    model: "account.general.ledger",
-                    method: "view_report",
-                    args: [[self.wizard_id], action_title],
-                }).then(function (datas) {
+                self.fetch_report().then(function (datas) {
                     _.each(datas.report_lines, function (rep_lines) {
                         rep_lines.debit = self.format_currency(
                             datas.currency,
@@ -82,64 +106,128 @@ odoo.define("dynamic_accounts_report.general_ledger", function (require) {
             return formatted_value;
         },
 
+        format_move_lines: function (currency, move_lines) {
+            var self = this;
+            _.each(move_lines, function (move_line) {
+                move_line.debit = self.format_currency(currency, move_line.debit);
+                move_line.credit = self.format_currency(currency, move_line.credit);
+                move_line.balance = self.format_currency(currency, move_line.balance);
+            });
+            return move_lines;
+        },
+
+        fetch_account_lines: function (account_id, after) {
+            return this._rpc({
+                model: "account.general.ledger",
+                method: "view_account_lines",
+                args: [[this.wizard_id], account_id, after || false],
+                kwargs: {compact: true},
+            }).then(function (data) {
+                data.move_lines = decodeRows(data.move_lines);
+                return data;
+            });
+        },
+
         show_drop_down: function (event) {
             event.preventDefault();
             var self = this;
             var account_id = $(event.currentTarget).data("account-id");
             var td = $(event.currentTarget).next("tr").find("td");
             if (td.length === 1) {
-                var action_title = self._title;
-                self._rpc({
-                    model: "account.general.ledger",
-                    method: "view_report",
-                    args: [[self.wizard_id], action_title],
-                }).then(function (data) {
-                    _.each(data.report_lines, function (rep_lines) {
-                        _.each(rep_lines.move_lines, function (move_line) {
-                            move_line.debit = self.format_currency(
-                                data.currency,
-                                move_line.debit
-                            );
-                            move_line.credit = self.format_currency(
-                                data.currency,
-                                move_line.credit
-                            );
-                            move_line.balance = self.format_currency(
-                                data.currency,
-                                move_line.balance
-                            );
-                        });
-                    });
-
-                    for (var i = 0; i < data.report_lines.length; i++) {
-                        if (account_id === data.report_lines[i].id) {
-                            $(event.currentTarget)
-                                .next("tr")
-                                .find("td .gl-table-div")
-                                .remove();
-                            $(event.currentTarget)
-                                .next("tr")
-                                .find("td ul")
-                                .after(
-                                    QWeb.render("SubSection", {
-                                        account_data: data.report_lines[i].move_lines,
-                                        currency_symbol: data.currency[0],
-                                        currency_position: data.currency[1],
-                                    })
-                                );
-                            $(event.currentTarget)
-                                .next("tr")
-                                .find("td ul li:first a")
-                                .css({
-                                    "background-color": "#00ede8",
-                                    "font-weight": "bold",
-                                });
-                        }
+                self.fetch_account_lines(account_id).then(function (data) {
+                    var move_lines = data.move_lines;
+                    if (data.initial_balance) {
+                        move_lines = [data.initial_balance].concat(move_lines);
                     }
+                    $(event.currentTarget)
+                        .next("tr")
+                        .find("td .gl-table-div")
+                        .remove();
+                    $(event.currentTarget)
+                        .next("tr")
+                        .find("td ul")
+                        .after(
+                            QWeb.render("SubSection", {
+                                account_id: account_id,
+                                account_data: self.format_move_lines(
+                                    data.currency,
+                                    move_lines
+                                ),
+                                currency_symbol: data.currency[0],
+                                currency_position: data.currency[1],
+                                next: data.next,
+                            })
+                        );
+                    $(event.currentTarget)
+                        .next("tr")
+                        .find("td ul li:first a")
+                        .css({
+                            "background-color": "#00ede8",
+                            "font-weight": "bold",
+                        });
                 });
             }
         },
 
+        load_more_lines: function (event) {
+            event.preventDefault();
+            event.stopPropagation();
+            var self = this;
+            var $more = $(event.currentTarget).closest("tr");
+            var account_id = $(event.currentTarget).data("account-id");
+            var after = {
+                date: $(event.currentTarget).data("next-date"),
+                id: $(event.currentTarget).data("next-id"),
+                balance: $(event.currentTarget).data("next-balance"),
+            };
+            self.fetch_account_lines(account_id, after).then(function (data) {
+                $more.replaceWith(
+                    QWeb.render("SubSectionRows", {
+                        account_id: account_id,
+                        account_data: self.format_move_lines(
+                            data.currency,
+                            data.move_lines
+                        ),
+                        currency_symbol: data.currency[0],
+                        currency_position: data.currency[1],
+                        next: data.next,
+                    })
+                );
+            });
+        },
+
+        export_report: function (output_format) {
+            // The server reads the journal items for the wizard filters
+            var action_title = this._title;
+            if (this.is_background()) {
+                return this.download_report_job(
+                    "account.general.ledger",
+                    output_format
+                );
+            }
+            return this.do_action({
+                type: "ir_actions_dynamic_xlsx_download",
+                data: {
+                    model: "account.general.ledger",
+                    options: JSON.stringify([this.wizard_id]),
+                    output_format: output_format,
+                    report_data: action_title,
+                    report_name: action_title,
+                    dfr_data: "",
+                },
+            });
+        },
+
+        print_xlsx: function (event) {
+            event.preventDefault();
+            return this.export_report("xlsx");
+        },
+
+        print_csv: function (event) {
+            event.preventDefault();
+            return this.export_report("csv");
+        },
+
         view_acc_move: function (event) {
             event.preventDefault();
             var self = this;
@@ -0,0 +1,110 @@
+odoo.define("dynamic_accounts_report.report_job", function (require) {
+    "use strict";
+    var core = require("web.core");
+    var session = require("web.session");
+    var _t = core._t;
+
+    // Delay between two polls of a report job, in milliseconds
+    var POLL_DELAY = 2000;
+
+    /**
+     * Mixin of the report actions running their reports as background jobs.
+     * The action shows the progress of the job in its .report_job_status
+     * element, with a link to cancel it.
+     */
+    var ReportJobMixin = {
+        is_background: function () {
+            return this.$(".report_background").is(":checked");
+        },
+
+        /**
+         * Queue the job and poll it until it ends. Resolves with its status
+         * once done, rejects when it failed or was cancelled.
+         */
+        run_report_job: function (res_model, method, collapsed_ids) {
+            var self = this;
+            return this._rpc({
+                model: "dynamic.report.job",
+                method: "create_job",
+                args: [
+                    res_model,
+                    this.wizard_id,
+                    method,
+                    this._title,
+                    collapsed_ids || [],
+                ],
+            }).then(function (job_id) {
+                self.job_id = job_id;
+                return new Promise(function (resolve, reject) {
+                    var poll = function () {
+                        self._rpc({
+                            model: "dynamic.report.job",
+                            method: "get_status",
+                            args: [[job_id]],
+                        }).then(function (statuses) {
+                            var status = statuses[0];
+                            self.render_job_status(status);
+                            if (status.state === "done") {
+                                resolve(status);
+                            } else if (
+                                status.state === "failed" ||
+                                status.state === "cancel"
+                            ) {
+                                reject(status);
+                            } else {
+                                setTimeout(poll, POLL_DELAY);
+                            }
+                        }, reject);
+                    };
+                    poll();
+                });
+            });
+        },
+
+        /**
+         * Run the export in the background and download its file.
+         */
+        download_report_job: function (res_model, method, collapsed_ids) {
+            return this.run_report_job(res_model, method, collapsed_ids).then(
+                function (status) {
+                    return new Promise(function (resolve, reject) {
+                        session.get_file({
+                            url: status.url,
+                            success: resolve,
+                            error: reject,
+                        });
+                    });
+                }
+            );
+        },
+
+        render_job_status: function (status) {
+            var $status = this.$(".report_job_status").empty();
+            if (status.state === "queued" || status.state === "running") {
+                $status.text(
+                    _.str.sprintf(
+                        "%s (%s%%) ",
+                        status.stage || _t("Queued"),
+                        status.progress
+                    )
+                );
+                $status.append(
+                    $("<a href='#' class='report-job-cancel'/>").text(_t("Cancel"))
+                );
+            } else if (status.state === "failed") {
+                $status.text(status.error);
+            }
+        },
+
+        cancel_report_job: function (event) {
+            event.preventDefault();
+            return this._rpc({
+                model: "dynamic.report.job",
+                method: "action_cancel",
+                args: [[this.job_id]],
+            });
+        },
+    };
+
+    return ReportJobMixin;
+});
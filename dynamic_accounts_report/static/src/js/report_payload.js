@@ -0,0 +1,21 @@
+odoo.define("dynamic_accounts_report.report_payload", function () {
+    "use strict";
+
+    /**
+     * Decode the rows of a report response sent in the compact format,
+     * {columns: [...], rows: [[...], ...]}, to a list of objects. Rows sent
+     * as a list of objects are returned as they are.
+     */
+    function decodeRows(table) {
+        if (!table || _.isArray(table)) {
+            return table || [];
+        }
+        return _.map(table.rows, function (row) {
+            return _.object(table.columns, row);
+        });
+    }
+
+    return {
+        decodeRows: decodeRows,
+    };
+});
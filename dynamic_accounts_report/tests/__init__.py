@@ -0,0 +1,13 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from . import test_balance_sheet
+from . import test_checkpoint
+from . import test_daily_balance
+from . import test_financial_report
+from . import test_general_ledger
+from . import test_query_count
+from . import test_report_cache
+from . import test_report_filter
+from . import test_report_job
+from . import test_report_payload
+from . import test_report_query
@@ -0,0 +1,87 @@
+# Copyright 2021 Ecosoft Co., Ltd. (http://ecosoft.co.th)
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo.tests.common import TransactionCase
+
+
+class DynamicReportCase(TransactionCase):
+    """Journal entries of a dedicated journal and accounts, for the report
+    tests"""
+
+    def setUp(self):
+        super().setUp()
+        self.company = self.env.company
+        self.journal = self.env["account.journal"].create(
+            {
+                "name": "Dynamic Report Test",
+                "code": "DRT",
+                "type": "general",
+                "company_id": self.company.id,
+            }
+        )
+        self.type_current_assets = self.env.ref(
+            "account.data_account_type_current_assets"
+        )
+        self.type_revenue = self.env.ref("account.data_account_type_revenue")
+        self.account_counterpart = self._create_account(
+            "DRT000", "Counterpart", self.type_current_assets
+        )
+
+    def _create_account(self, code, name, user_type, **vals):
+        vals.update(
+            {
+                "code": code,
+                "name": name,
+                "user_type_id": user_type.id,
+                "company_id": self.company.id,
+            }
+        )
+        return self.env["account.account"].create(vals)
+
+    def _create_move(self, date, amounts, post=True):
+        """Create a journal entry on ``date`` with a line of each (account,
+        amount) of ``amounts``, debit when the amount is positive, balanced
+        on the counterpart account"""
+        line_vals = [
+            (
+                0,
+                0,
+                {
+                    "account_id": account.id,
+                    "name": "%s %s" % (account.code, amount),
+                    "debit": amount > 0 and amount or 0.0,
+                    "credit": amount < 0 and -amount or 0.0,
+                },
+            )
+            for account, amount in amounts
+        ]
+        total = round(sum(amount for __, amount in amounts), 2)
+        line_vals.append(
+            (
+                0,
+                0,
+                {
+                    "account_id": self.account_counterpart.id,
+                    "name": "Counterpart",
+                    "debit": total < 0 and -total or 0.0,
+                    "credit": total > 0 and total or 0.0,
+                },
+            )
+        )
+        move = self.env["account.move"].create(
+            {
+                "move_type": "entry",
+                "journal_id": self.journal.id,
+                "date": date,
+                "line_ids": line_vals,
+            }
+        )
+        if post:
+            move.action_post()
+        return move
+
+    def _create_general_ledger(self, **vals):
+        vals.setdefault("journal_ids", [(6, 0, self.journal.ids)])
+        vals.setdefault("target_move", "posted")
+        vals.setdefault("display_account", "movement")
+        return self.env["account.general.ledger"].create(vals)
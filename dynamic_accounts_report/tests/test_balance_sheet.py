@@ -0,0 +1,374 @@
+# Copyright 2021 Ecosoft Co., Ltd. (http://ecosoft.co.th)
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+import copy
+from unittest.mock import patch
+
+from odoo import fields
+from odoo.tests import tagged
+
+from .common import DynamicReportCase
+
+
+def get_parents_rollup(records, report_lines):
+    """returns the lines to show with their debit, credit and balance, as
+    the get_parents/filter_sum passes replaced by _rollup_report_lines()
+    computed them"""
+    move_line_accounts = []
+    move_lines_dict = {}
+    for rec in records["Accounts"]:
+        move_line_accounts.append(rec["code"])
+        move_lines_dict[rec["code"]] = {}
+        move_lines_dict[rec["code"]]["debit"] = rec["debit"]
+        move_lines_dict[rec["code"]]["credit"] = rec["credit"]
+        move_lines_dict[rec["code"]]["balance"] = rec["balance"]
+
+    report_lines_move = []
+    parent_list = []
+    for each in report_lines:
+        if each["report_type"] == "accounts" and each["type"] != "report":
+            if each["code"] in move_line_accounts:
+                report_lines_move.append(each)
+                parent_list.append(each["p_id"])
+        else:
+            report_lines_move.append(each)
+
+    for rec in report_lines_move:
+        if rec["report_type"] == "accounts" and rec["type"] != "report":
+            if rec["code"] in move_line_accounts:
+                rec["debit"] = move_lines_dict[rec["code"]]["debit"]
+                rec["credit"] = move_lines_dict[rec["code"]]["credit"]
+                rec["balance"] = move_lines_dict[rec["code"]]["balance"]
+
+    parent_list = list(set(parent_list))
+    max_level = 0
+    for rep in report_lines_move:
+        if rep["level"] > max_level:
+            max_level = rep["level"]
+
+    def get_parents(obj):
+        for item in report_lines_move:
+            for each in obj:
+                if item["report_type"] != "account_type" and each in item["c_ids"]:
+                    obj.append(item["r_id"])
+            if item["report_type"] == "account_report":
+                obj.append(item["r_id"])
+                break
+
+    get_parents(parent_list)
+    for _i in range(max_level):
+        get_parents(parent_list)
+
+    parent_list = list(set(parent_list))
+    final_report_lines = []
+    for rec in report_lines_move:
+        if rec["report_type"] != "accounts" or not rec.get("code"):
+            if rec["r_id"] in parent_list:
+                final_report_lines.append(rec)
+        else:
+            final_report_lines.append(rec)
+
+    def filter_sum(obj):
+        sum_list = {}
+        for pl in parent_list:
+            sum_list[pl] = {}
+            sum_list[pl]["s_debit"] = 0
+            sum_list[pl]["s_credit"] = 0
+            sum_list[pl]["s_balance"] = 0
+        for each in obj:
+            if each["p_id"] and each["p_id"] in parent_list:
+                sum_list[each["p_id"]]["s_debit"] += each["debit"]
+                sum_list[each["p_id"]]["s_credit"] += each["credit"]
+                sum_list[each["p_id"]]["s_balance"] += each["balance"]
+        return sum_list
+
+    def assign_sum(obj):
+        for each in obj:
+            if each["r_id"] in parent_list and each["report_type"] != "account_report":
+                each["debit"] = sum_list_new[each["r_id"]]["s_debit"]
+                each["credit"] = sum_list_new[each["r_id"]]["s_credit"]
+
+    for _p in range(max_level):
+        sum_list_new = filter_sum(final_report_lines)
+        assign_sum(final_report_lines)
+
+    for rec in final_report_lines:
+        rec["debit"] = round(rec["debit"], 2)
+        rec["credit"] = round(rec["credit"], 2)
+        rec["balance"] = rec["debit"] - rec["credit"]
+        rec["balance"] = round(rec["balance"], 2)
+        if (rec["balance_cmp"] < 0 and rec["balance"] > 0) or (
+            rec["balance_cmp"] > 0 and rec["balance"] < 0
+        ):
+            rec["balance"] = rec["balance"] * -1
+    return final_report_lines
+
+
+@tagged("post_install", "-at_install")
+class TestBalanceSheet(DynamicReportCase):
+    def setUp(self):
+        super().setUp()
+        self.type_fixed_assets = self.env.ref("account.data_account_type_fixed_assets")
+        self.type_expenses = self.env.ref("account.data_account_type_expenses")
+        self.account_cash = self._create_account(
+            "DRT101", "Cash", self.type_current_assets
+        )
+        self.account_bank = self._create_account(
+            "DRT102", "Bank", self.type_current_assets
+        )
+        self.account_building = self._create_account(
+            "DRT150", "Building", self.type_fixed_assets
+        )
+        self.account_sales = self._create_account("DRT400", "Sales", self.type_revenue)
+        self.account_rent = self._create_account("DRT600", "Rent", self.type_expenses)
+        self.account_unused = self._create_account(
+            "DRT190", "Unused", self.type_fixed_assets
+        )
+        # a report tree five levels deep, with every type of report
+        Report = self.env["account.financial.report"]
+        self.report = Report.create({"name": "DRT Balance Test", "type": "sum"})
+        assets = self._create_report("DRT Assets", self.report)
+        current = self._create_report("DRT Current Assets", assets)
+        self._create_report(
+            "DRT Liquidity",
+            current,
+            type="account_type",
+            account_type_ids=[(6, 0, self.type_current_assets.ids)],
+            display_detail="detail_with_hierarchy",
+        )
+        non_current = self._create_report("DRT Non-current Assets", assets)
+        self._create_report(
+            "DRT Buildings",
+            non_current,
+            type="accounts",
+            account_ids=[(6, 0, (self.account_building | self.account_unused).ids)],
+        )
+        profit = self._create_report("DRT Profit", self.report, sign="-1")
+        self._create_report(
+            "DRT Income",
+            profit,
+            type="account_type",
+            account_type_ids=[(6, 0, self.type_revenue.ids)],
+        )
+        self._create_report(
+            "DRT Expenses",
+            profit,
+            type="accounts",
+            account_ids=[(6, 0, self.account_rent.ids)],
+            display_detail="no_detail",
+        )
+        equity = self._create_report("DRT Equity", self.report, sign="-1")
+        self._create_report(
+            "DRT Retained Earnings",
+            equity,
+            type="account_report",
+            account_report_id=profit.id,
+        )
+
+        self._create_move("2021-01-10", [(self.account_cash, 1000.0)])
+        self._create_move(
+            "2021-01-15",
+            [(self.account_bank, 250.55), (self.account_sales, -250.55)],
+        )
+        self._create_move(
+            "2021-02-01",
+            [(self.account_building, 5000.0), (self.account_bank, -5000.0)],
+        )
+        self._create_move(
+            "2021-02-03", [(self.account_rent, 120.10), (self.account_cash, -120.10)]
+        )
+        self._create_move(
+            "2021-02-05", [(self.account_sales, -99.99), (self.account_cash, 99.99)]
+        )
+        self.wizard = self.env["dynamic.balance.sheet.report"].create(
+            {
+                "journal_ids": [(6, 0, self.journal.ids)],
+                "date_from": "2021-01-01",
+                "date_to": "2021-12-31",
+            }
+        )
+
+    def _create_report(self, name, parent, **vals):
+        vals.update({"name": name, "parent_id": parent.id, "sequence": len(name)})
+        vals.setdefault("type", "sum")
+        return self.env["account.financial.report"].create(vals)
+
+    def test_rollup_matches_get_parents(self):
+        BalanceSheet = type(self.wizard)
+        rollup = BalanceSheet._rollup_report_lines
+        calls = []
+
+        def capture(wizard, records, report_lines):
+            calls.append(
+                (
+                    {"Accounts": copy.deepcopy(records["Accounts"])},
+                    copy.deepcopy(report_lines),
+                )
+            )
+            return rollup(wizard, records, report_lines)
+
+        with patch.object(BalanceSheet, "_rollup_report_lines", capture):
+            res = self.wizard._view_report([self.wizard.id], "DRT Balance Test")
+        self.assertEqual(len(calls), 1)
+        expected = get_parents_rollup(*calls[0])
+        lines = res["bs_lines"]
+
+        def key(line):
+            return line["r_id"] or line["code"]
+
+        self.assertEqual(
+            [key(line) for line in lines], [key(line) for line in expected]
+        )
+        for line, expected_line in zip(lines, expected):
+            for field in ("debit", "credit", "balance"):
+                self.assertEqual(line[field], expected_line[field], (key(line), field))
+        # the tree is rolled up to the root
+        root = lines[0]
+        self.assertEqual(root["r_id"], self.report.id)
+        self.assertTrue(root["debit"])
+
+    def test_find_journal_items(self):
+        other_journal = self.journal.copy({"code": "DRT2"})
+        self._create_move("2021-01-05", [(self.account_cash, 1.0)], post=False)
+        self.journal = other_journal
+        self._create_move("2021-01-05", [(self.account_cash, 2.0)])
+        data = {
+            "journals": self.wizard.journal_ids,
+            "target_move": "posted",
+            "account_ids": self.env["account.account"],
+            "account_tags": self.env["account.account.tag"],
+            "analytics": self.env["account.analytic.account"],
+            "analytic_tags": self.env["account.analytic.tag"],
+            "operating_units": self.env["operating.unit"],
+            "date_from": self.wizard.date_from,
+            "date_to": self.wizard.date_to,
+        }
+        report_lines = [
+            {
+                "type": "account",
+                "account": account.id,
+                "name": account.code + "-" + account.name,
+                "a_id": account.code + account.name,
+            }
+            for account in self.account_cash | self.account_building
+        ]
+        items = self.wizard.find_journal_items(
+            report_lines, {"move_line_filters": data}, limit=2
+        )
+        cash_lines = self.env["account.move.line"].search(
+            [
+                ("account_id", "=", self.account_cash.id),
+                ("journal_id", "=", self.wizard.journal_ids.id),
+                ("parent_state", "=", "posted"),
+            ],
+            order="date, id",
+        )
+        self.assertEqual(len(cash_lines), 3)
+        self.assertEqual(
+            [item["id"] for item in items if item["p_id"] == "DRT101Cash"],
+            ["DRT101Cash%s" % line_id for line_id in cash_lines[:2].ids],
+        )
+        self.assertEqual(
+            len([item for item in items if item["p_id"] == "DRT150Building"]), 1
+        )
+
+    def _get_periods(self, date_from, date_to, comparison, comparison_periods=1):
+        wizard = self.env["dynamic.balance.sheet.report"].create(
+            {
+                "date_from": date_from,
+                "date_to": date_to,
+                "comparison": comparison,
+                "comparison_periods": comparison_periods,
+            }
+        )
+        return [
+            (fields.Date.to_string(period_from), fields.Date.to_string(period_to))
+            for __, period_from, period_to in wizard._get_comparison_periods()
+        ]
+
+    def test_comparison_periods(self):
+        self.assertEqual(
+            self._get_periods("2021-02-01", "2021-02-28", "period", 2),
+            [("2021-01-01", "2021-01-31"), ("2020-12-01", "2020-12-31")],
+        )
+        self.assertEqual(
+            self._get_periods("2021-01-01", "2021-03-31", "period"),
+            [("2020-10-01", "2020-12-31")],
+        )
+        self.assertEqual(
+            self._get_periods("2021-02-10", "2021-02-19", "period"),
+            [("2021-01-31", "2021-02-09")],
+        )
+        self.assertEqual(
+            self._get_periods("2021-02-01", "2021-02-28", "year", 2),
+            [("2020-02-01", "2020-02-28"), ("2019-02-01", "2019-02-28")],
+        )
+        self.assertEqual(
+            self._get_periods("2021-01-15", "2021-03-10", "month"),
+            [
+                ("2021-01-15", "2021-01-31"),
+                ("2021-02-01", "2021-02-28"),
+                ("2021-03-01", "2021-03-10"),
+            ],
+        )
+        self.assertEqual(self._get_periods("2021-02-01", "2021-02-28", "none"), [])
+
+    def test_period_balances(self):
+        account_petty = self._create_account(
+            "DRT103", "Petty Cash", self.type_current_assets
+        )
+        self._create_move("2021-01-20", [(account_petty, 30.0)])
+        wizard = self.env["dynamic.balance.sheet.report"].create(
+            {
+                "journal_ids": [(6, 0, self.journal.ids)],
+                "date_from": "2021-02-01",
+                "date_to": "2021-02-28",
+                "comparison": "period",
+                "comparison_periods": 2,
+            }
+        )
+        res = wizard._view_report([wizard.id], "DRT Balance Test")
+        self.assertEqual(len(res["periods"]), 2)
+        lines = {line["code"]: line for line in res["bs_lines"] if line.get("code")}
+        self.assertEqual(lines["DRT101"]["balance_periods"], [1000.0, 0.0])
+        self.assertEqual(lines["DRT102"]["balance_periods"], [250.55, 0.0])
+        self.assertEqual(lines["DRT150"]["balance_periods"], [0.0, 0.0])
+        # only moved in a compared period
+        self.assertEqual(lines["DRT103"]["balance"], 0.0)
+        self.assertEqual(lines["DRT103"]["balance_periods"], [30.0, 0.0])
+        root = res["bs_lines"][0]
+        self.assertEqual(root["r_id"], self.report.id)
+        self.assertEqual(len(root["balance_periods"]), 2)
+
+    def test_account_totals(self):
+        """The account totals are summed by the database, from the journal
+        items or from the daily balances alike"""
+        self.env["ir.config_parameter"].sudo().set_param(
+            "dynamic_accounts_report.cache_max_size", 0
+        )
+        res = self.wizard._view_report([self.wizard.id], "DRT Balance Test")
+        rows = {row["code"]: row for row in res["report_lines"]}
+        self.assertNotIn("DRT190", rows)
+        for account in (
+            self.account_counterpart
+            | self.account_cash
+            | self.account_bank
+            | self.account_building
+            | self.account_sales
+            | self.account_rent
+        ):
+            lines = self.env["account.move.line"].search(
+                [
+                    ("account_id", "=", account.id),
+                    ("journal_id", "=", self.journal.id),
+                    ("parent_state", "=", "posted"),
+                ]
+            )
+            row = rows[account.code]
+            self.assertAlmostEqual(row["debit"], sum(lines.mapped("debit")), 2)
+            self.assertAlmostEqual(row["credit"], sum(lines.mapped("credit")), 2)
+            self.assertAlmostEqual(row["balance"], sum(lines.mapped("balance")), 2)
+            self.assertEqual(row["move_lines"], [])
+        self.env["dynamic.report.daily.balance"].rebuild()
+        res = self.wizard._view_report([self.wizard.id], "DRT Balance Test")
+        self.assertEqual({row["code"]: row for row in res["report_lines"]}, rows)
@@ -0,0 +1,76 @@
+# Copyright 2021 Ecosoft Co., Ltd. (http://ecosoft.co.th)
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from unittest.mock import patch
+
+from odoo.tests import new_test_user, tagged
+
+from .common import DynamicReportCase
+
+
+@tagged("post_install", "-at_install")
+class TestCheckpoint(DynamicReportCase):
+    def setUp(self):
+        super().setUp()
+        self.account_a = self._create_account(
+            "DRT100", "Account A", self.type_current_assets
+        )
+        self.account_hidden = self._create_account(
+            "DRT200", "Hidden", self.type_current_assets
+        )
+        self._create_move(
+            "2000-01-10", [(self.account_a, 100.0), (self.account_hidden, 50.0)]
+        )
+        self._create_move("2000-02-05", [(self.account_a, 10.0)])
+        self.company.fiscalyear_lock_date = "2000-01-31"
+        group = self.env["res.groups"].create({"name": "DRT Restricted"})
+        self.env["ir.rule"].create(
+            {
+                "name": "DRT hidden account",
+                "model_id": self.env.ref("account.model_account_move_line").id,
+                "domain_force": "[('account_id', '!=', %s)]" % self.account_hidden.id,
+                "groups": [(6, 0, group.ids)],
+            }
+        )
+        self.user = new_test_user(
+            self.env, login="drt_checkpoint_user", groups="account.group_account_user"
+        )
+        self.restricted_user = new_test_user(
+            self.env,
+            login="drt_checkpoint_restricted",
+            groups="account.group_account_user",
+        )
+        self.restricted_user.groups_id |= group
+        self.account_ids = (
+            self.account_counterpart | self.account_a | self.account_hidden
+        ).ids
+
+    def _get_initial_balance(self, user):
+        wizard = (
+            self.env["account.general.ledger"]
+            .with_user(user)
+            .create({"date_from": "2000-02-15", "target_move": "posted"})
+        )
+        data = wizard._get_report_data(wizard)
+        return wizard._get_initial_balance(data, self.account_ids)
+
+    def test_record_rules(self):
+        """The checkpoints only hold the journal items the user reads"""
+        res = {}
+        for user in (self.user, self.restricted_user):
+            res[user] = self._get_initial_balance(user)
+            with patch.object(
+                type(self.env["account.general.ledger"]),
+                "_can_use_checkpoints",
+                return_value=False,
+            ):
+                self.assertEqual(res[user], self._get_initial_balance(user))
+        self.assertEqual(res[self.user][self.account_hidden.id]["debit"], 50.0)
+        self.assertNotIn(self.account_hidden.id, res[self.restricted_user])
+        for user in (self.user, self.restricted_user):
+            self.assertEqual(res[user][self.account_a.id]["debit"], 110.0)
+        checkpoints = self.env["dynamic.report.checkpoint"].search(
+            [("company_id", "=", self.company.id), ("date", "=", "2000-02-01")]
+        )
+        self.assertEqual(len(checkpoints), 2)
+        self.assertEqual(len(set(checkpoints.mapped("rule_key"))), 2)
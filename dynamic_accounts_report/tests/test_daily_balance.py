@@ -0,0 +1,81 @@
+# Copyright 2021 Ecosoft Co., Ltd. (http://ecosoft.co.th)
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo.tests import tagged
+
+from .common import DynamicReportCase
+
+
+@tagged("post_install", "-at_install")
+class TestDailyBalance(DynamicReportCase):
+    def setUp(self):
+        super().setUp()
+        self.DailyBalance = self.env["dynamic.report.daily.balance"]
+        self.account_a = self._create_account(
+            "DRT100", "Account A", self.type_current_assets
+        )
+        self.account_b = self._create_account("DRT200", "Account B", self.type_revenue)
+        self.analytic = self.env["account.analytic.account"].create(
+            {"name": "Dynamic Report Test"}
+        )
+        self._create_move("2021-02-01", [(self.account_a, 100.0)])
+
+    def _get_balances(self):
+        self.env["account.move.line"].flush()
+        return self.DailyBalance.search([("journal_id", "=", self.journal.id)])
+
+    def assertConsistent(self):
+        self.assertEqual(self.DailyBalance.check_consistency(), [])
+
+    def test_disabled(self):
+        self.env["ir.config_parameter"].set_param(
+            "dynamic_accounts_report.use_daily_balance", False
+        )
+        self._create_move("2021-02-02", [(self.account_a, 10.0)])
+        self.assertFalse(self._get_balances())
+
+    def test_move_lifecycle(self):
+        self.DailyBalance.rebuild()
+        self.assertConsistent()
+        move = self._create_move("2021-02-02", [(self.account_a, 10.0)])
+        self.assertConsistent()
+        move.button_draft()
+        self.assertConsistent()
+        move.date = "2021-03-01"
+        self.assertConsistent()
+        move.write(
+            {
+                "line_ids": [
+                    (1, line.id, {"account_id": self.account_b.id})
+                    for line in move.line_ids
+                    if line.account_id == self.account_a
+                ]
+            }
+        )
+        self.assertConsistent()
+        move.action_post()
+        self.assertConsistent()
+        move.button_draft()
+        move.with_context(force_delete=True).unlink()
+        self.assertConsistent()
+
+    def test_computed_key(self):
+        """Keys recomputed from other fields move the amounts too"""
+        self.env["account.analytic.default"].create(
+            {
+                "account_id": self.account_b.id,
+                "analytic_id": self.analytic.id,
+            }
+        )
+        self.DailyBalance.rebuild()
+        move = self._create_move("2021-02-02", [(self.account_a, 10.0)], post=False)
+        line = move.line_ids.filtered(lambda ml: ml.account_id == self.account_a)
+        move.write({"line_ids": [(1, line.id, {"account_id": self.account_b.id})]})
+        self.assertEqual(line.analytic_account_id, self.analytic)
+        self.assertConsistent()
+        balance = self._get_balances().filtered(
+            lambda b: b.analytic_account_id == self.analytic
+        )
+        self.assertEqual(balance.account_id, self.account_b)
+        self.assertEqual(balance.debit, 10.0)
+        self.assertEqual(balance.move_state, "draft")
@@ -0,0 +1,57 @@
+# Copyright 2021 Ecosoft Co., Ltd. (http://ecosoft.co.th)
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo.tests import tagged
+
+from ..models.account_financial_report import REPORT_PLAN_VERSION_PARAM
+from .common import DynamicReportCase
+
+
+@tagged("post_install", "-at_install")
+class TestFinancialReport(DynamicReportCase):
+    def setUp(self):
+        super().setUp()
+        Report = self.env["account.financial.report"]
+        self.root = Report.create({"name": "DRT Root", "type": "sum"})
+        self.section = Report.create(
+            {"name": "DRT Section", "parent_id": self.root.id, "type": "sum"}
+        )
+        self.assets = Report.create(
+            {
+                "name": "DRT Assets",
+                "parent_id": self.section.id,
+                "type": "account_type",
+                "account_type_ids": [(6, 0, self.type_current_assets.ids)],
+            }
+        )
+        self.other = Report.create({"name": "DRT Other", "type": "sum"})
+
+    def test_plan_invalidation(self):
+        plan = self.root._get_report_plan()
+        self.assertEqual(plan.nodes[self.assets.id].sign, 1)
+        Param = self.env["ir.config_parameter"].sudo()
+        version = Param.get_param(REPORT_PLAN_VERSION_PARAM, "0")
+
+        # the other fields do not renew the plans
+        self.assets.name = "DRT Current Assets"
+        self.assertEqual(Param.get_param(REPORT_PLAN_VERSION_PARAM, "0"), version)
+
+        self.assets.sign = "-1"
+        plan = self.root._get_report_plan()
+        self.assertEqual(plan.nodes[self.assets.id].sign, -1)
+        self.assertNotEqual(Param.get_param(REPORT_PLAN_VERSION_PARAM), version)
+
+        # both the former and the new parents are renewed
+        self.assets.parent_id = self.other
+        self.assertNotIn(self.assets.id, self.root._get_report_plan().nodes)
+        self.assertIn(self.assets.id, self.other._get_report_plan().nodes)
+
+    def test_plan_accounts(self):
+        plan = self.root._get_report_plan()
+        account = self._create_account("DRT100", "Account", self.type_current_assets)
+        self.assertNotIn(account.id, plan.nodes[self.assets.id].account_ids)
+        plan = self.root._get_report_plan()
+        self.assertIn(account.id, plan.nodes[self.assets.id].account_ids)
+        account.user_type_id = self.type_revenue
+        plan = self.root._get_report_plan()
+        self.assertNotIn(account.id, plan.nodes[self.assets.id].account_ids)
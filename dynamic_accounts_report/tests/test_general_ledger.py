@@ -0,0 +1,223 @@
+# Copyright 2021 Ecosoft Co., Ltd. (http://ecosoft.co.th)
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from unittest.mock import patch
+
+from odoo.tests import tagged
+
+from ..wizard import general_ledger
+from .common import DynamicReportCase
+
+
+def line_loop_balances(initial_balance, lines):
+    """returns the balance of each of ``lines`` by id, as the per-line loop
+    replaced by the window function computed it: each line re-sums the
+    lines of its account before it, initial balance included"""
+    move_lines = [initial_balance] if initial_balance else []
+    balances = {}
+    for line in lines:
+        row = {"debit": line.debit, "credit": line.credit, "balance": line.balance}
+        balance = 0
+        for previous in move_lines:
+            balance += round(previous["debit"], 2) - round(previous["credit"], 2)
+        row["balance"] += round(balance, 2)
+        move_lines.append(row)
+        balances[line.id] = row["balance"]
+    return balances
+
+
+@tagged("post_install", "-at_install")
+class TestGeneralLedger(DynamicReportCase):
+    def setUp(self):
+        super().setUp()
+        self.account_a = self._create_account(
+            "DRT100", "Account A", self.type_current_assets
+        )
+        self.account_b = self._create_account("DRT200", "Account B", self.type_revenue)
+        # before the report period, the initial balance of account A
+        self._create_move("2021-01-15", [(self.account_a, 1000.10)])
+        self._create_move("2021-01-20", [(self.account_a, -200.05)])
+        # several lines of both accounts on the same dates
+        self._create_move(
+            "2021-02-01", [(self.account_a, 10.25), (self.account_b, -10.25)]
+        )
+        self._create_move(
+            "2021-02-01", [(self.account_a, -3.10), (self.account_a, 7.33)]
+        )
+        self._create_move("2021-02-01", [(self.account_b, 45.67)])
+        self._create_move("2021-02-10", [(self.account_a, 0.01)])
+        self._create_move(
+            "2021-02-10", [(self.account_a, -99.99), (self.account_b, 12.34)]
+        )
+        self._create_move("2021-02-28", [(self.account_b, -0.99)])
+        # not posted, not in the report
+        self._create_move("2021-02-05", [(self.account_a, 500.0)], post=False)
+        self.wizard = self._create_general_ledger(
+            date_from="2021-02-01", date_to="2021-02-28"
+        )
+
+    def _get_lines(self, account, date_from=None, date_to=None):
+        domain = [
+            ("account_id", "=", account.id),
+            ("journal_id", "=", self.journal.id),
+            ("parent_state", "=", "posted"),
+        ]
+        if date_from:
+            domain.append(("date", ">=", date_from))
+        if date_to:
+            domain.append(("date", "<=", date_to))
+        return self.env["account.move.line"].search(domain, order="date, id")
+
+    def _get_initial_balance(self, account, date_from):
+        lines = self._get_lines(account).filtered(
+            lambda line: str(line.date) < date_from
+        )
+        if not lines:
+            return None
+        return {
+            "debit": sum(lines.mapped("debit")),
+            "credit": sum(lines.mapped("credit")),
+        }
+
+    def _iter_report(self, wizard):
+        data = wizard._get_report_data(wizard)
+        for res, move_lines in wizard._iter_accounts(
+            data["accounts"], True, data["display_account"], data
+        ):
+            yield res, list(move_lines)
+
+    def test_running_balances_match_line_loop(self):
+        accounts = self.account_a | self.account_b | self.account_counterpart
+        report = dict(
+            (res["id"], (res, move_lines))
+            for res, move_lines in self._iter_report(self.wizard)
+        )
+        self.assertEqual(set(report), set(accounts.ids))
+        for account in accounts:
+            res, move_lines = report[account.id]
+            initial_balance = self._get_initial_balance(account, "2021-02-01")
+            lines = self._get_lines(account, "2021-02-01", "2021-02-28")
+            expected = line_loop_balances(initial_balance, lines)
+            if initial_balance:
+                self.assertEqual(move_lines[0]["lid"], 0)
+                move_lines = move_lines[1:]
+            # the lines come in date order, then in creation order
+            self.assertEqual([row["lid"] for row in move_lines], lines.ids)
+            for row in move_lines:
+                self.assertEqual(row["m_id"], account.id)
+                self.assertAlmostEqual(row["balance"], expected[row["lid"]], 2)
+            # the last running balance is the balance of the account
+            self.assertAlmostEqual(move_lines[-1]["balance"], res["balance"], 2)
+
+    def test_running_balances_without_start_date(self):
+        wizard = self._create_general_ledger(date_to="2021-02-28")
+        for res, move_lines in self._iter_report(wizard):
+            account = self.env["account.account"].browse(res["id"])
+            lines = self._get_lines(account, date_to="2021-02-28")
+            expected = line_loop_balances(None, lines)
+            self.assertEqual([row["lid"] for row in move_lines], lines.ids)
+            for row in move_lines:
+                self.assertAlmostEqual(row["balance"], expected[row["lid"]], 2)
+
+    def test_view_account_lines_pages(self):
+        expected = {
+            row["lid"]: row["balance"]
+            for res, move_lines in self._iter_report(self.wizard)
+            if res["id"] == self.account_a.id
+            for row in move_lines
+        }
+        page = self.wizard.view_account_lines(
+            [self.wizard.id], self.account_a.id, limit=2
+        )
+        self.assertAlmostEqual(page["initial_balance"]["balance"], expected.pop(0), 2)
+        balances = {}
+        while True:
+            self.assertLessEqual(len(page["move_lines"]), 2)
+            for row in page["move_lines"]:
+                balances[row["lid"]] = row["balance"]
+            if not page["next"]:
+                break
+            # the next page continues from the running balance
+            last = page["move_lines"][-1]
+            self.assertAlmostEqual(page["next"]["balance"], last["balance"], 2)
+            page = self.wizard.view_account_lines(
+                [self.wizard.id], self.account_a.id, page["next"], limit=2
+            )
+            self.assertFalse(page["initial_balance"])
+        self.assertEqual(list(balances), list(expected))
+        for lid, balance in balances.items():
+            self.assertAlmostEqual(balance, expected[lid], 2)
+
+    def test_view_account_lines_limit(self):
+        for __ in range(3):
+            self._create_move("2021-02-15", [(self.account_a, 1.0)])
+        page = self.wizard.view_account_lines(
+            [self.wizard.id], self.account_a.id, limit=1000000
+        )
+        self.assertFalse(page["next"])
+        with patch.object(general_ledger, "MAX_PAGE_LIMIT", 2):
+            page = self.wizard.view_account_lines(
+                [self.wizard.id], self.account_a.id, limit=1000000
+            )
+        self.assertEqual(len(page["move_lines"]), 2)
+        self.assertTrue(page["next"])
+
+    def test_accounts_in_code_order(self):
+        """The journal items are streamed in the order of the accounts shown,
+        whatever their ids"""
+        account = self._create_account("DRT050", "Account 0", self.type_revenue)
+        self._create_move("2021-02-03", [(account, 5.0)])
+        report = list(self._iter_report(self.wizard))
+        accounts = self.env["account.account"].browse([res["id"] for res, __ in report])
+        self.assertEqual(accounts.mapped("code"), sorted(accounts.mapped("code")))
+        self.assertEqual(accounts[0], self.account_counterpart)
+        self.assertEqual(accounts[1], account)
+        for res, move_lines in report:
+            lines = self._get_lines(accounts.browse(res["id"]), "2021-02-01")
+            self.assertEqual(
+                [row["lid"] for row in move_lines if row["lid"]], lines.ids
+            )
+
+    def _get_account_codes(self, **vals):
+        wizard = self._create_general_ledger(
+            date_from="2021-02-01", date_to="2021-02-28", **vals
+        )
+        data = wizard._get_report_data(wizard)
+        summary = wizard._get_account_summary(
+            data["accounts"], data["display_account"], data
+        )
+        return {res["code"] for res in summary}
+
+    def test_display_account(self):
+        """The display modes and the account tags select the accounts in the
+        totals query, or in the daily balances"""
+        self._create_account("DRT300", "Idle", self.type_revenue)
+        account_zero = self._create_account("DRT400", "Zero", self.type_revenue)
+        self._create_move("2021-02-05", [(account_zero, 5.0), (account_zero, -5.0)])
+        tag = self.env["account.account.tag"].create(
+            {"name": "DRT Tag", "applicability": "accounts"}
+        )
+        self.account_a.tag_ids = tag
+        for use_daily_balance in (False, True):
+            if use_daily_balance:
+                self.env["dynamic.report.daily.balance"].rebuild()
+            else:
+                self.env["ir.config_parameter"].sudo().set_param(
+                    "dynamic_accounts_report.use_daily_balance", False
+                )
+            codes = self._get_account_codes(display_account="movement")
+            self.assertEqual(
+                {code for code in codes if code.startswith("DRT")},
+                {"DRT000", "DRT100", "DRT200", "DRT400"},
+            )
+            codes = self._get_account_codes(display_account="not_zero")
+            self.assertEqual(
+                {code for code in codes if code.startswith("DRT")},
+                {"DRT000", "DRT100", "DRT200"},
+            )
+            codes = self._get_account_codes(display_account="all")
+            self.assertTrue({"DRT300", "DRT400"} <= codes)
+            codes = self._get_account_codes(
+                display_account="all", account_tag_ids=[(6, 0, tag.ids)]
+            )
+            self.assertEqual(codes, {"DRT100"})
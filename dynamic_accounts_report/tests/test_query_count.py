@@ -0,0 +1,146 @@
+# Copyright 2021 Ecosoft Co., Ltd. (http://ecosoft.co.th)
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+import json
+
+from odoo.tests import HttpCase, tagged
+
+from .common import DynamicReportCase
+
+
+class QueryCountCase(DynamicReportCase):
+    """A report whose accounts, nodes and journal items grow with _grow(),
+    to check the reports run as many queries whatever their size"""
+
+    def setUp(self):
+        super().setUp()
+        self.env["ir.config_parameter"].sudo().set_param(
+            "dynamic_accounts_report.cache_max_size", 0
+        )
+        Report = self.env["account.financial.report"]
+        self.report = Report.create({"name": "DRT Query Count", "type": "sum"})
+        Report.create(
+            {
+                "name": "DRT Current Assets",
+                "parent_id": self.report.id,
+                "type": "account_type",
+                "account_type_ids": [(6, 0, self.type_current_assets.ids)],
+                "display_detail": "detail_with_hierarchy",
+            }
+        )
+        self.scale = 0
+        self._grow()
+        self.bs = self.env["dynamic.balance.sheet.report"].create(
+            {
+                "journal_ids": [(6, 0, self.journal.ids)],
+                "date_from": "2021-02-01",
+                "date_to": "2021-12-31",
+            }
+        )
+        self.gl = self._create_general_ledger(
+            date_from="2021-02-01", date_to="2021-12-31"
+        )
+
+    def _grow(self, times=1):
+        """Add a section of the report with new accounts, and their journal
+        items before and within the report period"""
+        Report = self.env["account.financial.report"]
+        for __ in range(times):
+            self.scale += 1
+            accounts = self.env["account.account"]
+            for i in range(4):
+                accounts |= self._create_account(
+                    "DRT%d%02d" % (self.scale, i),
+                    "Account %s-%s" % (self.scale, i),
+                    i % 2 and self.type_revenue or self.type_current_assets,
+                )
+            section = Report.create(
+                {
+                    "name": "DRT Section %s" % self.scale,
+                    "parent_id": self.report.id,
+                    "type": "sum",
+                }
+            )
+            Report.create(
+                {
+                    "name": "DRT Accounts %s" % self.scale,
+                    "parent_id": section.id,
+                    "type": "accounts",
+                    "account_ids": [(6, 0, accounts.ids)],
+                }
+            )
+            for date in ("2021-01-15", "2021-02-01", "2021-03-15"):
+                self._create_move(date, [(account, 10.0) for account in accounts])
+
+    def _count_queries(self, func):
+        """returns the number of queries of ``func`` once the caches are
+        warm"""
+        func()
+        self.env["base"].flush()
+        self.env["base"].invalidate_cache()
+        count = self.cr.sql_log_count
+        func()
+        self.env["base"].flush()
+        return self.cr.sql_log_count - count
+
+    def assertQueryBound(self, func):
+        """Checks ``func`` runs no more queries on three times as many
+        accounts, report nodes and journal items"""
+        count = self._count_queries(func)
+        self._grow(2)
+        # the caches of the report plans are renewed by the new nodes
+        func()
+        self.env["base"].invalidate_cache()
+        with self.assertQueryCount(count):
+            func()
+
+
+@tagged("post_install", "-at_install")
+class TestQueryCount(QueryCountCase):
+    def test_balance_sheet_view_report(self):
+        self.assertQueryBound(
+            lambda: self.bs.view_report([self.bs.id], "DRT Query Count", compact=True)
+        )
+
+    def test_general_ledger_view_report(self):
+        self.assertQueryBound(
+            lambda: self.gl.view_report([self.gl.id], "General Ledger", compact=True)
+        )
+
+    def test_general_ledger_view_account_lines(self):
+        self.assertQueryBound(
+            lambda: self.gl.view_account_lines(
+                [self.gl.id], self.account_counterpart.id, compact=True
+            )
+        )
+
+
+@tagged("post_install", "-at_install")
+class TestXlsxQueryCount(HttpCase, QueryCountCase):
+    def setUp(self):
+        super().setUp()
+        self.authenticate("admin", "admin")
+
+    def _export_xlsx(self, wizard, title, dfr_data):
+        response = self.url_open(
+            "/dynamic_xlsx_reports",
+            data={
+                "model": wizard._name,
+                "options": json.dumps([wizard.id]),
+                "output_format": "xlsx",
+                "token": "drt",
+                "report_data": title,
+                "dfr_data": dfr_data,
+            },
+            timeout=60,
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.cookies.get("fileToken"), "drt")
+
+    def test_balance_sheet_xlsx(self):
+        self.assertQueryBound(
+            lambda: self._export_xlsx(self.bs, "DRT Query Count", "[]")
+        )
+
+    def test_general_ledger_xlsx(self):
+        self.assertQueryBound(lambda: self._export_xlsx(self.gl, "General Ledger", ""))
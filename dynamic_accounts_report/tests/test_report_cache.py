@@ -0,0 +1,81 @@
+# Copyright 2021 Ecosoft Co., Ltd. (http://ecosoft.co.th)
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo.tests import tagged
+from odoo.tests.common import TransactionCase, new_test_user
+
+
+@tagged("post_install", "-at_install")
+class TestReportCache(TransactionCase):
+    def setUp(self):
+        super().setUp()
+        self.ReportCache = self.env["dynamic.report.cache"]
+        self.user = new_test_user(
+            self.env,
+            login="dynamic_report_cache",
+            groups="account.group_account_user",
+        )
+        self.journal = self.env["account.journal"].search(
+            [("company_id", "=", self.env.company.id)], limit=1
+        )
+        self.computed = 0
+
+    def _compute(self):
+        self.computed += 1
+        return {"report_lines": [{"id": self.computed}]}
+
+    def _get_values(self, user=None):
+        wizard = self.env["account.general.ledger"].with_user(user or self.env.user)
+        wizard = wizard.create({"journal_ids": [(6, 0, self.journal.ids)]})
+        return wizard.env["dynamic.report.cache"]._get_wizard_values(wizard)
+
+    def _get_result(self, user=None, values=None):
+        ReportCache = self.ReportCache.with_user(user or self.env.user)
+        values = values or self._get_values(user)
+        return ReportCache._get_result("account.general.ledger", values, self._compute)
+
+    def test_hit(self):
+        values = self._get_values()
+        stats = self.ReportCache.get_stats()
+        res = self._get_result(values=values)
+        # a hit only reads the stored result and counts it
+        with self.assertQueryCount(2):
+            self.assertEqual(self._get_result(values=values), res)
+        self.assertEqual(self.computed, 1)
+        new_stats = self.ReportCache.get_stats()
+        self.assertEqual(new_stats["hits"], stats["hits"] + 1)
+        self.assertEqual(new_stats["misses"], stats["misses"] + 1)
+        self.assertIn("account.general.ledger", new_stats["reports"])
+
+    def test_not_shared_between_users(self):
+        """Record rules may hide journal items from another user"""
+        self._get_result()
+        self._get_result(self.user)
+        self.assertEqual(self.computed, 2)
+        self._get_result(self.user)
+        self.assertEqual(self.computed, 2)
+
+    def test_gc_max_size(self):
+        self.env["ir.config_parameter"].set_param(
+            "dynamic_accounts_report.cache_max_size", 1
+        )
+        payload = "x" * 400 * 1024
+        keys = ["first", "second", "third"]
+        for key in keys:
+            self.ReportCache._store(key, "account.general.ledger", payload)
+        # the oldest result is evicted as soon as the third one is stored
+        entries = self.ReportCache.search([("key", "in", keys)], order="id")
+        self.assertEqual(entries.mapped("key"), ["second", "third"])
+        self.ReportCache._gc_cache()
+        entries = self.ReportCache.search([("key", "in", keys)], order="id")
+        self.assertEqual(entries.mapped("key"), ["second", "third"])
+
+    def test_disabled(self):
+        self.env["ir.config_parameter"].set_param(
+            "dynamic_accounts_report.cache_max_size", 0
+        )
+        entries = self.ReportCache.search_count([])
+        self._get_result()
+        self._get_result()
+        self.assertEqual(self.computed, 2)
+        self.assertEqual(self.ReportCache.search_count([]), entries)
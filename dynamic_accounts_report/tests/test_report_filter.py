@@ -0,0 +1,56 @@
+# Copyright 2021 Ecosoft Co., Ltd. (http://ecosoft.co.th)
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo.exceptions import AccessError
+from odoo.tests import new_test_user, tagged
+
+from .common import DynamicReportCase
+
+
+@tagged("post_install", "-at_install")
+class TestReportFilter(DynamicReportCase):
+    def setUp(self):
+        super().setUp()
+        self.Filter = self.env["dynamic.report.filter"]
+        self.other_journal = self.journal.copy({"code": "DRT2", "name": "DRT Other"})
+        self.ids = (self.journal | self.other_journal).ids
+
+    def _get_labels(self, field="name"):
+        return {
+            label["id"]: label["text"]
+            for label in self.Filter.get_filter_labels("journals", self.ids, field)
+        }
+
+    def test_labels(self):
+        self.assertEqual(
+            self._get_labels("code"),
+            {self.journal.id: "DRT", self.other_journal.id: "DRT2"},
+        )
+        self.journal.name = "DRT Renamed"
+        self.assertEqual(
+            self._get_labels()[self.journal.id], self.journal.name_get()[0][1]
+        )
+        self.other_journal.unlink()
+        self.assertEqual(list(self._get_labels()), self.journal.ids)
+
+    def test_other_company(self):
+        """The labels of the records of another company are not readable"""
+        company = self.env["res.company"].create({"name": "DRT Company"})
+        account = self.env["account.account"].create(
+            {
+                "code": "DRT999",
+                "name": "Other Company",
+                "user_type_id": self.type_revenue.id,
+                "company_id": company.id,
+            }
+        )
+        user = new_test_user(
+            self.env, login="drt_filter_user", groups="account.group_account_user"
+        )
+        Filter = self.Filter.with_user(user)
+        self.assertEqual(
+            Filter.get_filter_labels("accounts", self.account_counterpart.ids, "code"),
+            [{"id": self.account_counterpart.id, "text": "DRT000"}],
+        )
+        with self.assertRaises(AccessError):
+            Filter.get_filter_labels("accounts", account.ids, "code")
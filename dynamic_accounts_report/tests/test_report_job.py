@@ -0,0 +1,75 @@
+# Copyright 2021 Ecosoft Co., Ltd. (http://ecosoft.co.th)
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+import hashlib
+import io
+
+from odoo.exceptions import AccessError, UserError
+from odoo.tests import new_test_user, tagged
+
+from .common import DynamicReportCase
+
+
+@tagged("post_install", "-at_install")
+class TestReportJob(DynamicReportCase):
+    def setUp(self):
+        super().setUp()
+        self.user = new_test_user(
+            self.env, login="drt_job_user", groups="account.group_account_user"
+        )
+        self.wizard = self._create_general_ledger(date_from="2021-02-01")
+        job_id = (
+            self.env["dynamic.report.job"]
+            .with_user(self.user)
+            .create_job("account.general.ledger", self.wizard.id, "csv", "DRT")
+        )
+        self.job = self.env["dynamic.report.job"].browse(job_id)
+
+    def test_read_only(self):
+        job = self.job.with_user(self.user)
+        self.assertEqual(job.get_status()[0]["state"], "queued")
+        with self.assertRaises(AccessError):
+            job.write({"state": "done"})
+        with self.assertRaises(AccessError):
+            job.unlink()
+        job.action_cancel()
+        self.assertEqual(self.job.state, "cancel")
+
+    def test_stage_progress(self):
+        """The listener of the report timings is called as each stage
+        starts"""
+        stages = []
+        ReportQuery = self.env["dynamic.report.query"]
+        with ReportQuery._report_timings("report_job", listener=stages.append):
+            self.wizard.view_report([self.wizard.id], "DRT")
+        self.assertEqual(stages[0], "report_job")
+        self.assertLess(stages.index("cache"), stages.index("accounts"))
+        stage_progress = self.job._get_stage_progress()
+        progress = [
+            stage_progress[stage][0] for stage in stages if stage in stage_progress
+        ]
+        self.assertEqual(progress, sorted(progress))
+
+    def test_save_file(self):
+        content = b"0123456789" * 1000
+        self.job.state = "running"
+        attachment = self.job._save_file(io.BytesIO(content))
+        self.assertEqual(attachment.raw, content)
+        self.assertEqual(attachment.file_size, len(content))
+        self.assertEqual(attachment.checksum, hashlib.sha1(content).hexdigest())
+        self.assertEqual(attachment.name, "DRT.csv")
+        self.assertEqual(attachment.res_id, self.job.id)
+
+    def test_methods(self):
+        """The jobs only run the exports of their report"""
+        Job = self.env["dynamic.report.job"].with_user(self.user)
+        bs = self.env["dynamic.balance.sheet.report"].with_user(self.user).create({})
+        for res_model, wizard, method in (
+            ("dynamic.balance.sheet.report", bs, "csv"),
+            ("account.general.ledger", self.wizard, "pdf"),
+            ("res.partner", self.user.partner_id, "view_report"),
+        ):
+            with self.assertRaises(UserError):
+                Job.create_job(res_model, wizard.id, method, "DRT")
+        job_id = Job.create_job("dynamic.balance.sheet.report", bs.id, "pdf", "DRT")
+        self.assertEqual(Job.browse(job_id).method, "pdf")
@@ -0,0 +1,56 @@
+# Copyright 2021 Ecosoft Co., Ltd. (http://ecosoft.co.th)
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo.tests import tagged
+
+from ..models.report_payload import compact_rows
+from .common import DynamicReportCase
+
+
+def decode_rows(payload):
+    """returns the rows of a compact ``payload``, as report_payload.js
+    decodeRows() does"""
+    return [dict(zip(payload["columns"], row)) for row in payload["rows"]]
+
+
+@tagged("post_install", "-at_install")
+class TestReportPayload(DynamicReportCase):
+    def setUp(self):
+        super().setUp()
+        self.account = self._create_account(
+            "DRT100", "Account", self.type_current_assets
+        )
+        self._create_move("2021-01-15", [(self.account, 100.0)])
+        self._create_move("2021-02-01", [(self.account, -25.0)])
+        self.wizard = self._create_general_ledger(
+            date_from="2021-02-01", date_to="2021-02-28"
+        )
+
+    def test_compact_rows(self):
+        rows = [{"a": 1, "b": 2, "c": [3]}, {"b": 4, "d": 5}]
+        self.assertEqual(
+            compact_rows(rows, exclude=("c",)),
+            {"columns": ["a", "b", "d"], "rows": [[1, 2, None], [None, 4, 5]]},
+        )
+        self.assertEqual(compact_rows([]), {"columns": [], "rows": []})
+
+    def test_view_report(self):
+        res = self.wizard.view_report([self.wizard.id], "General Ledger")
+        compact = self.wizard.view_report(
+            [self.wizard.id], "General Ledger", compact=True
+        )
+        lines = decode_rows(compact["report_lines"])
+        self.assertEqual(len(lines), len(res["report_lines"]))
+        for line, expected in zip(lines, res["report_lines"]):
+            expected = {
+                key: value for key, value in expected.items() if key != "move_lines"
+            }
+            self.assertEqual(line, expected)
+
+    def test_view_account_lines(self):
+        page = self.wizard.view_account_lines([self.wizard.id], self.account.id)
+        compact = self.wizard.view_account_lines(
+            [self.wizard.id], self.account.id, compact=True
+        )
+        self.assertEqual(decode_rows(compact["move_lines"]), page["move_lines"])
+        self.assertEqual(compact["initial_balance"], page["initial_balance"])
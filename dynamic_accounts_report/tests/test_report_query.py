@@ -0,0 +1,85 @@
+# Copyright 2021 Ecosoft Co., Ltd. (http://ecosoft.co.th)
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo.tests import new_test_user, tagged
+
+from .common import DynamicReportCase
+
+
+@tagged("post_install", "-at_install")
+class TestReportQuery(DynamicReportCase):
+    def setUp(self):
+        super().setUp()
+        self.account = self._create_account(
+            "DRT100", "Account", self.type_current_assets
+        )
+        self._create_move("2021-02-01", [(self.account, 10.0)])
+        self._create_move("2021-02-02", [(self.account, 20.0)], post=False)
+        move = self._create_move("2021-02-03", [(self.account, 40.0)], post=False)
+        move.button_cancel()
+        self.data = {
+            "journals": self.journal,
+            "target_move": "all",
+            "account_ids": self.env["account.account"],
+            "account_tags": self.env["account.account.tag"],
+            "analytics": self.env["account.analytic.account"],
+            "analytic_tags": self.env["account.analytic.tag"],
+            "operating_units": self.env["operating.unit"],
+        }
+
+    def _get_total(self, ReportQuery):
+        where, params = ReportQuery._get_move_line_where(self.data, self.account.ids)
+        from_clause = ReportQuery._get_move_line_from(where)
+        self.env.cr.execute(
+            "SELECT SUM(l.debit) FROM %s WHERE %s" % (from_clause, where), params
+        )
+        return from_clause, self.env.cr.fetchone()[0]
+
+    def test_move_state_without_join(self):
+        """The state filters of _query_get() are read on the lines"""
+        ReportQuery = self.env["dynamic.report.query"].with_context(
+            date_to="2021-12-31"
+        )
+        self.assertEqual(self._get_total(ReportQuery), ("account_move_line l", 30.0))
+        ReportQuery = ReportQuery.with_context(state="posted")
+        self.assertEqual(self._get_total(ReportQuery), ("account_move_line l", 10.0))
+
+    def test_join_aliases(self):
+        ReportQuery = self.env["dynamic.report.query"]
+        self.assertEqual(
+            ReportQuery._get_move_line_from('"m"."ref" = %s', "l.debit"),
+            "account_move_line l JOIN account_move m ON (l.move_id = m.id)",
+        )
+        self.assertEqual(
+            ReportQuery._get_move_line_from("l.name", "p_id"), "account_move_line l"
+        )
+
+    def test_debug_timings(self):
+        """The stages of the report are returned in debug mode only"""
+        self.env["ir.config_parameter"].sudo().set_param(
+            "dynamic_accounts_report.cache_max_size", 0
+        )
+        user = new_test_user(
+            self.env, login="drt_timing_user", groups="account.group_account_user"
+        )
+        wizard = (
+            self.env["account.general.ledger"]
+            .with_user(user)
+            .create({"journal_ids": [(6, 0, self.journal.ids)]})
+        )
+        res = wizard.view_report([wizard.id], "General Ledger")
+        self.assertNotIn("debug_timings", res)
+        user.groups_id |= self.env.ref("base.group_no_one")
+        res = wizard.view_report([wizard.id], "General Ledger")
+        timings = res["debug_timings"]
+        self.assertEqual(timings[0]["stage"], "view_report")
+        stages = {stage["stage"]: stage for stage in timings}
+        self.assertEqual(
+            [stages[name]["depth"] for name in ("view_report", "cache", "accounts")],
+            [0, 1, 2],
+        )
+        self.assertTrue(stages["accounts"]["queries"])
+        self.assertTrue(stages["accounts"]["rows"])
+        self.assertGreaterEqual(
+            stages["view_report"]["queries"], stages["accounts"]["queries"]
+        )
@@ -1,21 +1,22 @@
 # Copyright 2021 Ecosoft Co., Ltd. (http://ecosoft.co.th)
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
-import io
 import json
 import time
+from datetime import timedelta
+
+from dateutil.relativedelta import relativedelta
 
 from odoo import _, api, fields, models
 from odoo.exceptions import UserError
+from odoo.tools.misc import format_date
 
-try:
-    from odoo.tools.misc import xlsxwriter
-except ImportError:
-    import xlsxwriter
+from ..models.report_payload import compact_rows
 
 
 class BalanceSheetView(models.TransientModel):
     _name = "dynamic.balance.sheet.report"
+    _inherit = ["dynamic.report.query", "dynamic.report.filter"]
 
     company_id = fields.Many2one(
         comodel_name="res.company",
@@ -82,6 +83,23 @@ class BalanceSheetView(models.TransientModel):
         comodel_name="operating.unit",
         string="Operating Unit",
     )
+    comparison = fields.Selection(
+        selection=[
+            ("none", "No Comparison"),
+            ("period", "Previous Periods"),
+            ("year", "Same Period of Previous Years"),
+            ("month", "Monthly"),
+        ],
+        required=True,
+        default="none",
+        help="Adds a balance column per compared period. Monthly splits the "
+        "date range of the report in months.",
+    )
+    comparison_periods = fields.Integer(
+        string="Compared Periods",
+        default=1,
+        help="Number of previous periods or years compared to the report.",
+    )
 
     @api.model
     def create(self, vals):
@@ -134,50 +152,72 @@ class BalanceSheetView(models.TransientModel):
             vals.update({"debit_credit": vals.get("debit_credit").lower()})
         return super().write(vals)
 
+    def _get_comparison_periods(self):
+        """returns the ``(label, date_from, date_to)`` of the periods the
+        report is compared with, as set on the wizard"""
+        self.ensure_one()
+        if self.comparison == "none":
+            return []
+        if not (self.date_from and self.date_to):
+            raise UserError(
+                _("Set the start and end dates of the report to compare periods.")
+            )
+        date_from, date_to = self.date_from, self.date_to
+        periods = []
+        if self.comparison == "month":
+            month_start = date_from.replace(day=1)
+            while month_start <= date_to:
+                next_month = month_start + relativedelta(months=1)
+                periods.append(
+                    (
+                        format_date(self.env, month_start, date_format="MMM y"),
+                        max(month_start, date_from),
+                        min(next_month - timedelta(days=1), date_to),
+                    )
+                )
+                month_start = next_month
+            return periods
+        months = 0
+        if date_from.day == 1 and (date_to + timedelta(days=1)).day == 1:
+            # whole months are compared with the same number of months
+            months = (
+                (date_to.year - date_from.year) * 12
+                + date_to.month
+                - date_from.month
+                + 1
+            )
+        for i in range(1, max(self.comparison_periods, 1) + 1):
+            if self.comparison == "year":
+                period_from = date_from - relativedelta(years=i)
+                period_to = date_to - relativedelta(years=i)
+            elif months:
+                period_from = date_from - relativedelta(months=months * i)
+                period_to = (
+                    period_from + relativedelta(months=months) - timedelta(days=1)
+                )
+            else:
+                days = (date_to - date_from).days + 1
+                period_from = date_from - timedelta(days=days * i)
+                period_to = date_to - timedelta(days=days * i)
+            periods.append(
+                (
+                    "%s - %s"
+                    % (
+                        format_date(self.env, period_from),
+                        format_date(self.env, period_to),
+                    ),
+                    period_from,
+                    period_to,
+                )
+            )
+        return periods
+
     def get_filter_data(self, option):
+        """returns the filters of the wizard ``option[0]``. The options of
+        the filters are searched with search_filter_options()."""
         r = self.env["dynamic.balance.sheet.report"].search([("id", "=", option[0])])
-        default_filters = {}
         company_id = self.env.company
-        company_domain = [("company_id", "=", company_id.id)]
-        journals = (
-            r.journal_ids
-            if r.journal_ids
-            else self.env["account.journal"].search(company_domain)
-        )
-        analytics = (
-            r.analytic_ids
-            if r.analytic_ids
-            else self.env["account.analytic.account"].search(company_domain)
-        )
-        operating_units = (
-            r.operating_unit_ids
-            if r.operating_unit_ids
-            else self.env["operating.unit"].search(company_domain)
-        )
-        account_tags = (
-            r.account_tag_ids
-            if r.account_tag_ids
-            else self.env["account.account.tag"].search([])
-        )
-        analytic_tags = (
-            r.analytic_tag_ids
-            if r.analytic_tag_ids
-            else self.env["account.analytic.tag"]
-            .sudo()
-            .search(
-                ["|", ("company_id", "=", company_id.id), ("company_id", "=", False)]
-            )
-        )
-
-        if r.account_tag_ids:
-            company_domain.append(("tag_ids", "in", r.account_tag_ids.ids))
-
-        accounts = (
-            r.account_ids
-            if r.account_ids
-            else self.env["account.account"].search(company_domain)
-        )
-        filter_dict = {
+        return {
             "journal_ids": r.journal_ids.ids,
             "account_ids": r.account_ids.ids,
             "analytic_ids": r.analytic_ids.ids,
@@ -186,39 +226,33 @@ class BalanceSheetView(models.TransientModel):
             "date_from": r.date_from,
             "date_to": r.date_to,
             "target_move": r.target_move,
-            "journals_list": [(j.id, j.name, j.code) for j in journals],
-            "accounts_list": [(a.id, a.name) for a in accounts],
-            "analytic_list": [(anl.id, anl.name) for anl in analytics],
-            "operating_unit_list": [
-                (ou.id, ou.name, ou.code) for ou in operating_units
-            ],
             "company_name": company_id and company_id.name,
             "analytic_tag_ids": r.analytic_tag_ids.ids,
-            "analytic_tag_list": [(anltag.id, anltag.name) for anltag in analytic_tags],
             "account_tag_ids": r.account_tag_ids.ids,
-            "account_tag_list": [(a.id, a.name) for a in account_tags],
             "debit_credit": r.debit_credit,
+            "comparison": r.comparison,
+            "comparison_periods": r.comparison_periods,
         }
-        filter_dict.update(default_filters)
-        return filter_dict
 
     def get_filter(self, option):
         data = self.get_filter_data(option)
         filters = {}
         if data.get("journal_ids"):
-            filters["journals"] = (
-                self.env["account.journal"]
-                .browse(data.get("journal_ids"))
-                .mapped("code")
-            )
+            filters["journals"] = [
+                label["text"]
+                for label in self.get_filter_labels(
+                    "journals", data["journal_ids"], "code"
+                )
+            ]
         else:
             filters["journals"] = ["All"]
         if data.get("account_ids", []):
-            filters["accounts"] = (
-                self.env["account.account"]
-                .browse(data.get("account_ids", []))
-                .mapped("code")
-            )
+            filters["accounts"] = [
+                label["text"]
+                for label in self.get_filter_labels(
+                    "accounts", data["account_ids"], "code"
+                )
+            ]
         else:
             filters["accounts"] = ["All"]
         if data.get("target_move"):
@@ -234,177 +268,122 @@ class BalanceSheetView(models.TransientModel):
         else:
             filters["date_to"] = False
         if data.get("analytic_ids", []):
-            filters["analytics"] = (
-                self.env["account.analytic.account"]
-                .browse(data.get("analytic_ids", []))
-                .mapped("name")
-            )
+            filters["analytics"] = [
+                label["text"]
+                for label in self.get_filter_labels(
+                    "analytics", data["analytic_ids"], "name"
+                )
+            ]
         else:
             filters["analytics"] = ["All"]
 
         if data.get("account_tag_ids"):
-            filters["account_tags"] = (
-                self.env["account.account.tag"]
-                .browse(data.get("account_tag_ids", []))
-                .mapped("name")
-            )
+            filters["account_tags"] = [
+                label["text"]
+                for label in self.get_filter_labels(
+                    "account_tags", data["account_tag_ids"], "name"
+                )
+            ]
         else:
             filters["account_tags"] = ["All"]
 
         if data.get("analytic_tag_ids", []):
-            filters["analytic_tags"] = (
-                self.env["account.analytic.tag"]
-                .browse(data.get("analytic_tag_ids", []))
-                .mapped("name")
-            )
+            filters["analytic_tags"] = [
+                label["text"]
+                for label in self.get_filter_labels(
+                    "analytic_tags", data["analytic_tag_ids"], "name"
+                )
+            ]
         else:
             filters["analytic_tags"] = ["All"]
 
         if data.get("operating_unit_ids"):
-            filters["operating_units"] = (
-                self.env["operating.unit"]
-                .browse(data.get("operating_unit_ids"))
-                .mapped("code")
-            )
+            filters["operating_units"] = [
+                label["text"]
+                for label in self.get_filter_labels(
+                    "operating_units", data["operating_unit_ids"], "code"
+                )
+            ]
         else:
             filters["operating_units"] = ["All"]
 
         filters["company_id"] = ""
-        filters["accounts_list"] = data.get("accounts_list")
-        filters["journals_list"] = data.get("journals_list")
-        filters["analytic_list"] = data.get("analytic_list")
-        filters["account_tag_list"] = data.get("account_tag_list")
-        filters["analytic_tag_list"] = data.get("analytic_tag_list")
         filters["company_name"] = data.get("company_name")
         filters["target_move"] = data.get("target_move").capitalize()
         filters["debit_credit"] = data.get("debit_credit")
-        filters["operating_unit_list"] = data.get("operating_unit_list")
+        filters["comparison"] = data.get("comparison")
+        filters["comparison_periods"] = data.get("comparison_periods")
         return filters
 
-    def _get_accounts(self, accounts, init_balance, display_account, data):
-        cr = self.env.cr
-        MoveLine = self.env["account.move.line"]
-        move_lines = {x: [] for x in accounts.ids}
-
-        # Prepare sql query base on selected parameters from wizard
-        tables, where_clause, where_params = MoveLine._query_get()
-        wheres = [""]
-        if where_clause.strip():
-            wheres.append(where_clause.strip())
-        final_filters = " AND ".join(wheres)
-        final_filters = final_filters.replace(
-            "account_move_line__move_id", "m"
-        ).replace("account_move_line", "l")
-        new_final_filter = final_filters
-
-        if data["target_move"] == "posted":
-            new_final_filter += " AND m.state = 'posted'"
-        else:
-            new_final_filter += " AND m.state in ('draft','posted')"
-
+    def _get_account_totals(self, data, display_account="all"):
+        """returns the debit, credit, balance and number of journal items of
+        each account of the report between the dates of ``data``, as a dict
+        keyed by account id. The query selects the accounts itself, only
+        those listed in the ``display_account`` mode."""
+        DailyBalance = self.env["dynamic.report.daily.balance"]
+        if DailyBalance._is_enabled() and not data["analytic_tags"]:
+            if not data["accounts"]:
+                return {}
+            totals = DailyBalance._get_account_totals(
+                data["accounts"].ids,
+                date_from=data.get("date_from"),
+                date_to=data.get("date_to"),
+                target_move=data["target_move"],
+                journal_ids=data["journals"].ids,
+                operating_unit_ids=data["operating_units"].ids,
+                analytic_ids=data["analytics"].ids,
+            )
+            return self._filter_display_totals(totals, display_account)
+        where, params = self._get_move_line_where(data)
         if data.get("date_from"):
-            new_final_filter += " AND l.date >= '%s'" % data.get("date_from")
+            where += " AND l.date >= %s"
+            params.append(data["date_from"])
         if data.get("date_to"):
-            new_final_filter += " AND l.date <= '%s'" % data.get("date_to")
-
-        if data["journals"]:
-            new_final_filter += " AND j.id IN %s" % str(
-                tuple(data["journals"].ids) + tuple([0])
-            )
-
-        if data.get("accounts"):
-            WHERE = "WHERE l.account_id IN %s" % str(
-                tuple(data.get("accounts").ids) + tuple([0])
-            )
-        else:
-            WHERE = "WHERE l.account_id IN %s"
-
-        if data["analytics"]:
-            WHERE += " AND anl.id IN %s" % str(
-                tuple(data.get("analytics").ids) + tuple([0])
-            )
-
-        if data["analytic_tags"]:
-            WHERE += " AND anltag.account_analytic_tag_id IN %s" % str(
-                tuple(data.get("analytic_tags").ids) + tuple([0])
-            )
-
-        if data["operating_units"]:
-            WHERE += " AND l.operating_unit_id IN %s" % str(
-                tuple(data.get("operating_units").ids) + tuple([0])
-            )
-
-        # Get move lines base on sql query and Calculate the total balance of move lines
-        sql = (
-            """SELECT l.id AS lid,m.id AS move_id, l.account_id AS account_id,
-                    l.date AS ldate, j.code AS lcode, l.currency_id,
-                    l.amount_currency, l.ref AS lref,
-                    l.name AS lname, COALESCE(l.debit,0) AS debit,
-                    COALESCE(l.credit,0) AS credit,
-                    COALESCE(SUM(l.balance),0) AS balance,\
-                    m.name AS move_name, c.symbol AS currency_code,
-                    c.position AS currency_position, p.name AS partner_name\
-                    FROM account_move_line l\
-                    JOIN account_move m ON (l.move_id = m.id)\
-                    LEFT JOIN res_currency c ON (l.currency_id = c.id)\
-                    LEFT JOIN res_partner p ON (l.partner_id = p.id)\
-                    LEFT JOIN account_analytic_account anl
-                        ON (l.analytic_account_id = anl.id)\
-                    LEFT JOIN account_analytic_tag_account_move_line_rel anltag
-                        ON (anltag.account_move_line_id = l.id)\
-                    JOIN account_journal j ON (l.journal_id = j.id)\
-                    JOIN account_account acc ON (l.account_id = acc.id) """
-            + WHERE
-            + new_final_filter
-            + """ GROUP BY l.id, m.id, l.account_id,
-                l.date, j.code, l.currency_id, l.amount_currency, l.ref,
-                l.name, m.name, c.symbol, c.position, p.name"""
+            where += " AND l.date <= %s"
+            params.append(data["date_to"])
+        having, having_params = self._get_zero_balance_having(display_account)
+        self._execute_report_query(
+            """SELECT l.account_id AS id,
+                    COALESCE(SUM(l.debit), 0) AS debit,
+                    COALESCE(SUM(l.credit), 0) AS credit,
+                    COALESCE(SUM(l.balance), 0) AS balance,
+                    COUNT(*) AS count
+                FROM """
+            + self._get_move_line_from(where)
+            + " WHERE "
+            + where
+            + " GROUP BY l.account_id"
+            + having,
+            params + having_params,
         )
-        if data.get("accounts"):
-            params = tuple(where_params)
-        else:
-            params = (tuple(accounts.ids),) + tuple(where_params)
-        cr.execute(sql, params)
-
-        for row in cr.dictfetchall():
-            balance = 0
-            for line in move_lines.get(row["account_id"]):
-                balance += round(line["debit"], 2) - round(line["credit"], 2)
-            row["balance"] += round(balance, 2)
-            row["m_id"] = row["account_id"]
-            move_lines[row.pop("account_id")].append(row)
-        # Calculate the debit, credit and balance for Accounts
+        return {row["id"]: row for row in self.env.cr.dictfetchall()}
+
+    def _get_accounts(self, accounts, init_balance, display_account, data):
+        """returns the debit, credit and balance of ``accounts`` for the
+        filters of ``data``, summed by the database without reading the
+        journal items themselves"""
+        totals = self._get_account_totals(data, display_account)
         account_res = []
-        for account in accounts:
-            currency = (
-                account.currency_id
-                and account.currency_id
-                or account.company_id.currency_id
-            )
-            res = {fn: 0.0 for fn in ["credit", "debit", "balance"]}
+        for account in self._get_display_accounts(accounts, display_account, totals):
+            total = totals.get(account.id, {})
+            res = {
+                fn: round(total.get(fn, 0.0), 2)
+                for fn in ["credit", "debit", "balance"]
+            }
             res["code"] = account.code
             res["name"] = account.name
             res["id"] = account.id
-            res["move_lines"] = move_lines[account.id]
-            for line in res.get("move_lines"):
-                res["debit"] += round(line["debit"], 2)
-                res["credit"] += round(line["credit"], 2)
-                res["balance"] = round(line["balance"], 2)
-            if display_account == "all":
-                account_res.append(res)
-            if display_account == "movement" and res.get("move_lines"):
-                account_res.append(res)
-            if display_account == "not_zero" and not currency.is_zero(res["balance"]):
-                account_res.append(res)
+            res["move_lines"] = []
+            account_res.append(res)
         return account_res
 
     def _get_report_values(self, data):
         docs = data["model"]
         display_account = data["display_account"]
         init_balance = True
-        accounts = self.env["account.account"].search([])
-        if not accounts:
+        if not self.env["account.account"].search_count([]):
             raise UserError(_("No Accounts Found! Please Add One"))
+        accounts = data["accounts"]
         account_res = self._get_accounts(accounts, init_balance, display_account, data)
         debit_total = 0
         debit_total = sum(x["debit"] for x in account_res)
@@ -421,14 +400,43 @@ class BalanceSheetView(models.TransientModel):
         }
 
     @api.model
-    def view_report(self, option, tag):
+    def view_report(self, option, tag, compact=False):
+        """returns the report of wizard ``option[0]``. With ``compact``, the
+        lines are sent as columns and rows and the accounts without their
+        journal items, which the screen does not show."""
+        with self._report_timings("view_report") as timings:
+            r = self.env["dynamic.balance.sheet.report"].search(
+                [("id", "=", option[0])]
+            )
+            ReportCache = self.env["dynamic.report.cache"]
+            values = dict(ReportCache._get_wizard_values(r), tag=tag)
+            with self._report_stage("cache"):
+                res = ReportCache._get_result(
+                    self._name, values, lambda: self._view_report(option, tag)
+                )
+            # the filters list the current journals, accounts, ... to choose
+            # from
+            with self._report_stage("filters"):
+                res["filters"] = self.get_filter(option)
+            if compact:
+                with self._report_stage("payload"):
+                    res["report_lines"] = compact_rows(
+                        res["report_lines"], exclude=("move_lines",)
+                    )
+                    res["bs_lines"] = compact_rows(res["bs_lines"])
+        if self._debug_timings():
+            res["debug_timings"] = timings
+        return res
+
+    @api.model
+    def _view_report(self, option, tag):
         r = self.env["dynamic.balance.sheet.report"].search([("id", "=", option[0])])
         data = {
             "display_account": r.display_account,
             "model": self,
             "journals": r.journal_ids,
             "target_move": r.target_move,
-            "accounts": r.account_ids,
+            "account_ids": r.account_ids,
             "account_tags": r.account_tag_ids,
             "analytics": r.analytic_ids,
             "analytic_tags": r.analytic_tag_ids,
@@ -457,23 +465,13 @@ class BalanceSheetView(models.TransientModel):
         new_account_ids = self.env["account.account"].search(company_domain)
         data.update({"accounts": new_account_ids})
         filters = self.get_filter(option)
-        records = self._get_report_values(data)
-
-        if filters["account_tags"] != ["All"]:
-            tag_accounts = list(map(lambda x: x.code, new_account_ids))
-
-            def filter_code(rec_dict):
-                if rec_dict["code"] in tag_accounts:
-                    return True
-                else:
-                    return False
-
-            new_records = list(filter(filter_code, records["Accounts"]))
-            records["Accounts"] = new_records
+        with self._report_stage("accounts"):
+            records = self._get_report_values(data)
 
         account_report_id = self.env["account.financial.report"].search(
             [("name", "ilike", tag)]
         )
+        periods = r._get_comparison_periods()
 
         new_data = {
             "id": self.id,
@@ -494,10 +492,37 @@ class BalanceSheetView(models.TransientModel):
                 "company_id": self.company_id,
                 "lang": "en_US",
             },
+            "periods": [(date_from, date_to) for _label, date_from, date_to in periods],
+            "move_line_filters": data,
+        }
+
+        with self._report_stage("account_lines"):
+            account_lines = self.get_account_lines(new_data)
+        with self._report_stage("report_lines"):
+            report_lines = self.view_report_pdf(account_lines, new_data)[
+                "report_lines"
+            ]
+        with self._report_stage("rollup"):
+            final_report_lines = self._rollup_report_lines(records, report_lines)
+        currency = self.env.company.currency_id
+        return {
+            "name": tag,
+            "type": "ir.actions.client",
+            "tag": tag,
+            "filters": filters,
+            "report_lines": records["Accounts"],
+            "debit_total": records["debit_total"],
+            "credit_total": records["credit_total"],
+            "debit_balance": records["debit_balance"],
+            "currency": currency,
+            "bs_lines": final_report_lines,
+            "periods": [label for label, _date_from, _date_to in periods],
         }
 
-        account_lines = self.get_account_lines(new_data)
-        report_lines = self.view_report_pdf(account_lines, new_data)["report_lines"]
+    def _rollup_report_lines(self, records, report_lines):
+        """returns the lines of the financial report to show, with the
+        debit, credit and balance of the accounts of ``records`` rolled up
+        to their reports"""
         move_line_accounts = []
         move_lines_dict = {}
 
@@ -508,6 +533,20 @@ class BalanceSheetView(models.TransientModel):
             move_lines_dict[rec["code"]]["credit"] = rec["credit"]
             move_lines_dict[rec["code"]]["balance"] = rec["balance"]
 
+        # the accounts only moving in a compared period are shown too
+        for rec in report_lines:
+            if (
+                rec["type"] == "account"
+                and rec["code"] not in move_lines_dict
+                and any(rec["balance_periods"])
+            ):
+                move_line_accounts.append(rec["code"])
+                move_lines_dict[rec["code"]] = {
+                    "debit": 0.0,
+                    "credit": 0.0,
+                    "balance": 0.0,
+                }
+
         report_lines_move = []
         parent_list = []
 
@@ -531,26 +570,26 @@ class BalanceSheetView(models.TransientModel):
                     rec["credit"] = move_lines_dict[rec["code"]]["credit"]
                     rec["balance"] = move_lines_dict[rec["code"]]["balance"]
 
-        parent_list = list(set(parent_list))
-        max_level = 0
-        for rep in report_lines_move:
-            if rep["level"] > max_level:
-                max_level = rep["level"]
-
-        def get_parents(obj):
-            for item in report_lines_move:
-                for each in obj:
-                    if item["report_type"] != "account_type" and each in item["c_ids"]:
-                        obj.append(item["r_id"])
-                if item["report_type"] == "account_report":
-                    obj.append(item["r_id"])
-                    break
-
-        get_parents(parent_list)
-        for _i in range(max_level):
-            get_parents(parent_list)
-
-        parent_list = list(set(parent_list))
+        # the reports to show are the ancestors of the accounts with journal
+        # items, and the first 'account_report' line with its ancestors;
+        # reports after that line only show when they are direct parents
+        parent_reports = {}
+        seeds = set(parent_list)
+        for item in report_lines_move:
+            if item["report_type"] != "account_type":
+                for child_id in item["c_ids"]:
+                    parent_reports.setdefault(child_id, []).append(item["r_id"])
+            if item["report_type"] == "account_report":
+                seeds.add(item["r_id"])
+                break
+        parent_list = set()
+        todo = list(seeds)
+        while todo:
+            report_id = todo.pop()
+            if report_id not in parent_list:
+                parent_list.add(report_id)
+                todo += parent_reports.get(report_id, [])
+
         final_report_lines = []
 
         for rec in report_lines_move:
@@ -560,36 +599,29 @@ class BalanceSheetView(models.TransientModel):
             else:
                 final_report_lines.append(rec)
 
-        def filter_sum(obj):
-            sum_list = {}
-            for pl in parent_list:
-                sum_list[pl] = {}
-                sum_list[pl]["s_debit"] = 0
-                sum_list[pl]["s_credit"] = 0
-                sum_list[pl]["s_balance"] = 0
-
-            for each in obj:
-                if each["p_id"] and each["p_id"] in parent_list:
-                    sum_list[each["p_id"]]["s_debit"] += each["debit"]
-                    sum_list[each["p_id"]]["s_credit"] += each["credit"]
-                    sum_list[each["p_id"]]["s_balance"] += each["balance"]
-            return sum_list
-
-        def assign_sum(obj):
-            for each in obj:
-                if (
-                    each["r_id"] in parent_list
-                    and each["report_type"] != "account_report"
-                ):
-                    each["debit"] = sum_list_new[each["r_id"]]["s_debit"]
-                    each["credit"] = sum_list_new[each["r_id"]]["s_credit"]
+        # roll the debit and credit of the lines up to the reports shown,
+        # children first
+        children = {}
+        for each in final_report_lines:
+            if each["p_id"] and each["p_id"] in parent_list:
+                children.setdefault(each["p_id"], []).append(each)
+
+        def rollup(line):
+            line_children = children.get(line["r_id"], [])
+            for child in line_children:
+                rollup(child)
+            if (
+                line["r_id"] in parent_list
+                and line["report_type"] != "account_report"
+            ):
+                line["debit"] = sum(child["debit"] for child in line_children)
+                line["credit"] = sum(child["credit"] for child in line_children)
 
-        for _p in range(max_level):
-            sum_list_new = filter_sum(final_report_lines)
-            assign_sum(final_report_lines)
+        for rec in final_report_lines:
+            if not (rec["p_id"] and rec["p_id"] in parent_list):
+                rollup(rec)
 
-        company_id = self.env.company
-        currency = company_id.currency_id
+        currency = self.env.company.currency_id
         symbol = currency.symbol
         position = currency.position
 
@@ -602,37 +634,57 @@ class BalanceSheetView(models.TransientModel):
                 rec["balance_cmp"] > 0 and rec["balance"] < 0
             ):
                 rec["balance"] = rec["balance"] * -1
+            rec["balance_periods"] = [
+                round(amount, 2) for amount in rec["balance_periods"]
+            ]
 
             if position == "before":
                 rec["m_debit"] = symbol + " " + "{:,.2f}".format(rec["debit"])
                 rec["m_credit"] = symbol + " " + "{:,.2f}".format(rec["credit"])
                 rec["m_balance"] = symbol + " " + "{:,.2f}".format(rec["balance"])
+                rec["m_balance_periods"] = [
+                    symbol + " " + "{:,.2f}".format(amount)
+                    for amount in rec["balance_periods"]
+                ]
             else:
                 rec["m_debit"] = "{:,.2f}".format(rec["debit"]) + " " + symbol
                 rec["m_credit"] = "{:,.2f}".format(rec["credit"]) + " " + symbol
                 rec["m_balance"] = "{:,.2f}".format(rec["balance"]) + " " + symbol
+                rec["m_balance_periods"] = [
+                    "{:,.2f}".format(amount) + " " + symbol
+                    for amount in rec["balance_periods"]
+                ]
 
-        return {
-            "name": tag,
-            "type": "ir.actions.client",
-            "tag": tag,
-            "filters": filters,
-            "report_lines": records["Accounts"],
-            "debit_total": records["debit_total"],
-            "credit_total": records["credit_total"],
-            "debit_balance": records["debit_balance"],
-            "currency": currency,
-            "bs_lines": final_report_lines,
-        }
+        return final_report_lines
+
+    @api.model
+    def _get_print_data(self, option, tag, collapsed_ids=None):
+        """returns the result of view_report() for wizard ``option[0]``
+        without the lines of the nodes collapsed on screen,
+        ``collapsed_ids``, as printed and exported"""
+        res = self.view_report(option, tag)
+        collapsed_ids = set(collapsed_ids or [])
+        res["bs_lines"] = [
+            line for line in res["bs_lines"] if line["p_id"] not in collapsed_ids
+        ]
+        return res
 
     def get_dynamic_xlsx_report(self, options, response, report_data, dfr_data):
+        """Export the report of the wizard whose id is in ``options`` to
+        XLSX, without the nodes whose ids are in ``dfr_data``"""
         i_data = str(report_data)
-        filters = json.loads(options)
-        j_data = dfr_data
-        rl_data = json.loads(j_data)
+        res = self._get_print_data(json.loads(options), i_data, json.loads(dfr_data))
+        filters = res["filters"]
+        rl_data = res["bs_lines"]
+
+        with self.env["dynamic.report.xlsx"]._open_workbook(response) as workbook:
+            self._write_xlsx_report(
+                workbook, filters, i_data, rl_data, res.get("periods")
+            )
 
-        output = io.BytesIO()
-        workbook = xlsxwriter.Workbook(output, {"in_memory": True})
+    def _write_xlsx_report(self, workbook, filters, i_data, rl_data, periods=None):
+        """Write the report lines ``rl_data`` to ``workbook``, row by row,
+        with a balance column per compared period of ``periods``"""
         sheet = workbook.add_worksheet()
         head = workbook.add_format(
             {"align": "center", "bold": True, "font_size": "20px"}
@@ -698,10 +750,12 @@ class BalanceSheetView(models.TransientModel):
 
         if filters.get("date_from"):
             sheet.merge_range(
-                "A4:B4", "From: " + filters.get("date_from"), date_head_left
+                "A4:B4", "From: " + str(filters["date_from"]), date_head_left
             )
         if filters.get("date_to"):
-            sheet.merge_range("C4:D4", "To: " + filters.get("date_to"), date_head_right)
+            sheet.merge_range(
+                "C4:D4", "To: " + str(filters["date_to"]), date_head_right
+            )
 
         sheet.merge_range(
             "A5:D6",
@@ -740,14 +794,26 @@ class BalanceSheetView(models.TransientModel):
                 "A{}:C{}".format(str(row + 1), str(row + 1)), "", sub_heading
             )
         sheet.write(row, col + 3, "Balance", sub_heading)
+        for i, period in enumerate(periods or []):
+            sheet.set_column(col + 4 + i, col + 4 + i, 15)
+            sheet.write(row, col + 4 + i, period, sub_heading)
+
+        # one format per indent level, shared by all the lines of that level
+        level_formats = {}
+
+        def get_level_format(level):
+            if level not in level_formats:
+                level_format = workbook.add_format({"font_size": "10px", "border": 1})
+                level_format.set_indent(level - 1)
+                level_formats[level] = level_format
+            return level_formats[level]
 
         if rl_data:
             for fr in rl_data:
 
                 row += 1
 
-                txt_name = workbook.add_format({"font_size": "10px", "border": 1})
-                txt_name.set_indent(fr["level"] - 1)
+                txt_name = get_level_format(fr["level"])
 
                 if filters["debit_credit"] == "show":
                     if fr["level"] == 1:
@@ -778,8 +844,5 @@ class BalanceSheetView(models.TransientModel):
                             txt_name,
                         )
                 sheet.write(row, col + 3, fr["balance"], txt)
-
-        workbook.close()
-        output.seek(0)
-        response.stream.write(output.read())
-        output.close()
+                for i, amount in enumerate(fr.get("balance_periods", [])):
+                    sheet.write(row, col + 4 + i, amount, txt)
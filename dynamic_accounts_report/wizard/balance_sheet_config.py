@@ -3,70 +3,78 @@
 
 import re
 
-from odoo import models
+from odoo import api, models
 
 
 class BalanceSheet(models.TransientModel):
     _inherit = "dynamic.balance.sheet.report"
 
-    def find_journal_items(self, report_lines, form):
-        cr = self.env.cr
-        journal_items = []
+    def find_journal_items(self, report_lines, form, limit=80):
+        """returns the journal items of the account lines of the report
+        matching the wizard filters ``form["move_line_filters"]``, at most
+        ``limit`` per account, fetched in a single query"""
+        lines_by_account = {}
         for i in report_lines:
             if i["type"] == "account":
-                account = i["account"]
-                if form["target_move"] == "posted":
-                    search_query = (
-                        "select aml.id, am.id as j_id, aml.account_id, aml.date,"
-                        " aml.name as label, am.name, "
-                        + "(aml.debit-aml.credit) as balance, aml.debit, "
-                        "aml.credit, aml.partner_id "
-                        + " from account_move_line aml join account_move am "
-                        "on (aml.move_id=am.id and am.state=%s) "
-                        + " where aml.account_id=%s"
-                    )
-                    vals = [form["target_move"]]
-                else:
-                    search_query = (
-                        "select aml.id, am.id as j_id, aml.account_id, aml.date, "
-                        "aml.name as label, am.name, "
-                        + "(aml.debit-aml.credit) as balance, "
-                        "aml.debit, aml.credit, aml.partner_id "
-                        + " from account_move_line aml "
-                        "join account_move am on (aml.move_id=am.id) "
-                        + " where aml.account_id=%s"
-                    )
-                    vals = []
-                if form["date_from"] and form["date_to"]:
-                    search_query += " and aml.date>=%s and aml.date<=%s"
-                    vals += [account, form["date_from"], form["date_to"]]
-                elif form["date_from"]:
-                    search_query += " and aml.date>=%s"
-                    vals += [account, form["date_from"]]
-                elif form["date_to"]:
-                    search_query += " and aml.date<=%s"
-                    vals += [account, form["date_to"]]
-                else:
-                    vals += [account]
-
-                cr.execute(search_query, tuple(vals))
-                items = cr.dictfetchall()
-
-                for j in items:
-                    temp = j["id"]
-                    j["id"] = re.sub("[^0-9a-zA-Z]+", "", i["name"]) + str(temp)
-                    j["p_id"] = str(i["a_id"])
-                    j["type"] = "journal_item"
-                    journal_items.append(j)
+                lines_by_account.setdefault(i["account"], []).append(i)
+        if not lines_by_account:
+            return []
+        data = form["move_line_filters"]
+        where, params = self._get_move_line_where(data, list(lines_by_account))
+        if data.get("date_from"):
+            where += " AND l.date >= %s"
+            params.append(data["date_from"])
+        if data.get("date_to"):
+            where += " AND l.date <= %s"
+            params.append(data["date_to"])
+        select = """SELECT l.id, l.move_id AS j_id, l.account_id, l.date,
+                l.name AS label, m.name,
+                (l.debit - l.credit) AS balance,
+                l.debit, l.credit, l.partner_id,
+                ROW_NUMBER() OVER (
+                    PARTITION BY l.account_id ORDER BY l.date, l.id
+                ) AS item_rank"""
+        self._execute_report_query(
+            """SELECT id, j_id, account_id, date, label, name, balance,
+                    debit, credit, partner_id
+                FROM ("""
+            + select
+            + " FROM "
+            + self._get_move_line_from(select, where)
+            + " WHERE "
+            + where
+            + """) AS items
+                WHERE item_rank <= %s
+                ORDER BY account_id, date, id""",
+            params + [limit],
+        )
+        journal_items = []
+        for item in self.env.cr.dictfetchall():
+            for i in lines_by_account[item["account_id"]]:
+                j = dict(item)
+                j["id"] = re.sub("[^0-9a-zA-Z]+", "", i["name"]) + str(item["id"])
+                j["p_id"] = str(i["a_id"])
+                j["type"] = "journal_item"
+                journal_items.append(j)
         return journal_items
 
-    def view_report_pdf(self, acc, form):
+    def view_report_pdf(self, acc, form, with_journal_items=False):
         data = dict()
         report_lines = acc
         data["form"] = form
 
-        # find the journal items of these accounts
-        journal_items = self.find_journal_items(report_lines, data["form"])
+        # find the journal items of these accounts, only when asked for
+        journal_items = []
+        if with_journal_items:
+            with self._report_stage("journal_items"):
+                journal_items = self.find_journal_items(report_lines, data["form"])
+
+        # index the lines by the key their children refer to them with
+        lines_by_key = {}
+        for line in report_lines:
+            key = "a_id" if line["type"] == "account" else "id"
+            lines_by_key.setdefault(line[key], line)
+        levels = {}
 
         def set_report_level(rec):
             """This function is used to set the level of each item.
@@ -75,11 +83,10 @@ class BalanceSheet(models.TransientModel):
             level = 1
             if not rec["parent"]:
                 return level
-            else:
-                for line in report_lines:
-                    key = "a_id" if line["type"] == "account" else "id"
-                    if line[key] == rec["parent"]:
-                        return level + set_report_level(line)
+            if rec["parent"] not in levels:
+                parent = lines_by_key.get(rec["parent"])
+                levels[rec["parent"]] = parent and set_report_level(parent)
+            return levels[rec["parent"]] and level + levels[rec["parent"]]
 
         # finding the root
         for item in report_lines:
@@ -112,7 +119,14 @@ class BalanceSheet(models.TransientModel):
         res = {}
         for account in accounts:
             res[account.id] = {fn: 0.0 for fn in mapping.keys()}
+        daily_balances = None
         if accounts:
+            daily_balances = self.env[
+                "dynamic.report.daily.balance"
+            ]._get_account_totals_from_context(accounts.ids)
+        if daily_balances is not None:
+            res.update(daily_balances)
+        elif accounts:
             tables, where_clause, where_params = self.env[
                 "account.move.line"
             ]._query_get()
@@ -126,85 +140,148 @@ class BalanceSheet(models.TransientModel):
                 + ", ".join(mapping.values())
                 + " FROM "
                 + tables
-                + " WHERE account_id IN %s "
+                + " WHERE account_id = ANY(%s) "
                 + filters
                 + " GROUP BY account_id"
             )
-            params = (tuple(accounts._ids),) + tuple(where_params)
+            params = [list(accounts._ids)] + list(where_params)
 
-            self.env.cr.execute(request, params)
+            self._execute_report_query(request, params)
             for row in self.env.cr.dictfetchall():
                 res[row["id"]] = row
 
         return res
 
-    def _compute_report_balance(self, reports):
+    def _compute_period_balances(self, account_ids, data, periods):
+        """returns the balances of ``account_ids`` in each of ``periods``, a
+        list of ``(date_from, date_to)``, for the wizard filters ``data``, as
+        a list per account id.
+
+        All the periods are summed in a single scan of the journal items,
+        with one filtered aggregate per period."""
+        res = {account_id: [0.0] * len(periods) for account_id in account_ids}
+        if not account_ids or not periods:
+            return res
+        where, params = self._get_move_line_where(data, account_ids)
+        where += " AND l.date >= %s AND l.date <= %s"
+        params += [
+            min(date_from for date_from, _date_to in periods),
+            max(date_to for _date_from, date_to in periods),
+        ]
+        columns = []
+        column_params = []
+        for date_from, date_to in periods:
+            columns.append(
+                "COALESCE(SUM(l.balance) "
+                "FILTER (WHERE l.date >= %s AND l.date <= %s), 0)"
+            )
+            column_params += [date_from, date_to]
+        self._execute_report_query(
+            "SELECT l.account_id, "
+            + ", ".join(columns)
+            + " FROM "
+            + self._get_move_line_from(where)
+            + " WHERE "
+            + where
+            + " GROUP BY l.account_id",
+            column_params + params,
+        )
+        for row in self.env.cr.fetchall():
+            res[row[0]] = list(row[1:])
+        return res
+
+    def _compute_report_balance(self, plan, period_balances=None, period_count=0):
         """returns a dictionary with key=the ID of a record and
          value=the credit, debit and balance amount
-        computed for this record. If the record is of type :
-        'accounts' : it's the sum of the linked accounts
-        'account_type' : it's the sum of leaf accounts with
+        computed for this record. If the record is of type :
+        'accounts' : it's the sum of the linked accounts
+        'account_type' : it's the sum of leaf accounts with
          such an account_type
-        'account_report' : it's the amount of the related report
-        'sum' : it's the sum of the children of this record
-         (aka a 'view' record)"""
+        'account_report' : it's the amount of the related report
+        'sum' : it's the sum of the children of this record
+         (aka a 'view' record)
+
+        The balances of all the accounts of the compiled report ``plan`` are
+        aggregated with a single query, then rolled up through the report
+        tree in memory.
+
+        The balances of the ``period_count`` compared periods, given by
+        account in ``period_balances`` as _compute_period_balances() returns
+        them, are rolled up along with them under ``periods``."""
+        account_balance = self._compute_account_balance(
+            self.env["account.account"].browse(self._get_plan_account_ids(plan))
+        )
+        period_balances = period_balances or {}
 
-        res = {}
         fields = ["credit", "debit", "balance"]
-        for report in reports:
-            if report.id in res:
-                continue
-            res[report.id] = {fn: 0.0 for fn in fields}
-            if report.type == "accounts":
-                # it's the sum of the linked accounts
-                res[report.id]["account"] = self._compute_account_balance(
-                    report.account_ids
-                )
-                for value in res[report.id]["account"].values():
-                    for field in fields:
-                        res[report.id][field] += value.get(field)
-            elif report.type == "account_type":
-                # it's the sum the leaf accounts
-                #  with such an account type
-                accounts = self.env["account.account"].search(
-                    [("user_type_id", "in", report.account_type_ids.ids)]
-                )
-                res[report.id]["account"] = self._compute_account_balance(accounts)
-                for value in res[report.id]["account"].values():
-                    for field in fields:
-                        res[report.id][field] += value.get(field)
-            elif report.type == "account_report" and report.account_report_id:
+        res = {}
+
+        def rollup(node):
+            if node.id in res:
+                return res[node.id]
+            res[node.id] = {fn: 0.0 for fn in fields}
+            res[node.id]["periods"] = [0.0] * period_count
+            if node.type in ("accounts", "account_type"):
+                res[node.id]["account"] = {
+                    account_id: dict(
+                        account_balance[account_id],
+                        periods=period_balances.get(account_id)
+                        or [0.0] * period_count,
+                    )
+                    for account_id in node.account_ids
+                }
+                values = res[node.id]["account"].values()
+            elif node.type == "account_report" and node.account_report_id:
                 # it's the amount of the linked report
-                res2 = self._compute_report_balance(report.account_report_id)
-                for key, value in res2.items():
-                    for field in fields:
-                        res[report.id][field] += value[field]
-            elif report.type == "sum":
+                values = [rollup(plan.nodes[node.account_report_id])]
+            elif node.type == "sum":
                 # it's the sum of the children of this account.report
-                res2 = self._compute_report_balance(report.children_ids)
-                for key, value in res2.items():
-                    for field in fields:
-                        res[report.id][field] += value[field]
-        return res
+                values = [rollup(plan.nodes[child]) for child in node.children_ids]
+            else:
+                values = []
+            for value in values:
+                for field in fields:
+                    res[node.id][field] += value.get(field)
+                for i, amount in enumerate(value["periods"]):
+                    res[node.id]["periods"][i] += amount
+            return res[node.id]
+
+        for report_id in plan.order:
+            rollup(plan.nodes[report_id])
+        return {report_id: res[report_id] for report_id in plan.order}
+
+    @api.model
+    def _get_plan_account_ids(self, plan):
+        return sorted(
+            {
+                account_id
+                for node in plan.nodes.values()
+                for account_id in node.account_ids
+            }
+        )
 
     def get_account_lines(self, data):
 
         lines = []
         account_report = data["account_report_id"]
-        child_reports = account_report._get_children_by_order()
-        res = self.with_context(data.get("used_context"))._compute_report_balance(
-            child_reports
-        )
-        if data["enable_filter"]:
-            comparison_res = self._compute_report_balance(child_reports)
-            for report_id, value in comparison_res.items():
-                res[report_id]["comp_bal"] = value["balance"]
-                report_acc = res[report_id].get("account")
-                if report_acc:
-                    for account_id, val in (
-                        comparison_res[report_id].get("account").items()
-                    ):
-                        report_acc[account_id]["comp_bal"] = val["balance"]
+        plan = account_report._get_report_plan()
+        child_reports = account_report.browse(plan.order)
+        period_balances = None
+        if data.get("periods"):
+            move_line_filters = data["move_line_filters"]
+            allowed_ids = set(move_line_filters["accounts"].ids)
+            with self._report_stage("period_balances"):
+                period_balances = self._compute_period_balances(
+                    [a for a in self._get_plan_account_ids(plan) if a in allowed_ids],
+                    move_line_filters,
+                    data["periods"],
+                )
+        with self._report_stage("report_balance"):
+            res = self.with_context(
+                data.get("used_context")
+            )._compute_report_balance(
+                plan, period_balances, len(data.get("periods") or [])
+            )
 
         for report in child_reports:
             r_name = str(report.name)
@@ -215,24 +292,24 @@ class BalanceSheet(models.TransientModel):
             else:
                 p_name = False
 
-            child_ids = []
-            for chd in report.children_ids:
-                child_ids.append(chd.id)
+            node = plan.nodes[report.id]
+            child_ids = list(node.children_ids)
 
             vals = {
                 "r_id": report.id,
-                "p_id": report.parent_id.id,
+                "p_id": node.parent_id,
                 "report_type": report.type,
                 "c_ids": child_ids,
                 "id": r_name + str(report.id),
                 "sequence": report.sequence,
                 "parent": p_name,
                 "name": report.name,
-                "balance": res[report.id]["balance"] * int(report.sign),
+                "balance": res[report.id]["balance"] * node.sign,
+                "balance_periods": [
+                    amount * node.sign for amount in res[report.id]["periods"]
+                ],
                 "type": "report",
-                "level": bool(report.style_overwrite)
-                and report.style_overwrite
-                or report.level,
+                "level": node.level,
                 "account_type": report.type or False,
                 "is_present": False,
                 # used to underline the financial report balances
@@ -242,10 +319,11 @@ class BalanceSheet(models.TransientModel):
                 vals["credit"] = res[report.id]["credit"]
 
             if data["enable_filter"]:
-                vals["balance_cmp"] = res[report.id]["comp_bal"] * int(report.sign)
+                # the signed balance the displayed balance is aligned with
+                vals["balance_cmp"] = vals["balance"]
 
             lines.append(vals)
-            if report.display_detail == "no_detail":
+            if node.display_detail == "no_detail":
                 # the rest of the loop is
                 # used to display the details of the
                 #  financial report, so it's not needed here.
@@ -273,11 +351,14 @@ class BalanceSheet(models.TransientModel):
                         + re.sub("[^0-9a-zA-Z]+", "acnt", account.name)
                         + str(account.id),
                         "name": account.code + "-" + account.name,
-                        "balance": value["balance"] * int(report.sign) or 0.0,
+                        "balance": value["balance"] * node.sign or 0.0,
+                        "balance_periods": [
+                            amount * node.sign for amount in value["periods"]
+                        ],
                         "type": "account",
                         "parent": r_name + str(report.id),
                         "level": (
-                            report.display_detail == "detail_with_hierarchy" and 4
+                            node.display_detail == "detail_with_hierarchy" and 4
                         ),
                         "account_type": account.internal_type,
                     }
@@ -291,11 +372,12 @@ class BalanceSheet(models.TransientModel):
                     if not account.company_id.currency_id.is_zero(vals["balance"]):
                         flag = True
                     if data["enable_filter"]:
-                        vals["balance_cmp"] = value["comp_bal"] * int(report.sign)
-                        if not account.company_id.currency_id.is_zero(
-                            vals["balance_cmp"]
-                        ):
-                            flag = True
+                        vals["balance_cmp"] = vals["balance"]
+                    if any(
+                        not account.company_id.currency_id.is_zero(amount)
+                        for amount in vals["balance_periods"]
+                    ):
+                        flag = True
                     if flag:
                         sub_lines.append(vals)
                 lines += sorted(sub_lines, key=lambda sub_line: sub_line["name"])
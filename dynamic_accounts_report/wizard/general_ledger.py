@@ -1,14 +1,23 @@
 # Copyright 2021 Ecosoft Co., Ltd. (http://ecosoft.co.th)
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
+import itertools
+import json
 import time
+from operator import itemgetter
 
 from odoo import _, api, fields, models
 from odoo.exceptions import UserError
 
+from ..models.report_payload import compact_rows
+
+# Most journal items returned by one view_account_lines() call
+MAX_PAGE_LIMIT = 500
+
 
 class GeneralView(models.TransientModel):
     _name = "account.general.ledger"
+    _inherit = ["dynamic.report.query", "dynamic.report.filter"]
 
     company_id = fields.Many2one(
         comodel_name="res.company",
@@ -103,47 +112,11 @@ class GeneralView(models.TransientModel):
         return super().create(vals)
 
     def get_filter_data(self, option):
+        """returns the filters of the wizard ``option[0]``. The options of
+        the filters are searched with search_filter_options()."""
         r = self.env["account.general.ledger"].search([("id", "=", option[0])])
-        default_filters = {}
         company_id = self.env.company
-        company_domain = [("company_id", "=", company_id.id)]
-        journals = (
-            r.journal_ids
-            if r.journal_ids
-            else self.env["account.journal"].search(company_domain)
-        )
-        analytics = (
-            r.analytic_ids
-            if r.analytic_ids
-            else self.env["account.analytic.account"].search(company_domain)
-        )
-        operating_units = (
-            r.operating_unit_ids
-            if r.operating_unit_ids
-            else self.env["operating.unit"].search(company_domain)
-        )
-        account_tags = (
-            r.account_tag_ids
-            if r.account_tag_ids
-            else self.env["account.account.tag"].search([])
-        )
-        analytic_tags = (
-            r.analytic_tag_ids
-            if r.analytic_tag_ids
-            else self.env["account.analytic.tag"]
-            .sudo()
-            .search(
-                ["|", ("company_id", "=", company_id.id), ("company_id", "=", False)]
-            )
-        )
-        if r.account_tag_ids:
-            company_domain.append(("tag_ids", "in", r.account_tag_ids.ids))
-        accounts = (
-            r.account_ids
-            if r.account_ids
-            else self.env["account.account"].search(company_domain)
-        )
-        filter_dict = {
+        return {
             "journal_ids": r.journal_ids.ids,
             "account_ids": r.account_ids.ids,
             "analytic_ids": r.analytic_ids.ids,
@@ -152,38 +125,30 @@ class GeneralView(models.TransientModel):
             "date_from": r.date_from,
             "date_to": r.date_to,
             "target_move": r.target_move,
-            "journals_list": [(j.id, j.name, j.code) for j in journals],
-            "accounts_list": [(a.id, a.name) for a in accounts],
-            "analytic_list": [(anl.id, anl.name) for anl in analytics],
-            "operating_unit_list": [
-                (ou.id, ou.name, ou.code) for ou in operating_units
-            ],
             "company_name": company_id and company_id.name,
             "analytic_tag_ids": r.analytic_tag_ids.ids,
-            "analytic_tag_list": [(anltag.id, anltag.name) for anltag in analytic_tags],
             "account_tag_ids": r.account_tag_ids.ids,
-            "account_tag_list": [(a.id, a.name) for a in account_tags],
         }
-        filter_dict.update(default_filters)
-        return filter_dict
 
     def get_filter(self, option):
         data = self.get_filter_data(option)
         filters = {}
         if data.get("journal_ids"):
-            filters["journals"] = (
-                self.env["account.journal"]
-                .browse(data.get("journal_ids"))
-                .mapped("code")
-            )
+            filters["journals"] = [
+                label["text"]
+                for label in self.get_filter_labels(
+                    "journals", data["journal_ids"], "code"
+                )
+            ]
         else:
             filters["journals"] = ["All"]
         if data.get("account_ids", []):
-            filters["accounts"] = (
-                self.env["account.account"]
-                .browse(data.get("account_ids", []))
-                .mapped("code")
-            )
+            filters["accounts"] = [
+                label["text"]
+                for label in self.get_filter_labels(
+                    "accounts", data["account_ids"], "code"
+                )
+            ]
         else:
             filters["accounts"] = ["All"]
         if data.get("target_move"):
@@ -199,243 +164,229 @@ class GeneralView(models.TransientModel):
         else:
             filters["date_to"] = False
         if data.get("analytic_ids", []):
-            filters["analytics"] = (
-                self.env["account.analytic.account"]
-                .browse(data.get("analytic_ids", []))
-                .mapped("name")
-            )
+            filters["analytics"] = [
+                label["text"]
+                for label in self.get_filter_labels(
+                    "analytics", data["analytic_ids"], "name"
+                )
+            ]
         else:
             filters["analytics"] = ["All"]
 
         if data.get("account_tag_ids"):
-            filters["account_tags"] = (
-                self.env["account.account.tag"]
-                .browse(data.get("account_tag_ids", []))
-                .mapped("name")
-            )
+            filters["account_tags"] = [
+                label["text"]
+                for label in self.get_filter_labels(
+                    "account_tags", data["account_tag_ids"], "name"
+                )
+            ]
         else:
             filters["account_tags"] = ["All"]
 
         if data.get("analytic_tag_ids", []):
-            filters["analytic_tags"] = (
-                self.env["account.analytic.tag"]
-                .browse(data.get("analytic_tag_ids", []))
-                .mapped("name")
-            )
+            filters["analytic_tags"] = [
+                label["text"]
+                for label in self.get_filter_labels(
+                    "analytic_tags", data["analytic_tag_ids"], "name"
+                )
+            ]
         else:
             filters["analytic_tags"] = ["All"]
 
         if data.get("operating_unit_ids"):
-            filters["operating_units"] = (
-                self.env["operating.unit"]
-                .browse(data.get("operating_unit_ids"))
-                .mapped("code")
-            )
+            filters["operating_units"] = [
+                label["text"]
+                for label in self.get_filter_labels(
+                    "operating_units", data["operating_unit_ids"], "code"
+                )
+            ]
         else:
             filters["operating_units"] = ["All"]
 
         filters["company_id"] = ""
-        filters["accounts_list"] = data.get("accounts_list")
-        filters["journals_list"] = data.get("journals_list")
-        filters["analytic_list"] = data.get("analytic_list")
-        filters["account_tag_list"] = data.get("account_tag_list")
-        filters["analytic_tag_list"] = data.get("analytic_tag_list")
         filters["company_name"] = data.get("company_name")
         filters["target_move"] = data.get("target_move").capitalize()
-        filters["operating_unit_list"] = data.get("operating_unit_list")
         return filters
 
     def _get_accounts(self, accounts, init_balance, display_account, data):
-        cr = self.env.cr
-        MoveLine = self.env["account.move.line"]
-        move_lines = {x: [] for x in accounts.ids}
+        account_res = []
+        for res, move_lines in self._iter_accounts(
+            accounts, init_balance, display_account, data
+        ):
+            res["move_lines"] = list(move_lines)
+            account_res.append(res)
+        return account_res
 
-        # Prepare initial sql query and Get the initial move lines
+    def _iter_accounts(
+        self, accounts, init_balance, display_account, data, batch_size=2000
+    ):
+        """Yield the accounts to display with the debit, credit and balance
+        of each, as _get_account_summary() returns them, along with an
+        iterator over their journal items and running balances.
+
+        The journal items are streamed from the database ``batch_size`` at
+        a time, so memory use does not depend on the number of items. The
+        items of an account must be consumed before moving to the next
+        account, see itertools.groupby()."""
+        summary = self._get_account_summary(accounts, display_account, data)
+        account_ids = data.get("accounts") and data["accounts"].ids or accounts.ids
+        account_ids = set(account_ids) & {res["id"] for res in summary}
+        if not account_ids:
+            for res in summary:
+                yield res, iter(())
+            return
+
+        initial_balance = {}
         if init_balance and data.get("date_from"):
-            init_tables, init_where_clause, init_where_params = MoveLine.with_context(
-                date_from=self.env.context.get("date_from"), date_to=False,
-                initial_bal=True)._query_get()
-            init_wheres = [""]
-            if init_where_clause.strip():
-                init_wheres.append(init_where_clause.strip())
-            init_filters = " AND ".join(init_wheres)
-            filters = init_filters.replace("account_move_line__move_id",
-                                           "m").replace("account_move_line",
-                                                        "l")
-            new_filter = filters
-            if data["target_move"] == "posted":
-                new_filter += " AND m.state = 'posted'"
-            else:
-                new_filter += " AND m.state in ('draft', 'posted')"
-
-            if data.get("date_from"):
-                new_filter += " AND l.date < '%s'" % data.get("date_from")
-
-            if data["journals"]:
-                new_filter += " AND j.id IN %s" % str(tuple(data["journals"].ids) + tuple([0]))
-
-            if data.get("accounts"):
-                WHERE = "WHERE l.account_id IN %s" % str(tuple(data.get("accounts").ids) + tuple([0]))
-            else:
-                WHERE = "WHERE l.account_id IN %s"
-
-            if data.get("analytics"):
-                WHERE += " AND anl.id IN %s" % str(tuple(data.get("analytics").ids) + tuple([0]))
-
-            if data.get("analytic_tags"):
-                WHERE += " AND anltag.account_analytic_tag_id IN %s" % str(
-                    tuple(data.get("analytic_tags").ids) + tuple([0]))
-
-            if data["operating_units"]:
-                WHERE += " AND l.operating_unit_id IN %s" % str(
-                    tuple(data.get("operating_units").ids) + tuple([0])
-            )
-
-            sql = ("""SELECT 0 AS lid, l.account_id AS account_id, '' AS ldate, '' AS lcode, 0.0 AS amount_currency, '' AS lref, 'Initial Balance' AS lname, COALESCE(SUM(l.debit),0.0) AS debit, COALESCE(SUM(l.credit),0.0) AS credit, COALESCE(SUM(l.debit),0) - COALESCE(SUM(l.credit), 0) as balance, '' AS lpartner_id,\
-                        '' AS move_name, '' AS mmove_id, '' AS currency_code,\
-                        NULL AS currency_id,\
-                        '' AS invoice_id, '' AS invoice_type, '' AS invoice_number,\
-                        '' AS partner_name\
-                        FROM account_move_line l\
-                        LEFT JOIN account_move m ON (l.move_id=m.id)\
-                        LEFT JOIN res_currency c ON (l.currency_id=c.id)\
-                        LEFT JOIN res_partner p ON (l.partner_id=p.id)\
-                        LEFT JOIN account_move i ON (m.id =i.id)\
-                        LEFT JOIN account_account_tag_account_move_line_rel acc ON (acc.account_move_line_id=l.id)
-                        LEFT JOIN account_analytic_account anl ON (l.analytic_account_id=anl.id)
-                        LEFT JOIN account_analytic_tag_account_move_line_rel anltag ON (anltag.account_move_line_id=l.id)
-                        JOIN account_journal j ON (l.journal_id=j.id)"""
-                        + WHERE + new_filter + " GROUP BY l.account_id")
-            if data.get("accounts"):
-                params = tuple(init_where_params)
-            else:
-                params = (tuple(accounts.ids),) + tuple(init_where_params)
-            cr.execute(sql, params)
-
-            for row in cr.dictfetchall():
-                row["m_id"] = row["account_id"]
-                move_lines[row.pop("account_id")].append(row)
+            initial_balance = self._get_initial_balance(data, list(account_ids))
 
         # Prepare sql query base on selected parameters from wizard
-        tables, where_clause, where_params = MoveLine._query_get()
-        wheres = [""]
-        if where_clause.strip():
-            wheres.append(where_clause.strip())
-        final_filters = " AND ".join(wheres)
-        final_filters = final_filters.replace(
-            "account_move_line__move_id", "m"
-        ).replace("account_move_line", "l")
-        new_final_filter = final_filters
-
-        if data["target_move"] == "posted":
-            new_final_filter += " AND m.state = 'posted'"
-        else:
-            new_final_filter += " AND m.state in ('draft','posted')"
-
+        where, params = self._get_move_line_where(data, list(account_ids))
         if data.get("date_from"):
-            new_final_filter += " AND l.date >= '%s'" % data.get("date_from")
+            where += " AND l.date >= %s"
+            params.append(data["date_from"])
         if data.get("date_to"):
-            new_final_filter += " AND l.date <= '%s'" % data.get("date_to")
-
-        if data["journals"]:
-            new_final_filter += " AND j.id IN %s" % str(
-                tuple(data["journals"].ids) + tuple([0])
-            )
-
-        if data.get("accounts"):
-            WHERE = "WHERE l.account_id IN %s" % str(
-                tuple(data.get("accounts").ids) + tuple([0])
+            where += " AND l.date <= %s"
+            params.append(data["date_to"])
+
+        # Get move lines base on sql query, the running balance of each account
+        # is computed by the database in date order, the accounts are sorted
+        # as displayed by joining their position in the summary
+        select = """SELECT l.id AS lid, l.move_id AS move_id,
+                l.account_id AS account_id, l.date AS ldate, j.code AS lcode,
+                l.currency_id, l.amount_currency, l.ref AS lref,
+                l.name AS lname, COALESCE(l.debit,0) AS debit,
+                COALESCE(l.credit,0) AS credit,
+                SUM(ROUND(COALESCE(l.debit,0), 2) - ROUND(COALESCE(l.credit,0), 2))
+                    OVER (PARTITION BY l.account_id ORDER BY l.date, l.id)
+                    AS balance,
+                m.name AS move_name, c.symbol AS currency_code,
+                c.position AS currency_position, p.name AS partner_name"""
+        sql = (
+            select
+            + " FROM "
+            + self._get_move_line_from(select, where)
+            + " JOIN unnest(%s::integer[]) WITH ORDINALITY AS o(account_id, seq)"
+            + " ON (o.account_id = l.account_id)"
+            + " WHERE "
+            + where
+            + " ORDER BY o.seq, l.date, l.id"
+        )
+        params = [[res["id"] for res in summary]] + params
+        rows = self._stream_report_query(sql, params, batch_size=batch_size)
+        groups = itertools.groupby(rows, key=itemgetter("account_id"))
+        group = next(groups, None)
+        for res in summary:
+            lines = iter(())
+            if group and group[0] == res["id"]:
+                lines = group[1]
+            yield res, self._iter_move_lines(
+                res["id"], initial_balance.get(res["id"]), lines
             )
-        else:
-            WHERE = "WHERE l.account_id IN %s"
-
-        if data["analytics"]:
-            WHERE += " AND anl.id IN %s" % str(
-                tuple(data.get("analytics").ids) + tuple([0])
+            if group and group[0] == res["id"]:
+                group = next(groups, None)
+
+    def _iter_move_lines(self, account_id, initial_balance, rows):
+        """Yield the initial balance row of ``account_id`` if any, then the
+        journal item ``rows`` with their balance shifted by it"""
+        opening = 0.0
+        if initial_balance:
+            opening = round(initial_balance["debit"], 2) - round(
+                initial_balance["credit"], 2
             )
-
-        if data["analytic_tags"]:
-            WHERE += " AND anltag.account_analytic_tag_id IN %s" % str(
-                tuple(data.get("analytic_tags").ids) + tuple([0])
+            yield dict(
+                initial_balance,
+                lid=0,
+                m_id=account_id,
+                ldate="",
+                lcode="",
+                amount_currency=0.0,
+                lref="",
+                lname="Initial Balance",
+                lpartner_id="",
+                move_name="",
+                mmove_id="",
+                currency_code="",
+                currency_id=None,
+                invoice_id="",
+                invoice_type="",
+                invoice_number="",
+                partner_name="",
             )
-
-        if data["operating_units"]:
-            WHERE += " AND l.operating_unit_id IN %s" % str(
-                tuple(data.get("operating_units").ids) + tuple([0])
+        for row in rows:
+            row["balance"] = round(row["balance"] + opening, 2)
+            row["m_id"] = row.pop("account_id")
+            yield row
+
+    def _get_account_totals(self, data, display_account="all"):
+        """returns the debit, credit, balance and number of journal items of
+        each account of the report up to the end date, initial balance
+        included, as a dict keyed by account id. The query selects the
+        accounts itself, only those listed in the ``display_account`` mode."""
+        DailyBalance = self.env["dynamic.report.daily.balance"]
+        if DailyBalance._is_enabled() and not data["analytic_tags"]:
+            if not data["accounts"]:
+                return {}
+            totals = DailyBalance._get_account_totals(
+                data["accounts"].ids,
+                date_to=data.get("date_to"),
+                target_move=data["target_move"],
+                journal_ids=data["journals"].ids,
+                operating_unit_ids=data["operating_units"].ids,
+                analytic_ids=data["analytics"].ids,
             )
-
-        # Get move lines base on sql query and Calculate the total balance of move lines
-        sql = (
-            """SELECT l.id AS lid,m.id AS move_id, l.account_id AS account_id,
-                    l.date AS ldate, j.code AS lcode, l.currency_id,
-                    l.amount_currency, l.ref AS lref,
-                    l.name AS lname, COALESCE(l.debit,0) AS debit,
-                    COALESCE(l.credit,0) AS credit,
-                    COALESCE(SUM(l.balance),0) AS balance,\
-                    m.name AS move_name, c.symbol AS currency_code,
-                    c.position AS currency_position, p.name AS partner_name\
-                    FROM account_move_line l\
-                    JOIN account_move m ON (l.move_id = m.id)\
-                    LEFT JOIN res_currency c ON (l.currency_id = c.id)\
-                    LEFT JOIN res_partner p ON (l.partner_id = p.id)\
-                    LEFT JOIN account_analytic_account anl
-                        ON (l.analytic_account_id = anl.id)\
-                    LEFT JOIN account_analytic_tag_account_move_line_rel anltag
-                        ON (anltag.account_move_line_id = l.id)\
-                    JOIN account_journal j ON (l.journal_id = j.id)\
-                    JOIN account_account acc ON (l.account_id = acc.id) """
-            + WHERE
-            + new_final_filter
-            + """ GROUP BY l.id, m.id, l.account_id,
-                l.date, j.code, l.currency_id, l.amount_currency, l.ref,
-                l.name, m.name, c.symbol, c.position, p.name"""
+            return self._filter_display_totals(totals, display_account)
+        where, params = self._get_move_line_where(data)
+        if data.get("date_to"):
+            where += " AND l.date <= %s"
+            params.append(data["date_to"])
+        having, having_params = self._get_zero_balance_having(display_account)
+        self._execute_report_query(
+            """SELECT l.account_id AS id,
+                    COALESCE(SUM(l.debit), 0) AS debit,
+                    COALESCE(SUM(l.credit), 0) AS credit,
+                    COALESCE(SUM(l.balance), 0) AS balance,
+                    COUNT(*) AS count
+                FROM """
+            + self._get_move_line_from(where)
+            + " WHERE "
+            + where
+            + " GROUP BY l.account_id"
+            + having,
+            params + having_params,
         )
-        if data.get("accounts"):
-            params = tuple(where_params)
-        else:
-            params = (tuple(accounts.ids),) + tuple(where_params)
-        cr.execute(sql, params)
-
-        for row in cr.dictfetchall():
-            balance = 0
-            for line in move_lines.get(row["account_id"]):
-                balance += round(line["debit"], 2) - round(line["credit"], 2)
-            row["balance"] += round(balance, 2)
-            row["m_id"] = row["account_id"]
-            move_lines[row.pop("account_id")].append(row)
-        # Calculate the debit, credit and balance for Accounts
+        return {row["id"]: row for row in self.env.cr.dictfetchall()}
+
+    def _get_account_summary(self, accounts, display_account, data):
+        """Same as _get_accounts() without the journal items"""
+        totals = self._get_account_totals(data, display_account)
         account_res = []
-        for account in accounts:
-            currency = (
-                account.currency_id
-                and account.currency_id
-                or account.company_id.currency_id
-            )
-            res = {fn: 0.0 for fn in ["credit", "debit", "balance"]}
+        for account in self._get_display_accounts(accounts, display_account, totals):
+            total = totals.get(account.id, {})
+            res = {
+                fn: round(total.get(fn, 0.0), 2)
+                for fn in ["credit", "debit", "balance"]
+            }
             res["code"] = account.code
             res["name"] = account.name
             res["id"] = account.id
-            res["move_lines"] = move_lines[account.id]
-            for line in res.get("move_lines"):
-                res["debit"] += round(line["debit"], 2)
-                res["credit"] += round(line["credit"], 2)
-                res["balance"] = round(line["balance"], 2)
-            if display_account == "all":
-                account_res.append(res)
-            if display_account == "movement" and res.get("move_lines"):
-                account_res.append(res)
-            if display_account == "not_zero" and not currency.is_zero(res["balance"]):
-                account_res.append(res)
+            res["move_lines"] = []
+            account_res.append(res)
         return account_res
 
-    def _get_report_values(self, data):
+    def _get_report_values(self, data, with_lines=True):
         docs = data["model"]
         display_account = data["display_account"]
         init_balance = True
-        accounts = self.env["account.account"].search([])
-        if not accounts:
+        if not self.env["account.account"].search_count([]):
             raise UserError(_("No Accounts Found! Please Add One"))
-        account_res = self._get_accounts(accounts, init_balance, display_account, data)
+        accounts = data["accounts"]
+        if with_lines:
+            account_res = self._get_accounts(
+                accounts, init_balance, display_account, data
+            )
+        else:
+            account_res = self._get_account_summary(accounts, display_account, data)
         debit_total = 0
         debit_total = sum(x["debit"] for x in account_res)
         credit_total = sum(x["credit"] for x in account_res)
@@ -468,15 +419,14 @@ class GeneralView(models.TransientModel):
         ]
         return currency_array
 
-    @api.model
-    def view_report(self, option, title):
-        r = self.env["account.general.ledger"].search([("id", "=", option[0])])
+    def _get_report_data(self, r):
+        """Return the filter values of wizard ``r`` used by the report queries"""
         data = {
             "display_account": r.display_account,
             "model": self,
             "journals": r.journal_ids,
             "target_move": r.target_move,
-            "accounts": r.account_ids,
+            "account_ids": r.account_ids,
             "account_tags": r.account_tag_ids,
             "analytics": r.analytic_ids,
             "analytic_tags": r.analytic_tag_ids,
@@ -502,22 +452,42 @@ class GeneralView(models.TransientModel):
         if r.account_ids:
             company_domain.append(("id", "in", r.account_ids.ids))
 
-        new_account_ids = self.env["account.account"].search(company_domain)
-        data.update({"accounts": new_account_ids})
-        filters = self.get_filter(option)
-        records = self._get_report_values(data)
-
-        if filters["account_tags"] != ["All"]:
-            tag_accounts = list(map(lambda x: x.code, new_account_ids))
+        data.update({"accounts": self.env["account.account"].search(company_domain)})
+        return data
 
-            def filter_code(rec_dict):
-                if rec_dict["code"] in tag_accounts:
-                    return True
-                else:
-                    return False
+    @api.model
+    def view_report(self, option, title, compact=False):
+        """returns the General Ledger of wizard ``option[0]``. With
+        ``compact``, the accounts are sent as columns and rows."""
+        with self._report_timings("view_report") as timings:
+            r = self.env["account.general.ledger"].search([("id", "=", option[0])])
+            ReportCache = self.env["dynamic.report.cache"]
+            values = dict(ReportCache._get_wizard_values(r), title=title)
+            with self._report_stage("cache"):
+                res = ReportCache._get_result(
+                    self._name, values, lambda: self._view_report(option, title)
+                )
+            # the filters list the current journals, accounts, ... to choose
+            # from
+            with self._report_stage("filters"):
+                res["filters"] = self.get_filter(option)
+            if compact:
+                with self._report_stage("payload"):
+                    res["report_lines"] = compact_rows(
+                        res["report_lines"], exclude=("move_lines",)
+                    )
+        if self._debug_timings():
+            res["debug_timings"] = timings
+        return res
 
-            new_records = list(filter(filter_code, records["Accounts"]))
-            records["Accounts"] = new_records
+    @api.model
+    def _view_report(self, option, title):
+        r = self.env["account.general.ledger"].search([("id", "=", option[0])])
+        data = self._get_report_data(r)
+        filters = self.get_filter(option)
+        # journal items are loaded per account by view_account_lines()
+        with self._report_stage("accounts"):
+            records = self._get_report_values(data, with_lines=False)
         currency = self._get_currency()
         return {
             "name": title,
@@ -530,3 +500,314 @@ class GeneralView(models.TransientModel):
             "debit_balance": records["debit_balance"],
             "currency": currency,
         }
+
+    def _get_export_accounts(self, data):
+        """returns the accounts listed by view_report() for ``data``"""
+        return data["accounts"]
+
+    def _iter_export_lines(self, option):
+        """Yield the accounts of the General Ledger of wizard ``option[0]``
+        with an iterator over their journal items, streamed from the
+        database"""
+        r = self.env["account.general.ledger"].search([("id", "=", option[0])])
+        data = self._get_report_data(r)
+        accounts = self._get_export_accounts(data)
+        return self._iter_accounts(accounts, True, data["display_account"], data)
+
+    def get_dynamic_xlsx_report(self, options, response, report_data, dfr_data):
+        """Export the General Ledger of the wizard whose id is in ``options``
+        to XLSX. The journal items are read from the database, whatever the
+        client shows, and written to the file as they are fetched."""
+        option = json.loads(options)
+        filters = self.get_filter(option)
+        with self.env["dynamic.report.xlsx"]._open_workbook(response) as workbook:
+            self._write_xlsx_report(
+                workbook, filters, str(report_data), self._iter_export_lines(option)
+            )
+
+    def _write_xlsx_report(self, workbook, filters, title, accounts):
+        """Write the ``accounts`` and their journal items to ``workbook``,
+        row by row"""
+        sheet = workbook.add_worksheet()
+        head = workbook.add_format(
+            {"align": "center", "bold": True, "font_size": "20px"}
+        )
+        date_head = workbook.add_format(
+            {"align": "center", "bold": True, "font_size": "10px"}
+        )
+        date_head.set_align("vcenter")
+        date_head.set_text_wrap()
+        sub_heading = workbook.add_format(
+            {
+                "align": "center",
+                "bold": True,
+                "font_size": "10px",
+                "border": 1,
+                "border_color": "black",
+            }
+        )
+        account_head = workbook.add_format(
+            {"bold": True, "font_size": "10px", "border": 1}
+        )
+        account_amount = workbook.add_format(
+            {"bold": True, "font_size": "10px", "border": 1, "num_format": "#,##0.00"}
+        )
+        txt = workbook.add_format({"font_size": "10px", "border": 1})
+        date_txt = workbook.add_format(
+            {"font_size": "10px", "border": 1, "num_format": "yyyy-mm-dd"}
+        )
+        amount = workbook.add_format(
+            {"font_size": "10px", "border": 1, "num_format": "#,##0.00"}
+        )
+
+        sheet.set_column(0, 0, 12)
+        sheet.set_column(1, 1, 8)
+        sheet.set_column(2, 4, 25)
+        sheet.set_column(5, 7, 15)
+
+        sheet.merge_range(
+            "A2:H3", (filters.get("company_name") or "") + " : " + title, head
+        )
+        sheet.merge_range(
+            "A4:H4",
+            "From: "
+            + str(filters.get("date_from") or "")
+            + "  To: "
+            + str(filters.get("date_to") or ""),
+            date_head,
+        )
+        sheet.merge_range(
+            "A5:H6",
+            "  Accounts: "
+            + ", ".join([lt or "" for lt in filters["accounts"]])
+            + ";  Journals: "
+            + ", ".join([lt or "" for lt in filters["journals"]])
+            + ";  Account Tags: "
+            + ", ".join([lt or "" for lt in filters["account_tags"]])
+            + ";  Analytic Tags: "
+            + ", ".join([lt or "" for lt in filters["analytic_tags"]])
+            + ";  Analytic: "
+            + ", ".join([at or "" for at in filters["analytics"]])
+            + "; Operating Units: "
+            + ", ".join([ou or "" for ou in filters["operating_units"]])
+            + ";  Target Moves: "
+            + filters.get("target_move").capitalize(),
+            date_head,
+        )
+
+        row = 7
+        for col, heading in enumerate(
+            ["Date", "JRNL", "Partner", "Move", "Entry Label"]
+            + ["Debit", "Credit", "Balance"]
+        ):
+            sheet.write(row, col, heading, sub_heading)
+
+        for account, move_lines in accounts:
+            row += 1
+            sheet.merge_range(
+                row,
+                0,
+                row,
+                4,
+                "{} - {}".format(account["code"], account["name"]),
+                account_head,
+            )
+            sheet.write_number(row, 5, account["debit"], account_amount)
+            sheet.write_number(row, 6, account["credit"], account_amount)
+            sheet.write_number(row, 7, account["balance"], account_amount)
+            for line in move_lines:
+                row += 1
+                if line["ldate"]:
+                    sheet.write_datetime(row, 0, line["ldate"], date_txt)
+                else:
+                    sheet.write_blank(row, 0, None, txt)
+                sheet.write_string(row, 1, line["lcode"] or "", txt)
+                sheet.write_string(row, 2, line["partner_name"] or "", txt)
+                sheet.write_string(row, 3, line["move_name"] or "", txt)
+                sheet.write_string(row, 4, line["lname"] or "", txt)
+                sheet.write_number(row, 5, line["debit"], amount)
+                sheet.write_number(row, 6, line["credit"], amount)
+                sheet.write_number(row, 7, line["balance"], amount)
+
+    def get_dynamic_csv_report(self, options, response, report_data, dfr_data):
+        """Export the journal items of the General Ledger of the wizard whose
+        id is in ``options`` to CSV, one row per item"""
+        option = json.loads(options)
+        with self.env["dynamic.report.xlsx"]._open_csv_writer(response) as writer:
+            writer.writerow(
+                ["Account Code", "Account", "Date", "JRNL", "Partner", "Move"]
+                + ["Entry Label", "Debit", "Credit", "Balance"]
+            )
+            for account, move_lines in self._iter_export_lines(option):
+                for line in move_lines:
+                    writer.writerow(
+                        [
+                            account["code"],
+                            account["name"],
+                            line["ldate"],
+                            line["lcode"],
+                            line["partner_name"],
+                            line["move_name"],
+                            line["lname"],
+                            line["debit"],
+                            line["credit"],
+                            line["balance"],
+                        ]
+                    )
+
+    def _can_use_checkpoints(self, data):
+        """Opening balance checkpoints only hold the posted journal items of
+        all journals, analytic accounts and operating units"""
+        return data["target_move"] == "posted" and not (
+            data["journals"]
+            or data["analytics"]
+            or data["analytic_tags"]
+            or data["operating_units"]
+        )
+
+    def _get_initial_balance(self, data, account_ids):
+        """Return the debit, credit and balance before ``date_from`` for each
+        of ``account_ids``, as a dict keyed by account id.
+
+        When the filters allow it, the balances start from the opening
+        balance checkpoint of each company, of the journal items the record
+        rules of the user allow, so only the journal items between the
+        checkpoint and ``date_from`` are summed."""
+        res = {}
+        if not data.get("date_from") or not account_ids:
+            return res
+        where, params = self._get_move_line_where(data, account_ids)
+        lines_sql = (
+            "SELECT l.account_id, l.debit, l.credit, l.balance FROM "
+            + self._get_move_line_from(where)
+            + " WHERE "
+            + where
+            + " AND l.date < %s"
+        )
+        params.append(data["date_from"])
+
+        checkpoints = self.env["dynamic.report.checkpoint"]
+        if self._can_use_checkpoints(data):
+            for company in self.env.companies:
+                checkpoints |= checkpoints._get_checkpoint(company, data["date_from"])
+        queries = []
+        query_params = []
+        for checkpoint in checkpoints:
+            queries.append(lines_sql + " AND l.company_id = %s AND l.date >= %s")
+            query_params += params + [checkpoint.company_id.id, checkpoint.date]
+        if checkpoints:
+            queries.append(
+                """SELECT account_id, debit, credit, balance
+                    FROM dynamic_report_checkpoint_line
+                    WHERE checkpoint_id = ANY(%s) AND account_id = ANY(%s)"""
+            )
+            query_params += [checkpoints.ids, list(account_ids)]
+        other_companies = self.env.companies - checkpoints.mapped("company_id")
+        if other_companies:
+            queries.append(lines_sql + " AND l.company_id = ANY(%s)")
+            query_params += params + [other_companies.ids]
+
+        sql = (
+            """SELECT account_id,
+                    COALESCE(SUM(debit), 0) AS debit,
+                    COALESCE(SUM(credit), 0) AS credit,
+                    COALESCE(SUM(balance), 0) AS balance
+                FROM ("""
+            + " UNION ALL ".join(queries)
+            + ") AS init GROUP BY account_id"
+        )
+        self._execute_report_query(sql, query_params)
+        for row in self.env.cr.dictfetchall():
+            res[row.pop("account_id")] = row
+        return res
+
+    @api.model
+    def view_account_lines(
+        self, option, account_id, after=None, limit=80, compact=False
+    ):
+        """Return one page of the move lines of ``account_id`` for the filters
+        of wizard ``option[0]``, ordered by date and id.
+
+        ``after`` is the ``next`` value returned with the previous page: the
+        date and id of its last move line and the running balance there,
+        which the page continues from. Only the first page computes and
+        carries the initial balance of the account. ``limit`` is capped at
+        MAX_PAGE_LIMIT. With ``compact``, the move lines are sent as columns
+        and rows."""
+        limit = min(max(int(limit), 1), MAX_PAGE_LIMIT)
+        r = self.env["account.general.ledger"].search([("id", "=", option[0])])
+        data = self._get_report_data(r)
+        res = {
+            "account_id": account_id,
+            "initial_balance": False,
+            "move_lines": [],
+            "next": False,
+            "currency": self._get_currency(),
+        }
+        if account_id not in data["accounts"].ids:
+            return res
+
+        balance = 0.0
+        if after:
+            balance = float(after["balance"])
+        else:
+            init = self._get_initial_balance(data, [account_id]).get(account_id)
+            if init:
+                # same opening balance as _iter_move_lines(), used by the exports
+                balance = round(init["debit"], 2) - round(init["credit"], 2)
+                res["initial_balance"] = {
+                    "lid": 0,
+                    "move_id": "",
+                    "ldate": "",
+                    "lcode": "",
+                    "lname": "Initial Balance",
+                    "move_name": "",
+                    "partner_name": "",
+                    "currency_code": "",
+                    "debit": round(init["debit"], 2),
+                    "credit": round(init["credit"], 2),
+                    "balance": round(balance, 2),
+                }
+
+        where, params = self._get_move_line_where(data, [account_id])
+        if data.get("date_from"):
+            where += " AND l.date >= %s"
+            params.append(data["date_from"])
+        if data.get("date_to"):
+            where += " AND l.date <= %s"
+            params.append(data["date_to"])
+        if after:
+            where += " AND (l.date, l.id) > (%s, %s)"
+            params += [after["date"], after["id"]]
+        select = """SELECT l.id AS lid, l.move_id AS move_id, l.date AS ldate,
+                j.code AS lcode, l.currency_id, l.amount_currency,
+                l.ref AS lref, l.name AS lname,
+                COALESCE(l.debit, 0) AS debit,
+                COALESCE(l.credit, 0) AS credit,
+                m.name AS move_name, c.symbol AS currency_code,
+                c.position AS currency_position, p.name AS partner_name"""
+        sql = (
+            select
+            + " FROM "
+            + self._get_move_line_from(select, where)
+            + " WHERE "
+            + where
+            + " ORDER BY l.date, l.id LIMIT %s"
+        )
+        # Fetch one extra row to know whether another page follows
+        self._execute_report_query(sql, params + [limit + 1])
+        rows = self.env.cr.dictfetchall()
+        for row in rows[:limit]:
+            balance += round(row["debit"], 2) - round(row["credit"], 2)
+            row["balance"] = round(balance, 2)
+            res["move_lines"].append(row)
+        if len(rows) > limit:
+            last = res["move_lines"][-1]
+            res["next"] = {
+                "date": last["ldate"],
+                "id": last["lid"],
+                "balance": balance,
+            }
+        if compact:
+            res["move_lines"] = compact_rows(res["move_lines"])
+        return res